@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+import pytest
+
+MICRO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES_DIR = os.path.join(MICRO_DIR, 'baselines')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.micro',
+        description='Runs the CPU-bound micro-benchmarks, saves them as the baseline or compares them against it.'
+    )
+    parser.add_argument('command', choices=('run', 'save', 'compare'))
+    parser.add_argument('--baseline', default='baseline', help='name the baseline is saved or compared under')
+    parser.add_argument(
+        '--threshold', default='10%', help='mean slowdown flagged as a regression, percents or seconds'
+    )
+    parser.add_argument('pytest_args', nargs='*', help='extra pytest arguments, e.g. -k hubs')
+    args = parser.parse_args()
+
+    pytest_args = [
+        MICRO_DIR, '-c', os.path.join(MICRO_DIR, 'pytest.ini'), '-p', 'no:cacheprovider',
+        f'--benchmark-storage=file://{BASELINES_DIR}', *args.pytest_args
+    ]
+    match args.command:
+        case 'save':
+            pytest_args.append(f'--benchmark-save={args.baseline}')
+        case 'compare':
+            baseline_path = _baseline_path(args.baseline)
+            with tempfile.TemporaryDirectory() as run_dir:
+                run_path = os.path.join(run_dir, 'run.json')
+                pytest_args += [
+                    f'--benchmark-compare={os.path.basename(baseline_path).split("_", maxsplit=1)[0]}',
+                    f'--benchmark-json={run_path}'
+                ]
+                exit_code = pytest.main(pytest_args)
+                if exit_code:
+                    sys.exit(exit_code)
+                sys.exit(_check_regressions(baseline_path, run_path, args.threshold))
+    sys.exit(pytest.main(pytest_args))
+
+
+def _baseline_path(baseline: str) -> str:
+    # runs are saved as <number>_<name>.json under a machine specific directory, the latest one is compared
+    runs = sorted(
+        (file_name, os.path.join(dir_path, file_name))
+        for dir_path, _, file_names in os.walk(BASELINES_DIR)
+        for file_name in file_names
+        if file_name.endswith(f'_{baseline}.json')
+    )
+    if not runs:
+        sys.exit(f'No {baseline} baseline was saved, run: python -m benchmarks.micro save')
+    return runs[-1][1]
+
+
+def _check_regressions(baseline_path: str, run_path: str, threshold: str) -> int:
+    with open(baseline_path) as baseline_file:
+        fullname_to_mean = {
+            benchmark['fullname']: benchmark['stats']['mean'] for benchmark in json.load(baseline_file)['benchmarks']
+        }
+    with open(run_path) as run_file:
+        benchmarks = json.load(run_file)['benchmarks']
+
+    failures = []
+    for benchmark in benchmarks:
+        mean = benchmark['stats']['mean']
+        baseline_mean = fullname_to_mean.get(benchmark['fullname'])
+        if baseline_mean is None:
+            # a renamed or new benchmark would otherwise never be compared
+            failures.append(f'{benchmark["fullname"]}: no baseline, run: python -m benchmarks.micro save')
+            continue
+
+        if threshold.endswith('%'):
+            max_mean = baseline_mean * (1 + float(threshold[:-1]) / 100)
+        else:
+            max_mean = baseline_mean + float(threshold)
+        if mean > max_mean:
+            failures.append(
+                f'{benchmark["fullname"]}: mean {mean * 1e6:.1f}us, baseline {baseline_mean * 1e6:.1f}us'
+            )
+
+    for failure in failures:
+        print(f'FAILED {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+from migration_service.utils.migration_utils import add_to_batches, alter_to_batches
+
+
+def bench_add_to_batches(benchmark, apply_schema):
+    hubs = apply_schema.hubs_to_create + apply_schema.sats_to_create
+    benchmark(lambda: list(add_to_batches(hubs)))
+
+
+@pytest.mark.parametrize('fields_key', ('fields_to_create', 'fields_to_delete', 'fields_to_alter'))
+def bench_alter_to_batches(benchmark, alter_apply_schema, fields_key):
+    nodes = alter_apply_schema.hubs_to_alter + alter_apply_schema.sats_to_alter
+    benchmark(lambda: list(alter_to_batches(nodes, fields_key)))
@@ -0,0 +1,21 @@
+import re
+
+from migration_service.crud.migration import _diff_tables
+from migration_service.models import migrations
+from migration_service.schemas.catalog import Catalog, StringPool
+
+
+def bench_table_fk_count(benchmark, big_table, migration_pattern):
+    fk_pattern = re.compile(migration_pattern.fk_pattern)
+    benchmark(big_table.fk_count, fk_pattern)
+
+
+def bench_catalog_from_records(benchmark, db_records):
+    benchmark(lambda: Catalog.from_records(db_records).slice(0))
+
+
+def bench_diff_tables(benchmark, db_records, graph_db_records):
+    pool = StringPool()
+    db_catalog = Catalog.from_records(db_records, pool)
+    graph_db_catalog = Catalog.from_records(graph_db_records, pool)
+    benchmark(lambda: _diff_tables(db_catalog, graph_db_catalog, migrations.Schema(name='dv_raw')))
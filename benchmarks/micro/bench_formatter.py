@@ -0,0 +1,15 @@
+from migration_service.services.migration_formatter import ApplyMigrationFormatter
+
+
+def bench_apply_migration_formatter_format(benchmark, create_migration, migration_pattern):
+    apply_migration_formatter = ApplyMigrationFormatter(
+        create_migration, migration_pattern.fk_pattern, migration_pattern.pk_pattern
+    )
+    benchmark(apply_migration_formatter.format)
+
+
+def bench_apply_migration_formatter_set_keys(benchmark, create_migration, migration_pattern):
+    apply_migration_formatter = ApplyMigrationFormatter(
+        create_migration, migration_pattern.fk_pattern, migration_pattern.pk_pattern
+    )
+    benchmark(apply_migration_formatter.set_keys)
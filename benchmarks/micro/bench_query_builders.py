@@ -0,0 +1,70 @@
+import pytest
+
+from migration_service.age_queries.hub_queries import construct_create_hubs_query
+from migration_service.age_queries.link_queries import construct_create_links_query
+from migration_service.age_queries.node_queries import (
+    construct_delete_nodes_query, construct_create_fields_query, construct_delete_fields_query,
+    construct_alter_fields_query
+)
+from migration_service.age_queries.sat_queries import construct_create_sats_query
+from migration_service.schemas.tables import OneWayLink, SatToCreate, LinkToCreate
+from migration_service.utils.migration_utils import add_to_batches, alter_to_batches, delete_to_batches
+
+
+# links are resolved from the synthetic naming, matching them by similarity would dominate the setup
+@pytest.fixture(scope='session')
+def linked_records(apply_schema, migration_pattern) -> tuple[list[SatToCreate], list[LinkToCreate]]:
+    tables_to_pks = apply_schema.tables_to_pks
+
+    sats_with_hub = []
+    for sat in apply_schema.sats_to_create:
+        sat.link.ref_table = sat.link.fk.removesuffix('_hash_fkey')
+        sat.link.ref_table_pk = tables_to_pks[sat.link.ref_table]
+        sats_with_hub.append(sat)
+
+    links_with_hubs = []
+    for link in apply_schema.links_to_create:
+        main_fk, paired_fk = [field.name for field in link.fields if field.name.endswith('_hash_fkey')]
+        link.main_link = OneWayLink(fk=main_fk, ref_table=main_fk.removesuffix('_hash_fkey'))
+        link.paired_link = OneWayLink(fk=paired_fk, ref_table=paired_fk.removesuffix('_hash_fkey'))
+        link.main_link.ref_table_pk = tables_to_pks[link.main_link.ref_table]
+        link.paired_link.ref_table_pk = tables_to_pks[link.paired_link.ref_table]
+        links_with_hubs.append(link)
+    return sats_with_hub, links_with_hubs
+
+
+def bench_construct_create_hubs_query(benchmark, apply_schema):
+    batches = list(add_to_batches(apply_schema.hubs_to_create))
+    benchmark(lambda: [construct_create_hubs_query(batch) for batch in batches])
+
+
+def bench_construct_create_sats_query(benchmark, linked_records):
+    sats_with_hub, _ = linked_records
+    batches = list(add_to_batches(sats_with_hub))
+    benchmark(lambda: [construct_create_sats_query(batch, True) for batch in batches])
+
+
+def bench_construct_create_links_query(benchmark, linked_records):
+    _, links_with_hubs = linked_records
+    batches = list(add_to_batches(links_with_hubs))
+    benchmark(lambda: [construct_create_links_query(batch, True) for batch in batches])
+
+
+def bench_construct_delete_nodes_query(benchmark, schema):
+    batches = list(delete_to_batches(schema.table_to_columns))
+    benchmark(lambda: [construct_delete_nodes_query(batch) for batch in batches])
+
+
+@pytest.mark.parametrize(
+    'fields_key, construct',
+    (
+        ('fields_to_create', construct_create_fields_query),
+        ('fields_to_delete', construct_delete_fields_query),
+        ('fields_to_alter', construct_alter_fields_query)
+    ),
+    ids=('construct_create_fields_query', 'construct_delete_fields_query', 'construct_alter_fields_query')
+)
+def bench_construct_alter_nodes_query(benchmark, alter_apply_schema, fields_key, construct):
+    nodes = alter_apply_schema.hubs_to_alter + alter_apply_schema.sats_to_alter
+    batches = list(alter_to_batches(nodes, fields_key))
+    benchmark(lambda: [construct(batch) for batch in batches])
@@ -0,0 +1,6 @@
+from migration_service.utils.migration_utils import get_highest_table_similarity_score
+
+
+def bench_get_highest_table_similarity_score(benchmark, schema):
+    tables = list(schema.table_to_columns)
+    benchmark(get_highest_table_similarity_score, 'hub_00001', tables, 'hub_00001_sat_0')
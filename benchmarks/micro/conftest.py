@@ -0,0 +1,118 @@
+import pytest
+
+from migration_service.models import migrations
+from migration_service.schemas.migrations import ApplySchema, MigrationPattern
+from migration_service.schemas import tables
+from migration_service.services.metadata_extractor import PostgresExtractor
+from migration_service.services.migration_formatter import ApplyMigrationFormatter
+
+from benchmarks.synthetic_schema import SyntheticSchema, generate_schema, churn_schema
+
+FIELDS = (10, 1_000, 100_000)
+COLUMNS = 10
+
+
+@pytest.fixture(scope='session', params=FIELDS, ids=lambda fields: f'{fields}_fields')
+def fields(request) -> int:
+    return request.param
+
+
+@pytest.fixture(scope='session')
+def schema(fields) -> SyntheticSchema:
+    table_count = max(fields // COLUMNS, 1)
+    return generate_schema(
+        'benchmark', max(table_count * 2 // 5, 2), max(table_count * 2 // 5, 1), max(table_count // 5, 1), COLUMNS
+    )
+
+
+@pytest.fixture(scope='session')
+def churned_schema(schema) -> SyntheticSchema:
+    return churn_schema(schema, 0.05)
+
+
+@pytest.fixture(scope='session')
+def migration_pattern() -> MigrationPattern:
+    return MigrationPattern()
+
+
+@pytest.fixture(scope='session')
+def create_migration(schema) -> migrations.Migration:
+    migration = migrations.Migration(name='benchmark', guid='benchmark', db_source=schema.db_source)
+    migration_schema = migrations.Schema(name=schema.name)
+    for table_name, columns in schema.table_to_columns.items():
+        table = migrations.Table(new_name=table_name, db=f'{schema.name}.{table_name}')
+        table.fields = [
+            migrations.Field(new_name=column_name, new_type=column_type) for column_name, column_type in columns.items()
+        ]
+        migration_schema.tables.append(table)
+    migration.schemas.append(migration_schema)
+    return migration
+
+
+@pytest.fixture(scope='session')
+def alter_migration(schema) -> migrations.Migration:
+    migration = migrations.Migration(name='benchmark', guid='benchmark', db_source=schema.db_source)
+    migration_schema = migrations.Schema(name=schema.name)
+    for table_name, columns in schema.table_to_columns.items():
+        table = migrations.Table(old_name=table_name, new_name=table_name, db=f'{schema.name}.{table_name}')
+        # every field changes, spread evenly over creates, deletes and alters
+        for ndx, (column_name, column_type) in enumerate(columns.items()):
+            match ndx % 3:
+                case 0:
+                    field = migrations.Field(new_name=column_name, new_type=column_type)
+                case 1:
+                    field = migrations.Field(old_name=column_name, old_type=column_type)
+                case _:
+                    field = migrations.Field(
+                        old_name=column_name, new_name=column_name, old_type='str', new_type=column_type
+                    )
+            table.fields.append(field)
+        migration_schema.tables.append(table)
+    migration.schemas.append(migration_schema)
+    return migration
+
+
+@pytest.fixture(scope='session')
+def apply_schema(create_migration, migration_pattern) -> ApplySchema:
+    return _format(create_migration, migration_pattern)
+
+
+@pytest.fixture(scope='session')
+def alter_apply_schema(alter_migration, migration_pattern) -> ApplySchema:
+    return _format(alter_migration, migration_pattern)
+
+
+@pytest.fixture(scope='session')
+def db_records(schema) -> list[tuple[str, str, str, str]]:
+    return _system_records(schema)
+
+
+@pytest.fixture(scope='session')
+def graph_db_records(churned_schema) -> list[tuple[str, str, str, str]]:
+    return _system_records(churned_schema)
+
+
+@pytest.fixture(scope='session')
+def big_table(fields) -> migrations.Table:
+    table = migrations.Table(new_name='benchmark', db='dv_raw.benchmark')
+    table.fields = [
+        migrations.Field(new_name=f'attr_{ndx}_hash_fkey' if ndx % 100 == 0 else f'attr_{ndx}', new_type='str')
+        for ndx in range(fields)
+    ]
+    return table
+
+
+def _format(migration: migrations.Migration, migration_pattern: MigrationPattern) -> ApplySchema:
+    apply_migration_formatter = ApplyMigrationFormatter(
+        migration, migration_pattern.fk_pattern, migration_pattern.pk_pattern
+    )
+    apply_migration_formatter.set_keys()
+    return apply_migration_formatter.format().schemas[0]
+
+
+def _system_records(schema: SyntheticSchema) -> list[tuple[str, str, str, str]]:
+    extractor = PostgresExtractor(f'postgresql://benchmark/{schema.db_source}')
+    return [
+        (full_name, table_name, column_name, extractor.from_db_type_to_system_type(column_type))
+        for full_name, table_name, column_name, column_type in schema.records(set(schema.table_to_columns))
+    ]
@@ -0,0 +1,173 @@
+import json
+import time
+import asyncio
+import argparse
+
+from dataclasses import dataclass, field, asdict
+
+import psycopg
+
+from migration_service.crud.migration import add_migration
+from migration_service.database import db_session, ag_session, ag_pool
+from migration_service.memory_graph import MemoryAgePool, memory_graph_store
+from migration_service.metrics import STAGE_SECONDS
+from migration_service.schemas.migrations import MigrationIn, MigrationPattern
+from migration_service.services.metadata_extractor import MetaDataExtractorFactory
+from migration_service.services.migration import apply_migration
+
+from benchmarks.synthetic_extractor import SyntheticExtractor
+from benchmarks.synthetic_schema import SyntheticSchema, generate_schema, churn_schema
+
+
+@dataclass
+class StageResult:
+    stage: str
+    calls: int
+    seconds: float
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    tables: int
+    fields: int
+    seconds: float
+    stages: list[StageResult] = field(default_factory=list)
+
+    @property
+    def tables_per_second(self) -> float:
+        return self.tables / self.seconds if self.seconds else 0.0
+
+    @property
+    def fields_per_second(self) -> float:
+        return self.fields / self.seconds if self.seconds else 0.0
+
+
+class Source:
+    def __init__(self, conn_string: str | None, db_source: str):
+        self._dsn = conn_string
+        self.conn_string = conn_string or f'synthetic://benchmark/{db_source}'
+
+    async def load(self, schema: SyntheticSchema):
+        if self._dsn is None:
+            SyntheticExtractor.conn_string_to_schema[self.conn_string] = schema
+            return
+
+        async with await psycopg.AsyncConnection.connect(self._dsn) as conn:
+            for statement in schema.ddl():
+                await conn.execute(statement)
+
+
+async def run_benchmark(args: argparse.Namespace) -> list[ScenarioResult]:
+    MetaDataExtractorFactory.register('synthetic', SyntheticExtractor)
+    db_source = args.source.rsplit('/', maxsplit=1)[1] if args.source else f'benchmark_{args.hubs}'
+    source = Source(args.source, db_source)
+    migration_pattern = MigrationPattern()
+
+    schema = generate_schema(db_source, args.hubs, args.sats, args.links, args.columns, args.seed)
+    churned_schema = churn_schema(schema, args.churn, args.seed)
+    _drop_graph(f'{db_source}.{schema.name}')
+
+    results = []
+    for name, scenario_schema in (
+            ('cold_load', schema),
+            ('noop_resync', schema),
+            (f'churn_{args.churn:.0%}', churned_schema)
+    ):
+        await source.load(scenario_schema)
+        migration_in = MigrationIn(name=f'benchmark {name}', conn_string=source.conn_string)
+        results.append(await _run_scenario(name, migration_in, migration_pattern, scenario_schema))
+    return results
+
+
+async def _run_scenario(
+        name: str, migration_in: MigrationIn, migration_pattern: MigrationPattern, schema: SyntheticSchema
+) -> ScenarioResult:
+    stage_totals = _stage_totals()
+    started_at = time.perf_counter()
+    async with db_session() as session:
+        with ag_session() as age_session:
+            guid, _ = await add_migration(migration_in, session, age_session)
+            await apply_migration(guid, migration_pattern, session, age_session)
+    seconds = time.perf_counter() - started_at
+
+    result = ScenarioResult(name=name, tables=schema.tables, fields=schema.fields, seconds=seconds)
+    for stage, (calls, stage_seconds) in _stage_totals().items():
+        prev_calls, prev_seconds = stage_totals.get(stage, (0, 0.0))
+        if calls > prev_calls:
+            result.stages.append(StageResult(stage, int(calls - prev_calls), stage_seconds - prev_seconds))
+    return result
+
+
+def _stage_totals() -> dict[str, tuple[float, float]]:
+    stage_totals: dict[str, list[float]] = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith('_count'):
+                stage_totals.setdefault(sample.labels['stage'], [0, 0])[0] = sample.value
+            elif sample.name.endswith('_sum'):
+                stage_totals.setdefault(sample.labels['stage'], [0, 0])[1] = sample.value
+    return {stage: (calls, seconds) for stage, (calls, seconds) in stage_totals.items()}
+
+
+def _drop_graph(graph_name: str):
+    if isinstance(ag_pool, MemoryAgePool):
+        memory_graph_store.drop_graph(graph_name)
+        return
+
+    with ag_session() as age_session:
+        with age_session.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT drop_graph(name, true) FROM ag_catalog.ag_graph WHERE name = %s', (graph_name, )
+            )
+    ag_pool.graph_cache.clear()
+
+
+def _print_results(results: list[ScenarioResult]):
+    for result in results:
+        print(
+            f'{result.name}: {result.tables} tables, {result.fields} fields in {result.seconds:.3f}s '
+            f'({result.tables_per_second:.1f} tables/s, {result.fields_per_second:.1f} fields/s)'
+        )
+        for stage in sorted(result.stages, key=lambda stage: stage.seconds, reverse=True):
+            print(
+                f'    {stage.stage:<40} {stage.calls:>8} calls {stage.seconds:>10.3f}s '
+                f'{stage.seconds / stage.calls * 1000:>10.2f}ms/call'
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Syncs a synthetic dv_raw schema into the graph: cold load, no-op resync and schema churn. '
+                    'The migrations database and AGE are configured by the service settings.'
+    )
+    parser.add_argument('--hubs', type=int, default=100)
+    parser.add_argument('--sats', type=int, default=200)
+    parser.add_argument('--links', type=int, default=50)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--churn', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--source', default=None,
+        help='postgres connection string the schema is created in, the catalog is served from memory when omitted'
+    )
+    parser.add_argument('--json', default=None, help='file the results are written to')
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    _print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(
+                [
+                    {**asdict(result), 'tables_per_second': result.tables_per_second,
+                     'fields_per_second': result.fields_per_second}
+                    for result in results
+                ],
+                f,
+                indent=2
+            )
+
+
+if __name__ == '__main__':
+    main()
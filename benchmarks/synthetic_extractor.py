@@ -0,0 +1,38 @@
+from migration_service.schemas.catalog import Catalog, StringPool
+from migration_service.services.metadata_extractor import PostgresExtractor
+
+from benchmarks.synthetic_schema import SyntheticSchema
+
+
+# serves a synthetic catalog from memory, types are mapped the way the postgres extractor maps them
+class SyntheticExtractor(PostgresExtractor):
+    conn_string_to_schema: dict[str, SyntheticSchema] = {}
+
+    @property
+    def _schema(self) -> SyntheticSchema:
+        return self.conn_string_to_schema[self._conn_string]
+
+    async def extract_table_names(self) -> dict[str, set[str]]:
+        return self._to_ns_to_tables([(self._schema.name, table_name) for table_name in self._schema.table_to_columns])
+
+    async def extract_table_name(self, table_name: str, db_path: str | None) -> dict[str, set[str]]:
+        if db_path:
+            table_name = db_path.split('.', maxsplit=2)[2]
+        if table_name not in self._schema.table_to_columns:
+            return {}
+        return self._to_ns_to_tables([(self._schema.name, table_name)])
+
+    async def extract_table_col_type(self, table_names: set[str], ns: str, pool: StringPool | None = None) -> Catalog:
+        return Catalog.from_records(
+            (
+                (full_name, table_name, column_name, self.from_db_type_to_system_type(column_type) if column_name else None)
+                for full_name, table_name, column_name, column_type in self._schema.records(table_names)
+            ),
+            pool
+        )
+
+    async def extract_table_count(self) -> int:
+        return self._schema.tables
+
+    async def extract_ddl_changes(self, since: int | None) -> tuple[int | None, dict[str, set[str]] | None]:
+        return None, None
@@ -0,0 +1,115 @@
+import copy
+import math
+import random
+
+from dataclasses import dataclass, field
+
+from psycopg import sql
+
+from migration_service.schemas.migrations import MigrationPattern
+
+# postgres types the extractor maps onto distinct system types
+COLUMN_TYPES = (
+    'character varying', 'integer', 'bigint', 'boolean', 'numeric', 'date', 'timestamp without time zone', 'jsonb'
+)
+
+
+@dataclass
+class SyntheticSchema:
+    db_source: str
+    name: str = 'dv_raw'
+    table_to_columns: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    @property
+    def tables(self) -> int:
+        return len(self.table_to_columns)
+
+    @property
+    def fields(self) -> int:
+        return sum(len(columns) for columns in self.table_to_columns.values())
+
+    def records(self, table_names: set[str]) -> list[tuple[str, str, str | None, str | None]]:
+        records = []
+        for table_name in sorted(table_names):
+            columns = self.table_to_columns.get(table_name)
+            if columns is None:
+                continue
+
+            full_name = f'{self.name}.{table_name}'
+            if not columns:
+                records.append((full_name, table_name, None, None))
+            for column_name, column_type in columns.items():
+                records.append((full_name, table_name, column_name, column_type))
+        return records
+
+    def ddl(self) -> list[sql.Composable]:
+        schema = sql.Identifier(self.name)
+        statements = [
+            sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(schema),
+            sql.SQL('CREATE SCHEMA {}').format(schema)
+        ]
+        for table_name, columns in self.table_to_columns.items():
+            statements.append(
+                sql.SQL('CREATE TABLE {}.{} ({})').format(
+                    schema,
+                    sql.Identifier(table_name),
+                    sql.SQL(', ').join(
+                        sql.SQL('{} {}').format(sql.Identifier(column_name), sql.SQL(column_type))
+                        for column_name, column_type in columns.items()
+                    )
+                )
+            )
+        return statements
+
+
+def generate_schema(
+        db_source: str, hubs: int, sats: int, links: int, columns: int, seed: int = 0
+) -> SyntheticSchema:
+    rng = random.Random(seed)
+    pk = MigrationPattern().pk_pattern
+    schema = SyntheticSchema(db_source=db_source)
+
+    hub_names = [f'hub_{ndx:05d}' for ndx in range(hubs)]
+    for hub_name in hub_names:
+        schema.table_to_columns[hub_name] = {pk: 'character varying', **_payload_columns(rng, columns - 1)}
+
+    # satellites are named after their hub, so the fk table pattern matches them to it
+    for ndx in range(sats):
+        hub_name = hub_names[ndx % hubs]
+        schema.table_to_columns[f'{hub_name}_sat_{ndx // hubs}'] = {
+            f'{hub_name}_hash_fkey': 'character varying', **_payload_columns(rng, columns - 1)
+        }
+
+    for ndx in range(links):
+        main_hub, paired_hub = rng.sample(hub_names, 2)
+        schema.table_to_columns[f'link_{ndx:05d}'] = {
+            pk: 'character varying',
+            f'{main_hub}_hash_fkey': 'character varying',
+            f'{paired_hub}_hash_fkey': 'character varying',
+            **_payload_columns(rng, columns - 3)
+        }
+    return schema
+
+
+def churn_schema(schema: SyntheticSchema, ratio: float, seed: int = 0) -> SyntheticSchema:
+    rng = random.Random(seed)
+    churned = copy.deepcopy(schema)
+
+    table_names = sorted(churned.table_to_columns)
+    for table_name in rng.sample(table_names, math.ceil(len(table_names) * ratio)):
+        columns = churned.table_to_columns[table_name]
+        # keys stay untouched, otherwise hubs, satellites and links would swap kinds
+        payload = [column_name for column_name in columns if column_name.startswith('attr_')]
+        match rng.choice(('create', 'delete', 'alter')) if payload else 'create':
+            case 'create':
+                columns[f'attr_churn_{len(columns)}'] = rng.choice(COLUMN_TYPES)
+            case 'delete':
+                del columns[rng.choice(payload)]
+            case 'alter':
+                column_name = rng.choice(payload)
+                columns[column_name] = rng.choice([t for t in COLUMN_TYPES if t != columns[column_name]])
+    return churned
+
+
+def _payload_columns(rng: random.Random, count: int) -> dict[str, str]:
+    return {f'attr_{ndx}': rng.choice(COLUMN_TYPES) for ndx in range(max(count, 0))}
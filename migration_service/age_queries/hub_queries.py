@@ -16,14 +16,15 @@ create_hubs_query = """
 
 def construct_create_hubs_query(hub_batch) -> sql.Composable:
     query = []
-    for hub in hub_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(hub['name']))
-        db = sql.SQL("db: {}").format(sql.Literal(hub['db']))
+    for item in hub_batch:
+        hub = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(hub.name))
+        db = sql.SQL("db: {}").format(sql.Literal(hub.db))
 
         fields_query = []
-        for field in hub['fields']:
-            f_name = sql.SQL("name: {}").format(sql.Literal(field['name']))
-            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field['db_type']))
+        for field in item.fields:
+            f_name = sql.SQL("name: {}").format(sql.Literal(field.name))
+            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field.db_type))
 
             f_fields = sql.SQL(',').join((f_name, f_dbtype))
             f_fields = sql.SQL('{{{}}}').format(f_fields)
@@ -35,26 +35,27 @@ create_links_with_hubs_query = """
 
 def construct_create_links_query(link_batch, is_linked: bool) -> sql.Composable:
     query = []
-    for link in link_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(link['name']))
-        db = sql.SQL("db: {}").format(sql.Literal(link['db']))
+    for item in link_batch:
+        link = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(link.name))
+        db = sql.SQL("db: {}").format(sql.Literal(link.db))
 
         if is_linked:
             main_link = sql.SQL("main_link: {{ref_table: {}, ref_table_pk: {}, fk: {}}}").format(
-                sql.Literal(link['main_link']['ref_table']),
-                sql.Literal(link['main_link']['ref_table_pk']),
-                sql.Literal(link['main_link']['fk'])
+                sql.Literal(link.main_link.ref_table),
+                sql.Literal(link.main_link.ref_table_pk),
+                sql.Literal(link.main_link.fk)
             )
             paired_link = sql.SQL("paired_link: {{ref_table: {}, ref_table_pk: {}, fk: {}}}").format(
-                sql.Literal(link['paired_link']['ref_table']),
-                sql.Literal(link['paired_link']['ref_table_pk']),
-                sql.Literal(link['paired_link']['fk'])
+                sql.Literal(link.paired_link.ref_table),
+                sql.Literal(link.paired_link.ref_table_pk),
+                sql.Literal(link.paired_link.fk)
             )
 
         fields_query = []
-        for field in link['fields']:
-            f_name = sql.SQL("name: {}").format(sql.Literal(field['name']))
-            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field['db_type']))
+        for field in item.fields:
+            f_name = sql.SQL("name: {}").format(sql.Literal(field.name))
+            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field.db_type))
 
             f_fields = sql.SQL(',').join((f_name, f_dbtype))
             f_fields = sql.SQL('{{{}}}').format(f_fields)
@@ -62,13 +62,14 @@ def construct_delete_nodes_query(name_batch) -> sql.Composable:
 
 def construct_create_fields_query(nodes_batch) -> sql.Composable:
     query = []
-    for node in nodes_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(node['name']))
+    for item in nodes_batch:
+        node = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(node.name))
 
         fields_query = []
-        for field in node['fields_to_create']:
-            f_name = sql.SQL("name: {}").format(sql.Literal(field['name']))
-            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field['db_type']))
+        for field in item.fields:
+            f_name = sql.SQL("name: {}").format(sql.Literal(field.name))
+            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field.db_type))
 
             f_fields = sql.SQL(',').join((f_name, f_dbtype))
             f_fields = sql.SQL('{{{}}}').format(f_fields)
@@ -89,11 +90,12 @@ def construct_create_fields_query(nodes_batch) -> sql.Composable:
 
 def construct_delete_fields_query(nodes_batch) -> sql.Composable:
     query = []
-    for node in nodes_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(node['name']))
+    for item in nodes_batch:
+        node = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(node.name))
 
         fields_query = []
-        for field in node['fields_to_delete']:
+        for field in item.fields:
             f_name = sql.SQL("{}").format(sql.Literal(field))
 
             fields_query.append(f_name)
@@ -112,13 +114,14 @@ def construct_delete_fields_query(nodes_batch) -> sql.Composable:
 
 def construct_alter_fields_query(nodes_batch) -> sql.Composable:
     query = []
-    for node in nodes_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(node['name']))
+    for item in nodes_batch:
+        node = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(node.name))
 
         fields_query = []
-        for field in node['fields_to_alter']:
-            f_name = sql.SQL("name: {}").format(sql.Literal(field['name']))
-            f_dbtype = sql.SQL("new_type: {}").format(sql.Literal(field['new_type']))
+        for field in item.fields:
+            f_name = sql.SQL("name: {}").format(sql.Literal(field.name))
+            f_dbtype = sql.SQL("new_type: {}").format(sql.Literal(field.new_type))
 
             f_fields = sql.SQL(',').join((f_name, f_dbtype))
             f_fields = sql.SQL('{{{}}}').format(f_fields)
@@ -61,21 +61,22 @@ create_sats_query = """
 
 def construct_create_sats_query(sat_batch, is_linked: bool) -> sql.Composable:
     query = []
-    for sat in sat_batch:
-        name = sql.SQL("name: {}").format(sql.Literal(sat['name']))
-        db = sql.SQL("db: {}").format(sql.Literal(sat['db']))
+    for item in sat_batch:
+        sat = item.record
+        name = sql.SQL("name: {}").format(sql.Literal(sat.name))
+        db = sql.SQL("db: {}").format(sql.Literal(sat.db))
         # sat_record.link.ref_table_pk, sat_record.link.fk
         if is_linked:
             link = sql.SQL("link: {{ref_table: {}, ref_table_pk: {}, fk: {}}}").format(
-                sql.Literal(sat['link']['ref_table']),
-                sql.Literal(sat['link']['ref_table_pk']),
-                sql.Literal(sat['link']['fk'])
+                sql.Literal(sat.link.ref_table),
+                sql.Literal(sat.link.ref_table_pk),
+                sql.Literal(sat.link.fk)
             )
 
         fields_query = []
-        for field in sat['fields']:
-            f_name = sql.SQL("name: {}").format(sql.Literal(field['name']))
-            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field['db_type']))
+        for field in item.fields:
+            f_name = sql.SQL("name: {}").format(sql.Literal(field.name))
+            f_dbtype = sql.SQL("db_type: {}").format(sql.Literal(field.db_type))
 
             f_fields = sql.SQL(',').join((f_name, f_dbtype))
             f_fields = sql.SQL('{{{}}}').format(f_fields)
@@ -1,18 +1,28 @@
 import logging
 import asyncio
+import time
 
 from typing import Callable
 
 from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse
-
+from opentelemetry.trace import StatusCode
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from migration_service.endpoints.migrations import router
 
 from migration_service.services.auth import load_jwks
-from migration_service.services.migration_request_lifespan import synchronize, set_synchronizing_off
+from migration_service.services.metadata_extractor import PostgresExtractor, MongoExtractor
+from migration_service.services.migration_request_lifespan import (
+    synchronize, set_synchronizing_off, route_migration_requests, MigrationLane
+)
+from migration_service.services.migration_request_coalescer import group_migration_requests
+from migration_service.services.ddl_listener import listen_ddl_changes
 
-from migration_service.mq import create_channel
+from migration_service.metrics import QUEUE_LAG_SECONDS, IN_FLIGHT_REQUESTS
+from migration_service.tracing import tracer, shutdown_tracing
+from migration_service.mq import create_channel, PikaChannel
+from migration_service.utils.process_pool_utils import shutdown_process_pool
 from migration_service.errors import APIError
 from migration_service.settings import settings
 
@@ -36,10 +46,49 @@ async def on_startup():
         await channel.queue_declare(settings.migration_request_queue)
         await channel.queue_bind(settings.migration_request_queue, settings.migration_exchange, 'task')
 
+        await channel.queue_declare(settings.migration_request_object_queue)
+        await channel.queue_bind(
+            settings.migration_request_object_queue, settings.migration_exchange, MigrationLane.OBJECT.value
+        )
+
+        await channel.queue_declare(settings.migration_request_full_queue)
+        await channel.queue_bind(
+            settings.migration_request_full_queue, settings.migration_exchange, MigrationLane.FULL.value
+        )
+
         await channel.queue_declare(settings.migrations_result_queue)
         await channel.queue_bind(settings.migrations_result_queue, settings.migration_exchange, 'result')
 
-        asyncio.create_task(consume(settings.migration_request_queue, synchronize, set_synchronizing_off))
+        asyncio.create_task(consume(settings.migration_request_queue, route_migration_requests, set_synchronizing_off))
+        asyncio.create_task(
+            consume(
+                settings.migration_request_object_queue,
+                synchronize,
+                set_synchronizing_off,
+                group_migration_requests,
+                settings.object_sync_concurrency
+            )
+        )
+        asyncio.create_task(
+            consume(
+                settings.migration_request_full_queue,
+                synchronize,
+                set_synchronizing_off,
+                group_migration_requests,
+                settings.full_sync_concurrency
+            )
+        )
+
+    for source in settings.ddl_listener_sources:
+        asyncio.create_task(listen_ddl_changes(source))
+
+
+@migration_app.on_event('shutdown')
+async def on_shutdown():
+    shutdown_process_pool()
+    await PostgresExtractor.close_pools()
+    MongoExtractor.close_clients()
+    shutdown_tracing()
 
 
 @migration_app.middleware("http")
@@ -73,23 +122,66 @@ def ping():
     return {'status': 'ok'}
 
 
-async def consume(query, func: Callable, reject_func: Callable = None):
+@migration_app.get('/metrics')
+def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def consume(
+        query, func: Callable, reject_func: Callable = None, group_func: Callable = None, concurrency: int = 1
+):
+    semaphore = asyncio.Semaphore(concurrency)
     while True:
+        tasks = set()
         try:
             logger.info(f'Starting {query} worker')
             async with create_channel() as channel:
-                async for delivery_tag, body in channel.consume(query):
-                    try:
-                        logger.info(f"Received message: {body}")
-                        await func(body, channel)
-                        await channel.basic_ack(delivery_tag)
-                    except Exception as e:
-                        logger.exception(f'Failed to process message {body}: {e}')
-                        await channel.basic_reject(delivery_tag, requeue=False)
-
-                        if reject_func:
-                            await reject_func(body, channel)
+                await channel.basic_qos(concurrency * settings.migration_request_coalesce_max)
+                await channel.confirm_delivery()
+                try:
+                    async for deliveries in channel.consume_batches(
+                            query, settings.migration_request_coalesce_max, settings.migration_request_coalesce_window
+                    ):
+                        groups = group_func(deliveries) if group_func else [[delivery] for delivery in deliveries]
+                        for group in groups:
+                            await semaphore.acquire()
+                            task = asyncio.create_task(process(query, group, channel, func, reject_func))
+                            task.add_done_callback(lambda _: semaphore.release())
+                            task.add_done_callback(tasks.discard)
+                            tasks.add(task)
+                finally:
+                    await asyncio.gather(*tasks, return_exceptions=True)
         except Exception as e:
             logger.exception(f'Worker {query} failed: {e}')
 
         await asyncio.sleep(0.5)
+
+
+async def process(
+        query, group: list[tuple[int, bytes]], channel: PikaChannel, func: Callable, reject_func: Callable = None
+):
+    bodies = [body for _, body in group]
+    now = time.time()
+    for delivery_tag, _ in group:
+        published_at = channel.published_at.pop(delivery_tag, None)
+        if published_at is not None:
+            QUEUE_LAG_SECONDS.labels(query).observe(max(now - published_at, 0))
+
+    with tracer.start_as_current_span(
+            'process_messages', attributes={'queue': query, 'messages': len(group)}
+    ) as span:
+        try:
+            logger.info(f"Received messages: {bodies}")
+            with IN_FLIGHT_REQUESTS.labels(query).track_inprogress():
+                await func(bodies, channel)
+            for delivery_tag, _ in group:
+                await channel.basic_ack(delivery_tag)
+        except Exception as e:
+            logger.exception(f'Failed to process messages {bodies}: {e}')
+            span.record_exception(e)
+            span.set_status(StatusCode.ERROR)
+            for delivery_tag, body in group:
+                await channel.basic_reject(delivery_tag, requeue=False)
+
+                if reject_func:
+                    await reject_func(body, channel)
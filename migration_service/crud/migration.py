@@ -2,21 +2,25 @@ import logging
 import uuid
 import asyncio
 
-from typing import Sequence
-
 from age import Age
 from fastapi import status, HTTPException
-from sqlalchemy import select
+from sqlalchemy import select, delete
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession as SQLAlchemyAsyncSession
 
+from migration_service.database import ag_session
+from migration_service.metrics import track_stage
 from migration_service.models import migrations
-from migration_service.schemas import tables
-from migration_service.schemas.migrations import MigrationIn, MigrationOut
+from migration_service.schemas.catalog import Catalog, StringPool
+from migration_service.schemas.migrations import MigrationIn, MigrationOut, MigrationObject
 from migration_service.services.migration_formatter import MigrationOutFormatter
 from migration_service.services.metadata_extractor import MetaDataExtractorFactory, MetadataExtractor
+from migration_service.settings import settings
 
-from migration_service.utils.graph_db_utils import get_graph_db_tables, get_graph_db_table_col_type, get_graph_db_table
+from migration_service.utils.graph_db_utils import (
+    get_graph_db_tables, get_graph_db_table_col_type, get_graph_db_tables_by_names
+)
+from migration_service.utils.profiling_utils import profiled_to_thread
 
 logger = logging.getLogger(__name__)
 
@@ -24,53 +28,62 @@ logger = logging.getLogger(__name__)
 async def add_migration(
         migration_in: MigrationIn,
         session: SQLAlchemyAsyncSession,
-        age_session: Age
+        age_session: Age,
+        dry_run: bool = False
 ) -> (str, int):
     logger.info('Adding migration...')
-    metadata_extractor = MetaDataExtractorFactory.build(conn_string=migration_in.conn_string)
-    loop = asyncio.get_running_loop()
+    metadata_extractor = MetaDataExtractorFactory.build(
+        conn_string=migration_in.conn_string, source_filter=migration_in.source_filter
+    )
+    db_source = migration_in.conn_string.rsplit('/', maxsplit=1)[1]
+    migration_objects = migration_in.migration_objects
 
-    if migration_in.object_name or migration_in.object_db_path:
-        db_ns_to_table = await metadata_extractor.extract_table_name(
-            table_name=migration_in.object_name, db_path=migration_in.object_db_path
-        )
-        graph_db_ns_to_table = await loop.run_in_executor(
-            None, get_graph_db_table, db_ns_to_table.keys(), migration_in.object_name, age_session
+    # reads that don't depend on each other overlap, the source pool caps how many hit the source at once
+    (high_water_mark, changed_ns_to_table), db_ns_to_table, count = await asyncio.gather(
+        _extract_ddl_changes(db_source, metadata_extractor, session, skip=_skips_ddl_changes(migration_in)),
+        _extract_table_names(db_source, migration_objects, metadata_extractor),
+        _extract_table_count(metadata_extractor)
+    )
+
+    if migration_objects:
+        read_graph_db_tables = profiled_to_thread(
+            get_graph_db_tables_by_names, _to_ns_to_object_names(db_ns_to_table, migration_objects), age_session
         )
     else:
-        db_ns_to_table = await metadata_extractor.extract_table_names()
-        graph_db_ns_to_table = await loop.run_in_executor(
-            None, get_graph_db_tables, db_ns_to_table.keys(), age_session
-        )
+        read_graph_db_tables = profiled_to_thread(get_graph_db_tables, db_ns_to_table.keys(), age_session)
+    graph_db_ns_to_table, last_migration = await asyncio.gather(
+        read_graph_db_tables, _select_last_migration_by_db_source(db_source, session)
+    )
 
     guid = str(uuid.uuid4())
-    db_source = migration_in.conn_string.rsplit('/', maxsplit=1)[1]
-    migration = migrations.Migration(name=migration_in.name, guid=guid, db_source=db_source)
+    migration = migrations.Migration(
+        name=migration_in.name, guid=guid, db_source=db_source, ddl_high_water_mark=high_water_mark
+    )
 
-    last_migration = await _select_last_migration_by_db_source(db_source, session)
     if last_migration is not None:
         logger.info(f"last migration name: {last_migration.name}")
         logger.info(f"last migration created_at: {last_migration.created_at}")
         migration.prev_migration = last_migration
 
-    for ns, db_tables in db_ns_to_table.items():
-        tables_to_delete = graph_db_ns_to_table[ns] - db_tables
-        tables_to_create = db_tables - graph_db_ns_to_table[ns]
-        tables_to_alter = graph_db_ns_to_table[ns] & db_tables
-
-        logger.info(f'ns: {ns}')
-
-        schema_name = ns.rsplit('.', maxsplit=1)[1]
-        schema = migrations.Schema(name=schema_name, migration_guid=guid)
-        await _create_tables(tables_to_create, metadata_extractor, schema)
-        await _alter_tables(tables_to_alter, metadata_extractor, schema, db_source, age_session)
-        await _delete_tables(tables_to_delete, schema)
-
-        migration.schemas.append(schema)
+    schemas = await asyncio.gather(
+        *(
+            _diff_schema(
+                ns, db_tables, graph_db_ns_to_table[ns],
+                None if changed_ns_to_table is None else changed_ns_to_table.get(ns, set()),
+                guid, db_source, metadata_extractor
+            )
+            for ns, db_tables in db_ns_to_table.items()
+        )
+    )
+    migration.schemas.extend(schemas)
 
-    count = await metadata_extractor.extract_table_count()
     session.add(migration)
-    await session.commit()
+    with track_stage('persist', tables=sum(len(schema.tables) for schema in migration.schemas)):
+        if dry_run:
+            # the caller rolls the migration back once it is planned
+            await session.flush()
+        else:
+            await session.commit()
     return migration.guid, count
 
 
@@ -86,101 +99,220 @@ async def select_migration(guid: str, session: SQLAlchemyAsyncSession) -> Migrat
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
 
-async def _create_tables(
-        table_names: set[str], metadata_extractor: MetadataExtractor, schema: migrations.Schema,
-):
-    if not table_names:
-        return
+def _skips_ddl_changes(migration_in: MigrationIn) -> bool:
+    # a filtered sync only reads the changes inside its filter, its mark would skip the others for the next sync
+    return bool(migration_in.migration_objects) or migration_in.source_filter is not None
 
-    records = await metadata_extractor.extract_table_col_type(table_names, schema.name)
-    dataclass_db_tables = _create_dataclass_tables(records)
 
-    for db_table in dataclass_db_tables:
-        table = migrations.Table(new_name=db_table.name, db=db_table.db)
-        for field_name, field_type in db_table.field_to_type.items():
-            table.fields.append(
-                migrations.Field(new_name=field_name, new_type=field_type)
-            )
-        schema.tables.append(table)
+async def _extract_ddl_changes(
+        db_source: str, metadata_extractor: MetadataExtractor, session: SQLAlchemyAsyncSession, skip: bool
+) -> tuple[int | None, dict[str, set[str]] | None]:
+    if not settings.ddl_capture or skip:
+        return None, None
 
+    last_high_water_mark = await _select_last_ddl_high_water_mark(db_source, session)
+    with track_stage('extract_ddl_changes', db_source=db_source) as span:
+        high_water_mark, changed_ns_to_table = await metadata_extractor.extract_ddl_changes(last_high_water_mark)
+        span.set_attribute('high_water_mark', high_water_mark or 0)
+    if changed_ns_to_table is not None:
+        logger.info(f'Tables changed since DDL change {last_high_water_mark}: {changed_ns_to_table}')
+    return high_water_mark, changed_ns_to_table
+
+
+async def _extract_table_names(
+        db_source: str, migration_objects: list[MigrationObject], metadata_extractor: MetadataExtractor
+) -> dict[str, set[str]]:
+    with track_stage('extract_table_names', db_source=db_source) as span:
+        if migration_objects:
+            db_ns_to_table = await _extract_objects(migration_objects, metadata_extractor)
+        else:
+            db_ns_to_table = await metadata_extractor.extract_table_names()
+        span.set_attribute('tables', sum(map(len, db_ns_to_table.values())))
+    return db_ns_to_table
 
-async def _alter_tables(
-        table_names: set[str], metadata_extractor: MetadataExtractor, schema: migrations.Schema, db_source: str,
-        age_session: Age
-):
-    if not table_names:
-        return
-    db_records = await metadata_extractor.extract_table_col_type(table_names, schema.name)
 
-    loop = asyncio.get_running_loop()
-    graph_db_records = await loop.run_in_executor(
-        None, get_graph_db_table_col_type, db_source, schema.name, table_names, age_session
+async def _extract_table_count(metadata_extractor: MetadataExtractor) -> int:
+    with track_stage('extract_table_count'):
+        return await metadata_extractor.extract_table_count()
+
+
+async def _extract_objects(
+        migration_objects: list[MigrationObject], metadata_extractor: MetadataExtractor
+) -> dict[str, set[str]]:
+    ns_to_tables: dict[str, set[str]] = {}
+    objects_ns_to_tables = await asyncio.gather(
+        *(
+            metadata_extractor.extract_table_name(table_name=migration_object.name, db_path=migration_object.db_path)
+            for migration_object in migration_objects
+        )
+    )
+    for object_ns_to_tables in objects_ns_to_tables:
+        for ns, table_names in object_ns_to_tables.items():
+            ns_to_tables.setdefault(ns, set()).update(table_names)
+    return ns_to_tables
+
+
+def _to_ns_to_object_names(
+        db_ns_to_table: dict[str, set[str]], migration_objects: list[MigrationObject]
+) -> dict[str, set[str]]:
+    ns_to_names: dict[str, set[str]] = {ns: set() for ns in db_ns_to_table}
+    for migration_object in migration_objects:
+        if migration_object.db_path:
+            source, schema, name = migration_object.db_path.split('.', maxsplit=2)
+            ns_to_names.setdefault(f'{source}.{schema}', set()).add(name)
+        else:
+            # an object requested by name alone may be in any of the namespaces
+            for names in ns_to_names.values():
+                names.add(migration_object.name)
+    return {ns: ns_to_names[ns] for ns in db_ns_to_table}
+
+
+async def _diff_schema(
+        ns: str, db_tables: set[str], graph_db_tables: set[str], changed_tables: set[str] | None, guid: str,
+        db_source: str, metadata_extractor: MetadataExtractor
+) -> migrations.Schema:
+    schema_name = ns.rsplit('.', maxsplit=1)[1]
+    # a filtered sync narrows what is synced, graph tables outside of the filter are left alone
+    graph_db_tables = {
+        table_name for table_name in graph_db_tables if metadata_extractor.is_filtered_in(schema_name, table_name)
+    }
+    tables_to_delete = graph_db_tables - db_tables
+    tables_to_create = db_tables - graph_db_tables
+    tables_to_alter = graph_db_tables & db_tables
+    if changed_tables is not None:
+        # only tables touched by DDL since the last applied migration can differ
+        tables_to_alter &= changed_tables
+
+    logger.info(f'ns: {ns}')
+
+    schema = migrations.Schema(name=schema_name, migration_guid=guid)
+    pool = StringPool()
+    create_catalog, db_catalog, graph_db_catalog = await asyncio.gather(
+        _extract_table_col_type(tables_to_create, metadata_extractor, schema_name, pool),
+        _extract_table_col_type(tables_to_alter, metadata_extractor, schema_name, pool),
+        profiled_to_thread(_read_graph_db_table_col_type, db_source, schema_name, tables_to_alter, pool)
     )
 
-    dataclass_db_tables = _create_dataclass_tables(db_records)
-    dataclass_graph_db_tables = _create_dataclass_tables(graph_db_records)
+    with track_stage('diff', graph=ns):
+        _create_tables(create_catalog, schema)
+        _diff_tables(db_catalog, graph_db_catalog, schema)
+        _delete_tables(tables_to_delete, schema)
+    return schema
+
+
+async def _extract_table_col_type(
+        table_names: set[str], metadata_extractor: MetadataExtractor, schema_name: str, pool: StringPool
+) -> Catalog:
+    if not table_names:
+        return Catalog(pool)
 
-    _do_tables_altering(dataclass_db_tables, dataclass_graph_db_tables, schema)
+    with track_stage('extract_table_col_type', schema=schema_name, tables=len(table_names)) as span:
+        catalog = await metadata_extractor.extract_table_col_type(table_names, schema_name, pool)
+        span.set_attribute('rows', catalog.columns)
+    return catalog
 
 
-async def _delete_tables(table_names: set[str], schema: migrations.Schema):
+def _read_graph_db_table_col_type(db_source: str, schema_name: str, table_names: set[str], pool: StringPool) -> Catalog:
+    if not table_names:
+        return Catalog(pool)
+
+    # reads of different namespaces run concurrently, setGraph switches the graph of a whole session
+    with ag_session() as age_session:
+        return get_graph_db_table_col_type(db_source, schema_name, table_names, age_session, pool)
+
+
+def _create_tables(catalog: Catalog, schema: migrations.Schema):
+    for catalog_table in catalog:
+        table = migrations.Table(new_name=catalog_table.name, db=catalog_table.db)
+        table.fields = [
+            migrations.Field(new_name=field_name, new_type=field_type)
+            for field_name, field_type in catalog_table.fields()
+        ]
+        schema.tables.append(table)
+
+
+def _delete_tables(table_names: set[str], schema: migrations.Schema):
     for table in table_names:
         schema.tables.append(migrations.Table(old_name=table, db=f'{schema.name}.{table}'))
 
 
-def _do_tables_altering(
-        dataclass_db_tables: list[tables.Table],
-        dataclass_graph_db_tables: list[tables.Table],
-        schema: migrations.Schema
-):
-    for db_table, graph_db_table in zip(dataclass_db_tables, dataclass_graph_db_tables):
-        assert db_table.name == graph_db_table.name
-        if db_table == graph_db_table:
-            continue
-        else:
-            table = migrations.Table(
-                old_name=graph_db_table.name,
-                new_name=graph_db_table.name,
-                db=graph_db_table.db
-            )
+def _diff_tables(db_catalog: Catalog, graph_db_catalog: Catalog, schema: migrations.Schema):
+    if db_catalog.pool is not graph_db_catalog.pool:
+        raise ValueError('Catalogs diffed against each other have to share their string pool')
+    strings = db_catalog.pool.strings
 
+    # hash join on the interned table name, neither side has to be sorted
+    matched_name_ids = set()
+    for db_table in db_catalog:
+        graph_db_table = graph_db_catalog.get_by_id(db_table.name_id)
+        if graph_db_table is None:
+            table = migrations.Table(new_name=db_table.name, db=db_table.db)
+            table.fields = [
+                migrations.Field(new_name=field_name, new_type=field_type)
+                for field_name, field_type in db_table.fields()
+            ]
             schema.tables.append(table)
+            continue
 
-            db_table_field_names = set(db_table.field_to_type.keys())
-            graph_db_table_field_names = set(graph_db_table.field_to_type.keys())
-
-            fields_to_delete = graph_db_table_field_names - db_table_field_names
-            fields_to_create = db_table_field_names - graph_db_table_field_names
-            fields_to_alter = graph_db_table_field_names & db_table_field_names
+        matched_name_ids.add(db_table.name_id)
+        field_to_type = dict(db_table.field_ids())
+        graph_field_to_type = dict(graph_db_table.field_ids())
+        if field_to_type == graph_field_to_type:
+            continue
 
-            _create_fields(fields_to_create, db_table, table)
-            _alter_fields(fields_to_alter, db_table, graph_db_table, table)
-            _delete_fields(fields_to_delete, graph_db_table, table)
+        fields = []
+        for name_id, type_id in field_to_type.items():
+            if name_id not in graph_field_to_type:
+                fields.append(migrations.Field(new_name=strings[name_id], new_type=strings[type_id]))
+                continue
+
+            graph_type_id = graph_field_to_type.pop(name_id)
+            if graph_type_id != type_id:
+                fields.append(
+                    migrations.Field(
+                        old_name=strings[name_id], new_name=strings[name_id],
+                        old_type=strings[graph_type_id], new_type=strings[type_id]
+                    )
+                )
+        fields.extend(
+            migrations.Field(old_name=strings[name_id], old_type=strings[type_id])
+            for name_id, type_id in graph_field_to_type.items()
+        )
 
+        if fields:
+            table = migrations.Table(old_name=db_table.name, new_name=db_table.name, db=graph_db_table.db)
+            table.fields = fields
+            schema.tables.append(table)
 
-def _create_fields(fields_to_create: set[str], db_table: tables.Table, table: migrations.Table):
-    for f_to_create in fields_to_create:
-        field = migrations.Field(new_name=f_to_create, new_type=db_table.field_to_type[f_to_create])
-        table.fields.append(field)
+    for graph_db_table in graph_db_catalog:
+        if graph_db_table.name_id not in matched_name_ids:
+            schema.tables.append(migrations.Table(old_name=graph_db_table.name, db=graph_db_table.db))
 
 
-def _alter_fields(
-        fields_to_alter: set[str], db_table: tables.Table, graph_table: tables.Table, table: migrations.Table
-):
-    for f_to_alter in fields_to_alter:
-        db_type = db_table.field_to_type[f_to_alter]
-        graph_db_type = graph_table.field_to_type[f_to_alter]
-        if db_type == graph_db_type:
-            continue
-        else:
-            field = migrations.Field(old_name=f_to_alter, new_name=f_to_alter, old_type=graph_db_type, new_type=db_type)
-            table.fields.append(field)
+async def select_resumable_migration(db_source: str, session: SQLAlchemyAsyncSession) -> migrations.Migration | None:
+    # the newest migration of the source that failed while it was being applied, part of it is in the graph,
+    # migrations added since don't orphan it
+    migration = await session.execute(
+        select(migrations.Migration)
+        .where(
+            migrations.Migration.db_source == db_source,
+            migrations.Migration.is_applied.is_(False),
+            migrations.Migration.is_failed.is_(False),
+            select(migrations.ApplyCheckpoint.id)
+            .where(migrations.ApplyCheckpoint.migration_guid == migrations.Migration.guid)
+            .exists()
+        )
+        .order_by(migrations.Migration.created_at.desc())
+        .limit(1)
+    )
+    return migration.scalars().first()
 
 
-def _delete_fields(fields_to_delete: set[str], graph_table: tables.Table, table: migrations.Table):
-    for f_to_delete in fields_to_delete:
-        field = migrations.Field(old_name=f_to_delete, old_type=graph_table.field_to_type[f_to_delete])
-        table.fields.append(field)
+async def abandon_migration(migration: migrations.Migration, session: SQLAlchemyAsyncSession):
+    migration.is_failed = True
+    await session.execute(
+        delete(migrations.ApplyCheckpoint).where(migrations.ApplyCheckpoint.migration_guid == migration.guid)
+    )
 
 
 async def select_migration_tables_fields_by_guid(guid: str, session: SQLAlchemyAsyncSession):
@@ -229,19 +361,15 @@ async def _select_last_migration_by_db_source(db_source: str, session: SQLAlchem
     return last_migration.scalars().first()
 
 
-def _create_dataclass_tables(db_records: Sequence[Sequence[str]]) -> list[tables.Table]:
-    db_tables: list[tables.Table] = []
-    if not db_records:
-        return db_tables
-
-    for record in db_records:
-        db = record[0]
-        name = record[1]
-        if not db_tables or db_tables[-1].name != name:
-            db_tables.append(tables.Table(db=db, name=name))
-
-        field_name = record[2]
-        field_type = record[3]
-        if field_name is not None:
-            db_tables[-1].field_to_type[field_name] = field_type
-    return db_tables
+async def _select_last_ddl_high_water_mark(db_source: str, session: SQLAlchemyAsyncSession) -> int | None:
+    high_water_mark = await session.execute(
+        select(migrations.Migration.ddl_high_water_mark)
+        .where(
+            migrations.Migration.db_source == db_source,
+            migrations.Migration.ddl_high_water_mark.is_not(None),
+            migrations.Migration.is_applied
+        )
+        .order_by(migrations.Migration.created_at.desc())
+        .limit(1)
+    )
+    return high_water_mark.scalars().first()
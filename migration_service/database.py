@@ -1,13 +1,19 @@
-import age
 import psycopg2
+import threading
 
 from age import Age
+from age.age import checkGraphCreated
+from age.exceptions import SqlExcutionError
+from psycopg2.errors import InvalidSchemaName as UndefinedGraph
+from psycopg2.extensions import cursor as Cursor
 from contextlib import asynccontextmanager, contextmanager
+from typing import Iterable
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from migration_service.memory_graph import MemoryAgePool
 from migration_service.settings import settings
 
 
@@ -21,7 +27,125 @@ engine = create_async_engine(
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
 
-ag = age.connect(dsn=settings.age_connection_string)
+
+class GraphCache:
+    def __init__(self):
+        # graphs known to exist, shared by the connections of a pool
+        self._graphs: set[str] = set()
+        self._lock = threading.Lock()
+
+    def __contains__(self, graph: str) -> bool:
+        return graph in self._graphs
+
+    def add(self, graph: str):
+        with self._lock:
+            self._graphs.add(graph)
+
+    def discard(self, graphs: Iterable[str]):
+        with self._lock:
+            self._graphs.difference_update(graphs)
+
+    def existing(self, graph_names: Iterable[str], connection) -> list[str]:
+        graph_names = list(graph_names)
+        # only graphs not cached yet are looked up, another replica may have created them since
+        missing_graphs = [graph for graph in graph_names if graph not in self]
+        if missing_graphs:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT name FROM ag_catalog.ag_graph WHERE name = ANY(%s)', (missing_graphs, ))
+                found_graphs = [row[0] for row in cursor]
+            with self._lock:
+                self._graphs.update(found_graphs)
+        return [graph for graph in graph_names if graph in self]
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+
+class CachedAge(Age):
+    def __init__(self, graph_cache: GraphCache):
+        super().__init__()
+        self.graph_cache = graph_cache
+
+    def setGraph(self, graph: str) -> 'CachedAge':
+        if graph not in self.graph_cache:
+            checkGraphCreated(self.connection, graph)
+            self.graph_cache.add(graph)
+        self.graphName = graph
+        return self
+
+    def execCypher(self, cypherStmt: str, cols: list = None, params: tuple = None) -> Cursor:
+        try:
+            return super().execCypher(cypherStmt, cols=cols, params=params)
+        except SqlExcutionError as e:
+            if not isinstance(e.cause, UndefinedGraph):
+                raise
+        # the graph was dropped since it was cached, it is created again the way setGraph creates new graphs
+        self.graph_cache.discard([self.graphName])
+        self.setGraph(self.graphName)
+        return super().execCypher(cypherStmt, cols=cols, params=params)
+
+
+class AgePool:
+    def __init__(self, dsn: str, max_idle: int):
+        self._dsn = dsn
+        self._max_idle = max_idle
+        self._idle: list[Age] = []
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.graph_cache = GraphCache()
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def acquire(self) -> Age:
+        with self._lock:
+            ag = self._idle.pop() if self._idle else None
+            self.checked_out += 1
+        try:
+            ag = self._check_on_conn_alive(ag)
+            with ag.connection.cursor() as cur:
+                cur.execute("set schema 'ag_catalog'")
+            return ag
+        except Exception:
+            with self._lock:
+                self.checked_out -= 1
+            raise
+
+    def release(self, ag: Age):
+        with self._lock:
+            self.checked_out -= 1
+            if not ag.connection.closed and len(self._idle) < self._max_idle:
+                self._idle.append(ag)
+                return
+        if not ag.connection.closed:
+            ag.close()
+
+    @contextmanager
+    def connection(self) -> Age:
+        ag = self.acquire()
+        try:
+            yield ag
+        finally:
+            self.release(ag)
+
+    def _check_on_conn_alive(self, ag: Age | None) -> Age:
+        if ag is not None:
+            try:
+                with ag.connection.cursor() as cur:
+                    cur.execute("select 1")
+                return ag
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+        return CachedAge(self.graph_cache).connect(dsn=self._dsn)
+
+
+match settings.graph_backend:
+    case 'memory':
+        ag_pool = MemoryAgePool()
+    case _:
+        ag_pool = AgePool(settings.age_connection_string, settings.age_pool_size)
 
 
 @asynccontextmanager
@@ -37,22 +161,10 @@ async def db_session() -> AsyncSession:
 
 @contextmanager
 def ag_session() -> Age:
-    try:
-        check_on_conn_alive()
-        yield ag
-        ag.commit()
-    except Exception as exc:
-        ag.rollback()
-        raise exc
-
-
-def check_on_conn_alive():
-    global ag
-    try:
-        with ag.connection.cursor() as cur:
-            cur.execute("select 1")
-    except (psycopg2.OperationalError, psycopg2.InterfaceError):
-        ag = age.connect(dsn=settings.age_connection_string)
-    finally:
-        with ag.connection.cursor() as cur:
-            cur.execute("set schema 'ag_catalog'")
+    with ag_pool.connection() as ag:
+        try:
+            yield ag
+            ag.commit()
+        except Exception as exc:
+            ag.rollback()
+            raise exc
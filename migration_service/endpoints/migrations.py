@@ -14,7 +14,7 @@ router = APIRouter(
 
 @router.get('/{migration_guid}', response_model=MigrationOut)
 async def get_migration(migration_guid: str, session: SQLAlchemyAsyncSession = Depends(db_session)):
-    migration_out = await select_migration(session, migration_guid)
+    migration_out = await select_migration(migration_guid, session)
     return migration_out
 
 
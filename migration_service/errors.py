@@ -24,3 +24,32 @@ class UnknownDBSource(APIError):
     def __str__(self):
         return f"Unknown db source was given: {self._db_source}, " \
                f"support only the following ones: {list(self._supported_db_sources)}"
+
+
+class MemorySoftCapExceeded(APIError):
+    def __init__(self, traced: int, soft_cap: int):
+        self._traced = traced
+        self._soft_cap = soft_cap
+
+    def __str__(self):
+        return f"Sync was aborted, traced memory: {self._traced} bytes exceeds the soft cap: {self._soft_cap} bytes"
+
+
+class UnsupportedCypher(APIError):
+    status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    def __init__(self, statement: str, reason: str):
+        self._statement = statement
+        self._reason = reason
+
+    def __str__(self):
+        return f"In-memory graph backend can't run: {self._statement}, {self._reason}"
+
+
+class PublishNotConfirmed(Exception):
+    def __init__(self, publish_seq: int, reason: str):
+        self._publish_seq = publish_seq
+        self._reason = reason
+
+    def __str__(self):
+        return f"Publish {self._publish_seq} wasn't confirmed by the broker: {self._reason}"
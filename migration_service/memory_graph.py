@@ -0,0 +1,918 @@
+import re
+import itertools
+import threading
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator
+
+from psycopg2 import sql
+
+from migration_service.errors import UnsupportedCypher
+
+
+@dataclass(slots=True, eq=False)
+class Node:
+    id: int
+    label: str
+    properties: dict[str, Any]
+
+
+@dataclass(slots=True, eq=False)
+class Edge:
+    id: int
+    label: str
+    start_id: int
+    end_id: int
+    properties: dict[str, Any]
+
+
+class MemoryGraph:
+    def __init__(self, name: str):
+        self.name = name
+        self.nodes: dict[int, Node] = {}
+        self.edges: dict[int, Edge] = {}
+        self.out_edges: dict[int, set[int]] = {}
+        self.in_edges: dict[int, set[int]] = {}
+        self._label_index: dict[str, set[int]] = {}
+        # (label, property) -> (value type, value) -> node ids, only hashable values are indexed
+        self._property_index: dict[tuple[str, str], dict[tuple[type, Any], set[int]]] = {}
+        self._ids = itertools.count(1)
+
+    def find_nodes(self, label: str | None, properties: dict[str, Any]) -> Iterable[Node]:
+        candidates = None
+        for key, value in properties.items():
+            if label is None or not _is_hashable(value):
+                continue
+            ids = self._property_index.get((label, key), {}).get(_index_key(value), set())
+            if candidates is None or len(ids) < len(candidates):
+                candidates = ids
+        if candidates is None:
+            candidates = self._label_index.get(label, set()) if label is not None else self.nodes.keys()
+
+        return [
+            self.nodes[node_id]
+            for node_id in list(candidates)
+            if _has_properties(self.nodes[node_id], properties) and (label is None or self.nodes[node_id].label == label)
+        ]
+
+    def find_nodes_by_values(self, label: str, key: str, values: Iterable[Any]) -> Iterable[Node]:
+        value_to_ids = self._property_index.get((label, key), {})
+        node_ids = set()
+        for value in values:
+            if _is_hashable(value):
+                node_ids.update(value_to_ids.get(_index_key(value), ()))
+        return [self.nodes[node_id] for node_id in node_ids]
+
+    def create_node(self, label: str, properties: dict[str, Any], journal: list[Callable]) -> Node:
+        node = Node(next(self._ids), label, {})
+        self._add_node(node)
+        for key, value in properties.items():
+            self._set_node_property(node, key, value)
+        journal.append(lambda: self._remove_node(node))
+        return node
+
+    def create_edge(
+            self, label: str, start: Node, end: Node, properties: dict[str, Any], journal: list[Callable]
+    ) -> Edge:
+        edge = Edge(next(self._ids), label, start.id, end.id, dict(properties))
+        self._add_edge(edge)
+        journal.append(lambda: self._remove_edge(edge))
+        return edge
+
+    def delete_node(self, node: Node, detach: bool, journal: list[Callable]):
+        if node.id not in self.nodes:
+            return
+        edge_ids = self.out_edges[node.id] | self.in_edges[node.id]
+        if edge_ids and not detach:
+            raise UnsupportedCypher('DELETE', f'node {node.id} still has relationships, use DETACH DELETE')
+        for edge_id in list(edge_ids):
+            self.delete_edge(self.edges[edge_id], journal)
+        self._remove_node(node)
+        journal.append(lambda: self._add_node(node))
+
+    def delete_edge(self, edge: Edge, journal: list[Callable]):
+        if edge.id not in self.edges:
+            return
+        self._remove_edge(edge)
+        journal.append(lambda: self._add_edge(edge))
+
+    def set_property(self, entity: Node | Edge, key: str, value: Any, journal: list[Callable]):
+        missing = object()
+        old_value = entity.properties.get(key, missing)
+        if isinstance(entity, Node):
+            self._set_node_property(entity, key, value)
+            journal.append(
+                lambda: self._set_node_property(entity, key, None if old_value is missing else old_value)
+            )
+        else:
+            entity.properties[key] = value
+            journal.append(
+                lambda: entity.properties.pop(key) if old_value is missing else entity.properties.update({key: old_value})
+            )
+
+    def _add_node(self, node: Node):
+        self.nodes[node.id] = node
+        self.out_edges[node.id] = set()
+        self.in_edges[node.id] = set()
+        self._label_index.setdefault(node.label, set()).add(node.id)
+        for key, value in node.properties.items():
+            self._index(node, key, value)
+
+    def _remove_node(self, node: Node):
+        del self.nodes[node.id]
+        del self.out_edges[node.id]
+        del self.in_edges[node.id]
+        self._label_index[node.label].discard(node.id)
+        for key, value in node.properties.items():
+            self._unindex(node, key, value)
+
+    def _add_edge(self, edge: Edge):
+        self.edges[edge.id] = edge
+        self.out_edges[edge.start_id].add(edge.id)
+        self.in_edges[edge.end_id].add(edge.id)
+
+    def _remove_edge(self, edge: Edge):
+        del self.edges[edge.id]
+        self.out_edges[edge.start_id].discard(edge.id)
+        self.in_edges[edge.end_id].discard(edge.id)
+
+    def _set_node_property(self, node: Node, key: str, value: Any):
+        if key in node.properties:
+            self._unindex(node, key, node.properties.pop(key))
+        if value is not None:
+            node.properties[key] = value
+            self._index(node, key, value)
+
+    def _index(self, node: Node, key: str, value: Any):
+        if _is_hashable(value):
+            self._property_index.setdefault((node.label, key), {}).setdefault(_index_key(value), set()).add(node.id)
+
+    def _unindex(self, node: Node, key: str, value: Any):
+        if _is_hashable(value):
+            self._property_index.get((node.label, key), {}).get(_index_key(value), set()).discard(node.id)
+
+
+class MemoryGraphStore:
+    def __init__(self):
+        self.graphs: dict[str, MemoryGraph] = {}
+        self.lock = threading.RLock()
+
+    def graph(self, name: str) -> MemoryGraph:
+        with self.lock:
+            try:
+                return self.graphs[name]
+            except KeyError:
+                self.graphs[name] = graph = MemoryGraph(name)
+                return graph
+
+    def drop_graph(self, name: str):
+        with self.lock:
+            self.graphs.pop(name, None)
+
+
+memory_graph_store = MemoryGraphStore()
+
+
+class MemoryConnection:
+    closed = False
+
+    # renders composed literals the way psycopg2 quotes them without a connection
+    def render(self, composable: sql.Composable) -> str:
+        match composable:
+            case sql.Composed():
+                return ''.join(self.render(part) for part in composable.seq)
+            case sql.SQL():
+                return composable.string
+            case sql.Literal():
+                return _quote(composable.wrapped)
+            case sql.Identifier():
+                return '.'.join('"' + string.replace('"', '""') + '"' for string in composable.strings)
+            case _:
+                raise UnsupportedCypher(repr(composable), 'only SQL, Literal and Identifier compose graph statements')
+
+
+class MemoryCursor:
+    def __init__(self, rows: list[tuple]):
+        self._rows = rows
+        self._position = 0
+        self.rowcount = len(rows)
+
+    def __iter__(self) -> Iterator[tuple]:
+        while self._position < len(self._rows):
+            self._position += 1
+            yield self._rows[self._position - 1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def fetchone(self) -> tuple | None:
+        return next(iter(self), None)
+
+    def fetchall(self) -> list[tuple]:
+        return list(self)
+
+    def close(self):
+        self._position = len(self._rows)
+
+
+class MemoryAge:
+    def __init__(self, store: MemoryGraphStore = memory_graph_store):
+        self.store = store
+        self.connection = MemoryConnection()
+        self.graphName = None
+        self._journal: list[Callable] = []
+
+    def setGraph(self, graph: str) -> 'MemoryAge':
+        self.store.graph(graph)
+        self.graphName = graph
+        return self
+
+    def execCypher(self, cypherStmt: str, cols: list = None, params: tuple = None) -> MemoryCursor:
+        if self.graphName is None:
+            raise UnsupportedCypher(cypherStmt, 'graph name is not set')
+        if params:
+            raise UnsupportedCypher(cypherStmt, 'parameters are not supported, literals are inlined')
+
+        query = CypherParser(cypherStmt).parse()
+        with self.store.lock:
+            journal_size = len(self._journal)
+            try:
+                rows = CypherExecutor(self.store.graph(self.graphName), self._journal).execute(query)
+            except Exception:
+                # a failed statement leaves the transaction the way it was before it
+                self._undo(journal_size)
+                raise
+        return MemoryCursor(rows)
+
+    def commit(self):
+        self._journal.clear()
+
+    def rollback(self):
+        with self.store.lock:
+            self._undo(0)
+
+    def close(self):
+        self.rollback()
+        self.connection.closed = True
+
+    def _undo(self, journal_size: int):
+        while len(self._journal) > journal_size:
+            self._journal.pop()()
+
+
+class MemoryAgePool:
+    def __init__(self, store: MemoryGraphStore = memory_graph_store):
+        self._store = store
+        self.checked_out = 0
+        self.idle = 0
+
+    def acquire(self) -> MemoryAge:
+        self.checked_out += 1
+        return MemoryAge(self._store)
+
+    def release(self, ag: MemoryAge):
+        self.checked_out -= 1
+        ag.close()
+
+    @contextmanager
+    def connection(self) -> MemoryAge:
+        ag = self.acquire()
+        try:
+            yield ag
+        finally:
+            self.release(ag)
+
+
+# Cypher subset: WITH, UNWIND, MATCH, OPTIONAL MATCH, WHERE, MERGE, CREATE, SET, DELETE, DETACH DELETE, RETURN
+
+@dataclass(slots=True)
+class NodePattern:
+    var: str | None
+    label: str | None
+    properties: 'MapExpr | None'
+
+
+@dataclass(slots=True)
+class RelPattern:
+    var: str | None
+    label: str | None
+    properties: 'MapExpr | None'
+    outgoing: bool
+
+
+@dataclass(slots=True)
+class Literal:
+    value: Any
+
+
+@dataclass(slots=True)
+class Var:
+    name: str
+
+
+@dataclass(slots=True)
+class Property:
+    subject: Any
+    key: str
+
+
+@dataclass(slots=True)
+class ListExpr:
+    items: list
+
+
+@dataclass(slots=True)
+class MapExpr:
+    items: dict[str, Any]
+
+
+@dataclass(slots=True)
+class BinaryOp:
+    op: str
+    left: Any
+    right: Any
+
+
+@dataclass(slots=True)
+class Not:
+    operand: Any
+
+
+@dataclass(slots=True)
+class Exists:
+    patterns: list[list]
+
+
+@dataclass(slots=True)
+class Clause:
+    kind: str
+    items: list = field(default_factory=list)
+    where: Any = None
+    alias: str | None = None
+    limit: Any = None
+
+
+_TOKEN = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.)*")
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<name>[A-Za-z_][A-Za-z_0-9]*|`[^`]+`)
+    |(?P<op><-|->|<>|<=|>=|[()\[\]{}:,.\-+=<>*;])
+    """,
+    re.VERBOSE
+)
+_ESCAPE = re.compile(r"\\(.)|''")
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+_CLAUSES = {'WITH', 'UNWIND', 'MATCH', 'OPTIONAL', 'MERGE', 'CREATE', 'SET', 'DELETE', 'DETACH', 'RETURN'}
+
+
+class CypherParser:
+    def __init__(self, query: str):
+        self._query = query
+        self._tokens = self._tokenize(query)
+        self._position = 0
+
+    def parse(self) -> list[Clause]:
+        clauses = []
+        while self._peek() is not None:
+            if self._accept_op(';'):
+                continue
+            clauses.append(self._clause())
+        return clauses
+
+    def _tokenize(self, query: str) -> list[tuple[str, Any]]:
+        tokens = []
+        position = 0
+        while position < len(query):
+            match = _TOKEN.match(query, position)
+            if match is None:
+                raise UnsupportedCypher(query[position:position + 50], 'unexpected character')
+            position = match.end()
+            kind = match.lastgroup
+            text = match.group()
+            match kind:
+                case 'space':
+                    continue
+                case 'string':
+                    tokens.append(('string', _unquote(text)))
+                case 'number':
+                    tokens.append(('number', float(text) if '.' in text else int(text)))
+                case 'name':
+                    tokens.append(('name', text.strip('`')))
+                case _:
+                    tokens.append(('op', text))
+        return tokens
+
+    def _peek(self, offset: int = 0) -> tuple[str, Any] | None:
+        position = self._position + offset
+        return self._tokens[position] if position < len(self._tokens) else None
+
+    def _next(self) -> tuple[str, Any]:
+        token = self._peek()
+        if token is None:
+            raise UnsupportedCypher(self._query[-50:], 'unexpected end of query')
+        self._position += 1
+        return token
+
+    def _is_keyword(self, keyword: str, offset: int = 0) -> bool:
+        token = self._peek(offset)
+        return token is not None and token[0] == 'name' and token[1].upper() == keyword
+
+    def _accept_keyword(self, keyword: str) -> bool:
+        if self._is_keyword(keyword):
+            self._position += 1
+            return True
+        return False
+
+    def _expect_keyword(self, keyword: str):
+        if not self._accept_keyword(keyword):
+            raise UnsupportedCypher(str(self._peek()), f'{keyword} was expected')
+
+    def _accept_op(self, op: str) -> bool:
+        token = self._peek()
+        if token is not None and token == ('op', op):
+            self._position += 1
+            return True
+        return False
+
+    def _expect_op(self, op: str):
+        if not self._accept_op(op):
+            raise UnsupportedCypher(str(self._peek()), f'{op} was expected')
+
+    def _name(self) -> str:
+        kind, value = self._next()
+        if kind != 'name':
+            raise UnsupportedCypher(str(value), 'a name was expected')
+        return value
+
+    def _clause(self) -> Clause:
+        keyword = self._name().upper()
+        match keyword:
+            case 'WITH' | 'RETURN':
+                clause = Clause(keyword, self._projections())
+                if keyword == 'WITH' and self._accept_keyword('WHERE'):
+                    clause.where = self._expression()
+                if self._accept_keyword('LIMIT'):
+                    clause.limit = self._expression()
+                return clause
+            case 'UNWIND':
+                expression = self._expression()
+                self._expect_keyword('AS')
+                return Clause(keyword, [expression], alias=self._name())
+            case 'OPTIONAL':
+                self._expect_keyword('MATCH')
+                return self._match_clause('OPTIONAL MATCH')
+            case 'MATCH':
+                return self._match_clause(keyword)
+            case 'MERGE':
+                return Clause(keyword, [self._pattern()])
+            case 'CREATE':
+                return Clause(keyword, self._patterns())
+            case 'SET':
+                items = [self._set_item()]
+                while self._accept_op(','):
+                    items.append(self._set_item())
+                return Clause(keyword, items)
+            case 'DETACH' | 'DELETE':
+                if keyword == 'DETACH':
+                    self._expect_keyword('DELETE')
+                items = [self._expression()]
+                while self._accept_op(','):
+                    items.append(self._expression())
+                return Clause(keyword, items)
+            case _:
+                raise UnsupportedCypher(keyword, 'unsupported clause')
+
+    def _match_clause(self, kind: str) -> Clause:
+        clause = Clause(kind, self._patterns())
+        if self._accept_keyword('WHERE'):
+            clause.where = self._expression()
+        return clause
+
+    def _projections(self) -> list[tuple[Any, str]]:
+        projections = []
+        while True:
+            start = self._position
+            expression = self._expression()
+            if self._accept_keyword('AS'):
+                alias = self._name()
+            elif isinstance(expression, Var):
+                alias = expression.name
+            else:
+                alias = ' '.join(str(value) for _, value in self._tokens[start:self._position])
+            projections.append((expression, alias))
+            if not self._accept_op(','):
+                return projections
+
+    def _set_item(self) -> tuple[str, str, Any]:
+        var = self._name()
+        self._expect_op('.')
+        key = self._name()
+        self._expect_op('=')
+        return var, key, self._expression()
+
+    def _patterns(self) -> list[list]:
+        patterns = [self._pattern()]
+        while self._accept_op(','):
+            patterns.append(self._pattern())
+        return patterns
+
+    def _pattern(self) -> list:
+        path = [self._node_pattern()]
+        while True:
+            if self._accept_op('-'):
+                outgoing = True
+            elif self._accept_op('<-'):
+                outgoing = False
+            else:
+                return path
+
+            var, label, properties = self._element('[', ']')
+            if outgoing:
+                self._expect_op('->')
+            else:
+                self._expect_op('-')
+            path.append(RelPattern(var, label, properties, outgoing))
+            path.append(self._node_pattern())
+
+    def _node_pattern(self) -> NodePattern:
+        return NodePattern(*self._element('(', ')'))
+
+    def _element(self, opening: str, closing: str) -> tuple[str | None, str | None, MapExpr | None]:
+        self._expect_op(opening)
+        var = label = properties = None
+        if self._peek() is not None and self._peek()[0] == 'name':
+            var = self._name()
+        if self._accept_op(':'):
+            label = self._name()
+        if self._peek() == ('op', '{'):
+            properties = self._primary()
+        self._expect_op(closing)
+        return var, label, properties
+
+    def _expression(self) -> Any:
+        left = self._and()
+        while self._accept_keyword('OR'):
+            left = BinaryOp('OR', left, self._and())
+        return left
+
+    def _and(self) -> Any:
+        left = self._not()
+        while self._accept_keyword('AND'):
+            left = BinaryOp('AND', left, self._not())
+        return left
+
+    def _not(self) -> Any:
+        if self._accept_keyword('NOT'):
+            return Not(self._not())
+        return self._comparison()
+
+    def _comparison(self) -> Any:
+        left = self._additive()
+        while True:
+            token = self._peek()
+            if token in (('op', '='), ('op', '<>'), ('op', '<'), ('op', '>'), ('op', '<='), ('op', '>=')):
+                self._position += 1
+                left = BinaryOp(token[1], left, self._additive())
+            elif self._accept_keyword('IN'):
+                left = BinaryOp('IN', left, self._additive())
+            else:
+                return left
+
+    def _additive(self) -> Any:
+        left = self._postfix()
+        while True:
+            if self._accept_op('+'):
+                left = BinaryOp('+', left, self._postfix())
+            elif self._peek() == ('op', '-') and self._peek(1) != ('op', '['):
+                self._position += 1
+                left = BinaryOp('-', left, self._postfix())
+            else:
+                return left
+
+    def _postfix(self) -> Any:
+        expression = self._primary()
+        while self._accept_op('.'):
+            expression = Property(expression, self._name())
+        return expression
+
+    def _primary(self) -> Any:
+        kind, value = self._next()
+        match kind, value:
+            case 'string' | 'number', _:
+                return Literal(value)
+            case 'op', '[':
+                items = []
+                if not self._accept_op(']'):
+                    items.append(self._expression())
+                    while self._accept_op(','):
+                        items.append(self._expression())
+                    self._expect_op(']')
+                return ListExpr(items)
+            case 'op', '{':
+                items = {}
+                if not self._accept_op('}'):
+                    while True:
+                        key = self._name()
+                        self._expect_op(':')
+                        items[key] = self._expression()
+                        if not self._accept_op(','):
+                            break
+                    self._expect_op('}')
+                return MapExpr(items)
+            case 'op', '(':
+                expression = self._expression()
+                self._expect_op(')')
+                return expression
+            case 'op', '-':
+                return BinaryOp('-', Literal(0), self._postfix())
+            case 'name', _:
+                match value.upper():
+                    case 'TRUE':
+                        return Literal(True)
+                    case 'FALSE':
+                        return Literal(False)
+                    case 'NULL':
+                        return Literal(None)
+                    case 'EXISTS' if self._peek() == ('op', '('):
+                        self._expect_op('(')
+                        patterns = self._patterns()
+                        self._expect_op(')')
+                        return Exists(patterns)
+                return Var(value)
+        raise UnsupportedCypher(str(value), 'unexpected token')
+
+
+class CypherExecutor:
+    def __init__(self, graph: MemoryGraph, journal: list[Callable]):
+        self._graph = graph
+        self._journal = journal
+
+    def execute(self, query: list[Clause]) -> list[tuple]:
+        rows: list[dict[str, Any]] = [{}]
+        for clause in query:
+            match clause.kind:
+                case 'WITH':
+                    rows = [self._project(clause.items, row) for row in rows]
+                    if clause.where is not None:
+                        rows = [row for row in rows if self._evaluate(clause.where, row)]
+                    rows = self._limit(clause, rows)
+                case 'UNWIND':
+                    rows = [
+                        {**row, clause.alias: item}
+                        for row in rows
+                        for item in (self._evaluate(clause.items[0], row) or ())
+                    ]
+                case 'MATCH' | 'OPTIONAL MATCH':
+                    rows = self._match(clause, rows)
+                case 'MERGE':
+                    rows = [merged for row in rows for merged in self._merge(clause.items[0], row)]
+                case 'CREATE':
+                    rows = [dict(row) for row in rows]
+                    for row in rows:
+                        for pattern in clause.items:
+                            self._create(pattern, row)
+                case 'SET':
+                    for row in rows:
+                        for var, key, expression in clause.items:
+                            entity = row.get(var)
+                            if entity is not None:
+                                self._graph.set_property(entity, key, self._evaluate(expression, row), self._journal)
+                case 'DELETE' | 'DETACH':
+                    for row in rows:
+                        for expression in clause.items:
+                            self._delete(self._evaluate(expression, row), clause.kind == 'DETACH')
+                case 'RETURN':
+                    rows = self._limit(clause, rows)
+                    return [tuple(self._evaluate(expression, row) for expression, _ in clause.items) for row in rows]
+        return []
+
+    def _project(self, projections: list[tuple[Any, str]], row: dict[str, Any]) -> dict[str, Any]:
+        return {alias: self._evaluate(expression, row) for expression, alias in projections}
+
+    def _limit(self, clause: Clause, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if clause.limit is None:
+            return rows
+        return rows[:self._evaluate(clause.limit, {})]
+
+    def _match(self, clause: Clause, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        matched_rows = []
+        for row in rows:
+            matches = [row]
+            for pattern in clause.items:
+                matches = [
+                    matched for match in matches for matched in self._match_path(pattern, match, clause.where)
+                ]
+            if clause.where is not None:
+                matches = [match for match in matches if self._evaluate(clause.where, match)]
+
+            if matches:
+                matched_rows.extend(matches)
+            elif clause.kind == 'OPTIONAL MATCH':
+                matched_rows.append({**row, **{var: None for var in _pattern_vars(clause.items) if var not in row}})
+        return matched_rows
+
+    def _match_path(self, path: list, row: dict[str, Any], where: Any = None) -> Iterator[dict[str, Any]]:
+        first = path[0]
+        for node in self._node_candidates(first, row, where):
+            yield from self._extend_path(path, 1, node, row if first.var is None else {**row, first.var: node})
+
+    def _extend_path(self, path: list, ndx: int, node: Node, row: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        if ndx >= len(path):
+            yield row
+            return
+
+        rel, next_pattern = path[ndx], path[ndx + 1]
+        rel_properties = self._evaluate(rel.properties, row) if rel.properties else {}
+        edge_ids = self._graph.out_edges[node.id] if rel.outgoing else self._graph.in_edges[node.id]
+        for edge_id in list(edge_ids):
+            edge = self._graph.edges[edge_id]
+            if rel.label is not None and edge.label != rel.label:
+                continue
+            if not _has_properties(edge, rel_properties):
+                continue
+            if rel.var is not None and rel.var in row and row[rel.var] is not edge:
+                continue
+
+            next_node = self._graph.nodes[edge.end_id if rel.outgoing else edge.start_id]
+            if not self._node_matches(next_pattern, next_node, row):
+                continue
+
+            next_row = row
+            if rel.var is not None or next_pattern.var is not None:
+                next_row = dict(row)
+                if rel.var is not None:
+                    next_row[rel.var] = edge
+                if next_pattern.var is not None:
+                    next_row[next_pattern.var] = next_node
+            yield from self._extend_path(path, ndx + 2, next_node, next_row)
+
+    def _node_candidates(self, pattern: NodePattern, row: dict[str, Any], where: Any = None) -> Iterable[Node]:
+        if pattern.var is not None and pattern.var in row:
+            node = row[pattern.var]
+            return [node] if node is not None and self._node_matches(pattern, node, row) else []
+
+        properties = self._evaluate(pattern.properties, row) if pattern.properties else {}
+        if not properties and pattern.label is not None and pattern.var is not None:
+            # WHERE var.key IN [...] is answered from the property index instead of a label scan
+            for key, values_expression in _in_filters(where, pattern.var):
+                values = self._evaluate(values_expression, row)
+                if isinstance(values, list):
+                    return self._graph.find_nodes_by_values(pattern.label, key, values)
+        return self._graph.find_nodes(pattern.label, properties)
+
+    def _node_matches(self, pattern: NodePattern, node: Node, row: dict[str, Any]) -> bool:
+        if pattern.var is not None and pattern.var in row and row[pattern.var] is not node:
+            return False
+        if pattern.label is not None and node.label != pattern.label:
+            return False
+        return not pattern.properties or _has_properties(node, self._evaluate(pattern.properties, row))
+
+    def _merge(self, path: list, row: dict[str, Any]) -> list[dict[str, Any]]:
+        matches = list(self._match_path(path, row))
+        if matches:
+            return matches
+        return [self._create(path, dict(row))]
+
+    def _create(self, path: list, row: dict[str, Any]) -> dict[str, Any]:
+        nodes = []
+        for pattern in path[::2]:
+            node = row.get(pattern.var) if pattern.var is not None else None
+            if node is None:
+                if pattern.label is None:
+                    raise UnsupportedCypher(str(pattern), 'created nodes need a label')
+                properties = self._evaluate(pattern.properties, row) if pattern.properties else {}
+                node = self._graph.create_node(pattern.label, properties, self._journal)
+                if pattern.var is not None:
+                    row[pattern.var] = node
+            nodes.append(node)
+
+        for ndx, rel in enumerate(path[1::2]):
+            start, end = (nodes[ndx], nodes[ndx + 1]) if rel.outgoing else (nodes[ndx + 1], nodes[ndx])
+            properties = self._evaluate(rel.properties, row) if rel.properties else {}
+            edge = self._graph.create_edge(rel.label, start, end, properties, self._journal)
+            if rel.var is not None:
+                row[rel.var] = edge
+        return row
+
+    def _delete(self, entity: Node | Edge | None, detach: bool):
+        match entity:
+            case None:
+                return
+            case Node():
+                self._graph.delete_node(entity, detach, self._journal)
+            case Edge():
+                self._graph.delete_edge(entity, self._journal)
+            case _:
+                raise UnsupportedCypher(repr(entity), 'only nodes and relationships can be deleted')
+
+    def _evaluate(self, expression: Any, row: dict[str, Any]) -> Any:
+        match expression:
+            case Literal():
+                return expression.value
+            case Var():
+                try:
+                    return row[expression.name]
+                except KeyError:
+                    raise UnsupportedCypher(expression.name, 'variable is not defined')
+            case Property():
+                subject = self._evaluate(expression.subject, row)
+                if isinstance(subject, (Node, Edge)):
+                    return subject.properties.get(expression.key)
+                if isinstance(subject, dict):
+                    return subject.get(expression.key)
+                return None
+            case ListExpr():
+                return [self._evaluate(item, row) for item in expression.items]
+            case MapExpr():
+                return {key: self._evaluate(value, row) for key, value in expression.items.items()}
+            case Not():
+                return not self._evaluate(expression.operand, row)
+            case Exists():
+                return all(next(self._match_path(pattern, row), None) is not None for pattern in expression.patterns)
+            case BinaryOp():
+                return self._binary_op(expression, row)
+        raise UnsupportedCypher(repr(expression), 'unsupported expression')
+
+    def _binary_op(self, expression: BinaryOp, row: dict[str, Any]) -> Any:
+        if expression.op == 'AND':
+            return bool(self._evaluate(expression.left, row)) and bool(self._evaluate(expression.right, row))
+        if expression.op == 'OR':
+            return bool(self._evaluate(expression.left, row)) or bool(self._evaluate(expression.right, row))
+
+        left = self._evaluate(expression.left, row)
+        right = self._evaluate(expression.right, row)
+        if left is None or right is None:
+            return None
+        match expression.op:
+            case '+':
+                if isinstance(left, str) or isinstance(right, str):
+                    return f'{left}{right}'
+                return left + right
+            case '-':
+                return left - right
+            case '=':
+                return left == right
+            case '<>':
+                return left != right
+            case '<':
+                return left < right
+            case '>':
+                return left > right
+            case '<=':
+                return left <= right
+            case '>=':
+                return left >= right
+            case 'IN':
+                return left in right
+        raise UnsupportedCypher(expression.op, 'unsupported operator')
+
+
+def _pattern_vars(patterns: list[list]) -> list[str]:
+    return [element.var for pattern in patterns for element in pattern if element.var is not None]
+
+
+def _in_filters(where: Any, var: str) -> Iterator[tuple[str, Any]]:
+    match where:
+        case BinaryOp(op='AND'):
+            yield from _in_filters(where.left, var)
+            yield from _in_filters(where.right, var)
+        case BinaryOp(op='IN', left=Property(subject=Var(name=name), key=key)) if name == var:
+            yield key, where.right
+
+
+def _has_properties(entity: Node | Edge, properties: dict[str, Any]) -> bool:
+    return all(entity.properties.get(key) == value for key, value in properties.items())
+
+
+def _is_hashable(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+def _index_key(value: Any) -> tuple[type, Any]:
+    # True == 1 and hash(True) == hash(1), the type keeps them in separate buckets
+    return type(value), value
+
+
+def _quote(value: Any) -> str:
+    match value:
+        case None:
+            return 'NULL'
+        case bool():
+            return 'true' if value else 'false'
+        case int() | float():
+            return repr(value)
+        case str():
+            return "'" + value.replace('\\', '\\\\').replace("'", "''") + "'"
+        case list() | tuple():
+            return '[' + ','.join(map(_quote, value)) + ']'
+    raise UnsupportedCypher(repr(value), 'literal type is not supported')
+
+
+def _unquote(text: str) -> str:
+    return _ESCAPE.sub(lambda match: "'" if match.group(1) is None else _ESCAPES.get(match.group(1), match.group(1)), text[1:-1])
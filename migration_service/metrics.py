@@ -0,0 +1,92 @@
+import logging
+
+from contextlib import contextmanager
+
+from prometheus_client import Histogram, Gauge
+
+from migration_service.database import ag_pool, engine
+from migration_service.settings import settings
+from migration_service.tracing import tracer
+from migration_service.utils.memory_utils import start_stage, stop_stage, check_memory_soft_cap
+
+logger = logging.getLogger(__name__)
+
+
+STAGE_SECONDS = Histogram(
+    'graph_migrater_stage_seconds',
+    'Duration of the sync pipeline stages',
+    ['stage'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+STAGE_PEAK_BYTES = Histogram(
+    'graph_migrater_stage_peak_bytes',
+    'Peak traced memory growth during the sync pipeline stages',
+    ['stage'],
+    buckets=(2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28, 2 ** 30, 2 ** 32)
+)
+STAGE_RETAINED_BYTES = Histogram(
+    'graph_migrater_stage_retained_bytes',
+    'Traced memory retained after the sync pipeline stages',
+    ['stage'],
+    buckets=(0, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28, 2 ** 30, 2 ** 32)
+)
+CYPHER_SECONDS = Histogram(
+    'graph_migrater_cypher_seconds',
+    'Latency of the graph statements per query template',
+    ['template'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+BATCH_SIZE = Histogram(
+    'graph_migrater_batch_size',
+    'Records per apply batch per query template',
+    ['template'],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500)
+)
+CYPHER_PAYLOAD_BYTES = Histogram(
+    'graph_migrater_cypher_payload_bytes',
+    'Size of the graph statements per query template',
+    ['template'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+QUEUE_LAG_SECONDS = Histogram(
+    'graph_migrater_queue_lag_seconds',
+    'Time from the publish of a message to the start of its processing, messages without a publish time are skipped',
+    ['queue'],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+)
+IN_FLIGHT_REQUESTS = Gauge(
+    'graph_migrater_in_flight_requests',
+    'Message groups being processed',
+    ['queue']
+)
+POOL_CONNECTIONS = Gauge(
+    'graph_migrater_pool_connections',
+    'Connections of the AGE, migrations database and source pools',
+    ['pool', 'state']
+)
+
+POOL_CONNECTIONS.labels('age', 'checked_out').set_function(lambda: ag_pool.checked_out)
+POOL_CONNECTIONS.labels('age', 'idle').set_function(lambda: ag_pool.idle)
+POOL_CONNECTIONS.labels('migrations_db', 'checked_out').set_function(lambda: engine.sync_engine.pool.checkedout())
+POOL_CONNECTIONS.labels('migrations_db', 'idle').set_function(lambda: engine.sync_engine.pool.checkedin())
+SOURCE_CONNECTIONS = POOL_CONNECTIONS.labels('source', 'checked_out')
+
+
+@contextmanager
+def track_stage(stage: str, **attributes):
+    with tracer.start_as_current_span(stage, attributes=attributes) as span, STAGE_SECONDS.labels(stage).time():
+        if not settings.memory_accounting:
+            yield span
+            return
+
+        check_memory_soft_cap()
+        memory_stage = start_stage()
+        try:
+            yield span
+        finally:
+            peak, retained = stop_stage(memory_stage)
+            STAGE_PEAK_BYTES.labels(stage).observe(peak)
+            STAGE_RETAINED_BYTES.labels(stage).observe(max(retained, 0))
+            span.set_attributes({'memory.peak': peak, 'memory.retained': retained})
+            logger.info(f'Stage {stage} peak memory: {peak} bytes, retained memory: {retained} bytes')
+        check_memory_soft_cap(memory_stage[1])
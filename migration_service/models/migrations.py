@@ -2,8 +2,8 @@ import re
 
 from datetime import datetime
 
-from sqlalchemy import Column, BigInteger, String, DateTime, ForeignKey, Boolean
-from sqlalchemy.sql import func
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime, ForeignKey, Boolean, Float, JSON, UniqueConstraint
+from sqlalchemy.sql import func, expression
 from sqlalchemy.orm import relationship
 
 from migration_service.database import Base
@@ -18,13 +18,20 @@ class Migration(Base):
     guid = Column(String(36), nullable=False, index=True, unique=True)
     name = Column(String(110), nullable=False)
     db_source = Column(String(36), nullable=False)
+    ddl_high_water_mark = Column(BigInteger)
+    is_applied = Column(Boolean, nullable=False, default=False, server_default=expression.false())
+    # an interrupted apply is resumed with the pattern it started with, until it ran out of attempts
+    apply_pattern = Column(JSON)
+    resume_attempts = Column(Integer, nullable=False, default=0, server_default='0')
+    is_failed = Column(Boolean, nullable=False, default=False, server_default=expression.false())
 
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
     updated_at = Column(
         DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_onupdate=func.now()
     )
 
-    schemas = relationship('Schema')
+    # ordered so a migration compiles into the same batches every time it is applied
+    schemas = relationship('Schema', order_by='Schema.id')
     prev_migration = relationship('Migration', remote_side=[id], uselist=False, backref='next_migration')
 
 
@@ -34,7 +41,7 @@ class Schema(Base):
     id = Column(BigInteger, primary_key=True, autoincrement=True, nullable=False)
     migration_guid = Column(String(36), ForeignKey(Migration.guid))
     name = Column(String(110), nullable=False)
-    tables = relationship('Table')
+    tables = relationship('Table', order_by='Table.id')
 
 
 class Table(Base):
@@ -46,7 +53,7 @@ class Table(Base):
     old_name = Column(String(110))
     new_name = Column(String(110))
 
-    fields = relationship('Field')
+    fields = relationship('Field', order_by='Field.id')
 
     def fk_count(self, pattern: re.Pattern) -> int:
         count = 0
@@ -67,3 +74,32 @@ class Field(Base):
     old_type = Column(String(36))
     new_type = Column(String(36))
     is_key = Column(Boolean, default=False)
+
+
+class StatementTiming(Base):
+    __tablename__ = "statement_timings"
+
+    template_name = Column(String(110), primary_key=True)
+    statements = Column(BigInteger, nullable=False, default=0)
+    total_duration = Column(Float, nullable=False, default=0)
+
+
+class ApplyCheckpoint(Base):
+    __tablename__ = "apply_checkpoints"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True, nullable=False)
+    migration_guid = Column(String(36), ForeignKey(Migration.guid), nullable=False, index=True)
+    schema_name = Column(String(110), nullable=False)
+    phase = Column(String(36), nullable=False)
+    template_name = Column(String(110), nullable=False)
+    batch_index = Column(BigInteger, nullable=False)
+    digest = Column(String(64), nullable=False)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+
+    # a batch applied again replaces its checkpoint
+    __table_args__ = (
+        UniqueConstraint(
+            'migration_guid', 'schema_name', 'template_name', 'batch_index', name='uq_apply_checkpoints_batch'
+        ),
+    )
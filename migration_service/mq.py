@@ -1,5 +1,6 @@
 import logging
 import asyncio
+import time
 import pika
 
 from contextlib import asynccontextmanager
@@ -8,10 +9,13 @@ from pika.channel import Channel
 from pika.adapters.asyncio_connection import AsyncioConnection
 from pika.exceptions import ChannelClosedByClient, AMQPError
 
+from migration_service.errors import PublishNotConfirmed
 from migration_service.settings import settings
 
 logger = logging.getLogger(__name__)
 
+PUBLISHED_AT_HEADER = 'x-published-at'
+
 
 class PikaChannel:
     conn: AsyncioConnection | None = None
@@ -19,11 +23,36 @@ class PikaChannel:
     def __init__(self, channel: Channel):
         self._channel = channel
         self._close_callbacks = []
+        # delivery tag -> epoch seconds the message was published at, when the publisher recorded it
+        self.published_at: dict[int, float] = {}
+        # publish sequence number -> the future resolved by the broker's publisher confirm
+        self._unconfirmed: dict[int, asyncio.Future] | None = None
+        self._publish_seq = 0
         self._channel.add_on_close_callback(self._close_callback)
 
     def _close_callback(self, *args, **kwargs):
         for cbk in self._close_callbacks:
             cbk(*args, **kwargs)
+        if self._unconfirmed:
+            for seq, fut in self._unconfirmed.items():
+                if not fut.done():
+                    fut.set_exception(PublishNotConfirmed(seq, 'the channel was closed'))
+            self._unconfirmed.clear()
+
+    def _confirm_callback(self, frame):
+        method = frame.method
+        if method.multiple:
+            seqs = [seq for seq in self._unconfirmed if seq <= method.delivery_tag]
+        else:
+            seqs = [method.delivery_tag]
+        for seq in seqs:
+            fut = self._unconfirmed.pop(seq, None)
+            if fut is None or fut.done():
+                continue
+            if method.NAME == 'Basic.Ack':
+                fut.set_result(seq)
+            else:
+                fut.set_exception(PublishNotConfirmed(seq, 'the broker nacked it'))
 
     @staticmethod
     @asynccontextmanager
@@ -56,23 +85,60 @@ class PikaChannel:
         async with self.wait_for_callback('Queue.BindOk') as callback:
             self._channel.queue_bind(queue, exchange, routing_key, callback=callback)
 
+    async def basic_qos(self, prefetch_count: int):
+        async with self.wait_for_callback('Basic.QosOk') as callback:
+            self._channel.basic_qos(prefetch_count=prefetch_count, callback=callback)
+
+    async def confirm_delivery(self):
+        # publishes wait for the broker to take over the message, a message is acked only once its result is safe
+        async with self.wait_for_callback('Confirm.SelectOk') as callback:
+            self._channel.confirm_delivery(self._confirm_callback, callback=callback)
+        self._unconfirmed = {}
+
     async def basic_ack(self, delivery_tag: int):
         self._channel.basic_ack(delivery_tag)
 
     async def basic_reject(self, delivery_tag: int, requeue: bool):
         self._channel.basic_reject(delivery_tag, requeue=requeue)
 
-    async def basic_publish(self, exchange: str, routing_key: str, body: bytes):
-        self._channel.basic_publish(exchange, routing_key, body)
+    async def basic_publish(
+            self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties | None = None
+    ):
+        properties = properties or pika.BasicProperties()
+        published_at = time.time()
+        properties.timestamp = int(published_at)
+        properties.headers = {**(properties.headers or {}), PUBLISHED_AT_HEADER: published_at}
+        if self._unconfirmed is None:
+            self._channel.basic_publish(exchange, routing_key, body, properties)
+            return
+
+        self._publish_seq += 1
+        seq = self._publish_seq
+        fut = self._unconfirmed[seq] = asyncio.get_running_loop().create_future()
+        try:
+            self._channel.basic_publish(exchange, routing_key, body, properties)
+        except Exception:
+            self._unconfirmed.pop(seq, None)
+            raise
+        await fut
 
     async def consume(self, queue: str) -> bytes:
+        async for batch in self.consume_batches(queue):
+            for delivery_tag, body in batch:
+                yield delivery_tag, body
+
+    async def consume_batches(self, queue: str, max_size: int = 1, window: float = 0.0) -> list[tuple[int, bytes]]:
         loop = asyncio.get_running_loop()
         messages = asyncio.Queue()
-        self._channel.basic_consume(
-            queue,
-            on_message_callback=lambda _channel, method, _props, body: messages.put_nowait((method.delivery_tag, body)),
-            auto_ack=False
-        )
+
+        def on_message_callback(_channel, method, props, body):
+            # the header has sub-second precision, the AMQP timestamp of other publishers only seconds
+            published_at = (props.headers or {}).get(PUBLISHED_AT_HEADER, props.timestamp)
+            if published_at is not None:
+                self.published_at[method.delivery_tag] = published_at
+            messages.put_nowait((method.delivery_tag, body))
+
+        self._channel.basic_consume(queue, on_message_callback=on_message_callback, auto_ack=False)
 
         fut = loop.create_future()
 
@@ -85,9 +151,10 @@ class PikaChannel:
                 fut.set_exception(reason)
 
         self._close_callbacks.append(on_close_callback)
+        msg = None
         try:
             while True:
-                msg = asyncio.ensure_future(messages.get())
+                msg = msg or asyncio.ensure_future(messages.get())
                 await asyncio.wait([msg, fut], return_when=asyncio.FIRST_COMPLETED)
 
                 if fut.done():
@@ -96,12 +163,32 @@ class PikaChannel:
                         break
                     raise fut.exception()
 
-                delivery_tag, body = msg.result()
-                yield delivery_tag, body
+                batch = [msg.result()]
+                msg = None
+                deadline = loop.time() + window
+                while len(batch) < max_size:
+                    if not messages.empty():
+                        batch.append(messages.get_nowait())
+                        continue
+
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+
+                    msg = asyncio.ensure_future(messages.get())
+                    await asyncio.wait([msg, fut], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not msg.done():
+                        break
+                    batch.append(msg.result())
+                    msg = None
+
+                yield batch
 
         except AMQPError as amqp_err:
             logger.error(amqp_err)
         finally:
+            if msg:
+                msg.cancel()
             self._close_callbacks.remove(on_close_callback)
 
 
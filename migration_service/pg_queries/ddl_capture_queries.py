@@ -0,0 +1,72 @@
+create_ddl_capture_schema_query = "CREATE SCHEMA IF NOT EXISTS {schema}"
+
+create_ddl_change_log_query = """
+                              CREATE TABLE IF NOT EXISTS {schema}.ddl_change_log (
+                                  id bigserial PRIMARY KEY,
+                                  table_schema text NOT NULL,
+                                  table_name text NOT NULL,
+                                  command_tag text NOT NULL,
+                                  created_at timestamptz NOT NULL DEFAULT now()
+                              )
+"""
+
+create_ddl_capture_function_query = """
+                                    CREATE OR REPLACE FUNCTION {schema}.capture_ddl() RETURNS event_trigger
+                                    LANGUAGE plpgsql AS $$
+                                    DECLARE
+                                        obj record;
+                                    BEGIN
+                                        IF TG_EVENT = 'sql_drop' THEN
+                                            FOR obj IN
+                                                SELECT schema_name, object_name
+                                                FROM pg_event_trigger_dropped_objects()
+                                                WHERE object_type = 'table' AND NOT is_temporary
+                                            LOOP
+                                                INSERT INTO {schema}.ddl_change_log (table_schema, table_name, command_tag)
+                                                VALUES (obj.schema_name, obj.object_name, TG_TAG);
+                                                PERFORM pg_notify({channel}, obj.schema_name || '.' || obj.object_name);
+                                            END LOOP;
+                                        ELSE
+                                            FOR obj IN
+                                                SELECT n.nspname as schema_name, c.relname as object_name
+                                                FROM pg_event_trigger_ddl_commands() as cmd
+                                                JOIN pg_class as c ON c.oid = cmd.objid
+                                                JOIN pg_namespace as n ON n.oid = c.relnamespace
+                                                WHERE cmd.object_type = 'table' AND NOT cmd.in_extension
+                                            LOOP
+                                                INSERT INTO {schema}.ddl_change_log (table_schema, table_name, command_tag)
+                                                VALUES (obj.schema_name, obj.object_name, TG_TAG);
+                                                PERFORM pg_notify({channel}, obj.schema_name || '.' || obj.object_name);
+                                            END LOOP;
+                                        END IF;
+                                    END;
+                                    $$
+"""
+
+create_ddl_capture_triggers_query = """
+                                    DO $$
+                                    BEGIN
+                                        IF NOT EXISTS (
+                                            SELECT 1 FROM pg_event_trigger WHERE evtname = 'graph_migrater_ddl_command_end'
+                                        ) THEN
+                                            CREATE EVENT TRIGGER graph_migrater_ddl_command_end ON ddl_command_end
+                                            WHEN TAG IN ('CREATE TABLE', 'CREATE TABLE AS', 'SELECT INTO', 'ALTER TABLE')
+                                            EXECUTE FUNCTION {schema}.capture_ddl();
+                                        END IF;
+                                        IF NOT EXISTS (
+                                            SELECT 1 FROM pg_event_trigger WHERE evtname = 'graph_migrater_sql_drop'
+                                        ) THEN
+                                            CREATE EVENT TRIGGER graph_migrater_sql_drop ON sql_drop
+                                            EXECUTE FUNCTION {schema}.capture_ddl();
+                                        END IF;
+                                    END;
+                                    $$
+"""
+
+select_ddl_high_water_mark_query = "SELECT coalesce(max(id), 0) FROM {schema}.ddl_change_log"
+
+select_changed_tables_query = """
+                              SELECT DISTINCT table_schema, table_name
+                              FROM {schema}.ddl_change_log
+                              WHERE id > %s AND id <= %s AND {source_filter}
+"""
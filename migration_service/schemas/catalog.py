@@ -0,0 +1,155 @@
+import sys
+import threading
+
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Sequence
+
+
+class StringPool:
+    def __init__(self):
+        # id 0 stands for None, columnless tables and unmapped types
+        self.strings: list[str | None] = [None]
+        self._ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def intern(self, string: str | None) -> int:
+        if string is None:
+            return 0
+        try:
+            return self._ids[string]
+        except KeyError:
+            # catalogs sharing the pool fill on the event loop and on worker threads at once
+            with self._lock:
+                string_id = self._ids.get(string)
+                if string_id is None:
+                    self.strings.append(sys.intern(string))
+                    string_id = self._ids[string] = len(self.strings) - 1
+                return string_id
+
+    def id(self, string: str | None) -> int | None:
+        return 0 if string is None else self._ids.get(string)
+
+
+@dataclass(slots=True, frozen=True)
+class CatalogTable:
+    catalog: 'Catalog'
+    index: int
+
+    @property
+    def name_id(self) -> int:
+        return self.catalog.table_names[self.index]
+
+    @property
+    def name(self) -> str:
+        return self.catalog.pool.strings[self.name_id]
+
+    @property
+    def db(self) -> str:
+        return self.catalog.pool.strings[self.catalog.table_dbs[self.index]]
+
+    def field_ids(self) -> Iterator[tuple[int, int]]:
+        start, end = self.catalog.slice(self.index)
+        return zip(self.catalog.column_names[start:end], self.catalog.column_types[start:end])
+
+    def fields(self) -> Iterator[tuple[str, str | None]]:
+        strings = self.catalog.pool.strings
+        return ((strings[name_id], strings[type_id]) for name_id, type_id in self.field_ids())
+
+    def __len__(self) -> int:
+        start, end = self.catalog.slice(self.index)
+        return end - start
+
+
+# tables and their columns as interned ids in flat arrays, a table is a slice of the column arrays,
+# catalogs diffed against each other have to share their string pool
+class Catalog:
+    def __init__(self, pool: StringPool | None = None):
+        self.pool = pool if pool is not None else StringPool()
+        self.table_names = array('I')
+        self.table_dbs = array('I')
+        self.column_names = array('I')
+        self.column_types = array('I')
+        self._name_id_to_table: dict[int, int] = {}
+        self._column_tables = array('I')
+        self._offsets: array | None = None
+
+    @classmethod
+    def from_records(cls, records: Iterable[Sequence[str | None]], pool: StringPool | None = None) -> 'Catalog':
+        catalog = cls(pool)
+        for db, table_name, field_name, field_type in records:
+            catalog.add(db, table_name, field_name, field_type)
+        return catalog
+
+    def add(self, db: str, table_name: str, field_name: str | None, field_type: str | None):
+        name_id = self.pool.intern(table_name)
+        table_index = self._name_id_to_table.get(name_id)
+        if table_index is None:
+            table_index = self._name_id_to_table[name_id] = len(self.table_names)
+            self.table_names.append(name_id)
+            self.table_dbs.append(self.pool.intern(db))
+
+        if field_name is not None:
+            self._column_tables.append(table_index)
+            self.column_names.append(self.pool.intern(field_name))
+            self.column_types.append(self.pool.intern(field_type))
+            self._offsets = None
+
+    def __len__(self) -> int:
+        return len(self.table_names)
+
+    def __iter__(self) -> Iterator[CatalogTable]:
+        return (CatalogTable(self, table_index) for table_index in range(len(self.table_names)))
+
+    @property
+    def columns(self) -> int:
+        return len(self.column_names)
+
+    def get(self, table_name: str) -> CatalogTable | None:
+        name_id = self.pool.id(table_name)
+        return None if name_id is None else self.get_by_id(name_id)
+
+    def get_by_id(self, name_id: int) -> CatalogTable | None:
+        table_index = self._name_id_to_table.get(name_id)
+        return None if table_index is None else CatalogTable(self, table_index)
+
+    def slice(self, table_index: int) -> tuple[int, int]:
+        if self._offsets is None:
+            self._layout()
+        return self._offsets[table_index], self._offsets[table_index + 1]
+
+    def _layout(self):
+        # counting sort of the columns by table, rows may arrive interleaved
+        offsets = array('I', bytes(4 * (len(self.table_names) + 1)))
+        for table_index in self._column_tables:
+            offsets[table_index + 1] += 1
+        for table_index in range(len(self.table_names)):
+            offsets[table_index + 1] += offsets[table_index]
+
+        if any(
+                self._column_tables[ndx] > self._column_tables[ndx + 1]
+                for ndx in range(len(self._column_tables) - 1)
+        ):
+            positions = offsets[:-1]
+            column_names = array('I', bytes(4 * len(self.column_names)))
+            column_types = array('I', bytes(4 * len(self.column_types)))
+            for table_index, name_id, type_id in zip(self._column_tables, self.column_names, self.column_types):
+                position = positions[table_index]
+                column_names[position] = name_id
+                column_types[position] = type_id
+                positions[table_index] = position + 1
+            self.column_names = column_names
+            self.column_types = column_types
+            self._column_tables = array(
+                'I',
+                (
+                    table_index
+                    for table_index in range(len(self.table_names))
+                    for _ in range(offsets[table_index + 1] - offsets[table_index])
+                )
+            )
+
+        self._offsets = offsets
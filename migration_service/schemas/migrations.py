@@ -5,16 +5,34 @@ from typing import List, Dict
 
 from pydantic import BaseModel
 
+from migration_service.settings import SourceFilter
 from migration_service.schemas.tables import HubToCreate, SatToCreate, LinkToCreate, TableToCreate, TableToAlter
 
 logger = logging.getLogger(__name__)
 
 
+class MigrationObject(BaseModel):
+    name: str | None = None
+    db_path: str | None = None
+
+    @property
+    def table_name(self) -> str:
+        return self.db_path.split('.', maxsplit=2)[2] if self.db_path else self.name
+
+
 class MigrationIn(BaseModel):
     name: str
     conn_string: str
     object_name: str | None = None
     object_db_path: str | None = None
+    objects: List[MigrationObject] = []
+    source_filter: SourceFilter | None = None
+
+    @property
+    def migration_objects(self) -> List[MigrationObject]:
+        if self.object_name or self.object_db_path:
+            return [MigrationObject(name=self.object_name, db_path=self.object_db_path), *self.objects]
+        return self.objects
 
 
 class SchemaOut(BaseModel):
@@ -60,3 +78,30 @@ class ApplySchema(BaseModel):
 class ApplyMigration(BaseModel):
     db_source: str
     schemas: list[ApplySchema] = []
+
+
+class PhasePlan(BaseModel):
+    name: str
+    tables: int = 0
+    batches: int = 0
+    statements: int = 0
+    nodes_to_create: int = 0
+    nodes_to_delete: int = 0
+    edges_to_create: int = 0
+    properties_to_set: int = 0
+    estimated_duration: float = 0
+    unestimated_statements: int = 0
+
+
+class SchemaPlan(BaseModel):
+    name: str
+    phases: list[PhasePlan] = []
+
+
+class MigrationPlan(BaseModel):
+    guid: str
+    db_source: str
+    schemas: list[SchemaPlan] = []
+    statements: int = 0
+    estimated_duration: float = 0
+    unestimated_statements: int = 0
@@ -1,6 +1,5 @@
 import re
 
-from dataclasses import dataclass, field
 from typing import Iterable
 
 from pydantic import BaseModel
@@ -10,16 +9,6 @@ from migration_service.utils.migration_utils import get_highest_table_similarity
 from migration_service.errors import MoreThanTwoFieldsMatchFKPattern
 
 
-@dataclass(slots=True, frozen=True)
-class Table:
-    name: str
-    db: str
-    field_to_type: dict[str, str] = field(default_factory=dict)
-
-    def __hash__(self):
-        return hash((self.name, self.db, self.field_to_type))
-
-
 class TableToCreate(BaseModel):
     name: str
     db: str
@@ -0,0 +1,110 @@
+import json
+import asyncio
+import logging
+
+import psycopg
+
+from psycopg import sql
+from pika import BasicProperties, DeliveryMode
+
+from migration_service.mq import create_channel, PikaChannel
+from migration_service.services.metadata_extractor import PostgresExtractor
+from migration_service.services.migration_request_lifespan import MigrationLane
+from migration_service.settings import settings, ListenedSource
+
+logger = logging.getLogger(__name__)
+
+
+async def listen_ddl_changes(source: ListenedSource):
+    db_source = source.conn_string.rsplit('/', maxsplit=1)[1]
+    while True:
+        try:
+            logger.info(f'Starting DDL listener of {db_source}')
+            async with await psycopg.AsyncConnection.connect(source.conn_string) as conn:
+                await PostgresExtractor(source.conn_string).install_ddl_capture(conn)
+
+            async with await psycopg.AsyncConnection.connect(source.conn_string, autocommit=True) as conn, \
+                    create_channel() as channel:
+                await conn.execute(sql.SQL('LISTEN {}').format(sql.Identifier(settings.ddl_notify_channel)))
+
+                payloads = asyncio.Queue()
+                reader = asyncio.create_task(_read_notifies(conn, payloads))
+                try:
+                    while True:
+                        changed_tables = await _debounce(payloads)
+                        await _enqueue_migration_request(source, db_source, changed_tables, channel)
+                finally:
+                    reader.cancel()
+        except Exception as e:
+            logger.exception(f'DDL listener of {db_source} failed: {e}')
+
+        await asyncio.sleep(5)
+
+
+async def _read_notifies(conn: psycopg.AsyncConnection, payloads: asyncio.Queue):
+    try:
+        async for notify in conn.notifies():
+            payloads.put_nowait(notify.payload)
+    finally:
+        # wakes the debouncer up so that the listener reconnects
+        payloads.put_nowait(None)
+
+
+async def _debounce(payloads: asyncio.Queue) -> set[str]:
+    loop = asyncio.get_running_loop()
+
+    payload = await payloads.get()
+    if payload is None:
+        raise ConnectionError('Notification connection was closed')
+
+    changed_tables = {payload}
+    deadline = loop.time() + settings.ddl_listener_max_delay
+    while True:
+        timeout = min(settings.ddl_listener_debounce, deadline - loop.time())
+        if timeout <= 0:
+            break
+        try:
+            payload = await asyncio.wait_for(payloads.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if payload is None:
+            payloads.put_nowait(None)
+            break
+        changed_tables.add(payload)
+    return changed_tables
+
+
+async def _enqueue_migration_request(
+        source: ListenedSource, db_source: str, changed_tables: set[str], channel: PikaChannel
+):
+    source_filter = source.source_filter or settings.source_filter
+    objects = [
+        {'name': None, 'db_path': f'{db_source}.{changed_table}'}
+        for changed_table in sorted(changed_tables)
+        if source_filter.matches(*changed_table.split('.', maxsplit=1))
+    ]
+    if not objects:
+        return
+
+    logger.info(f'DDL changed {len(objects)} tables of {db_source}, enqueueing migration request')
+    migration_request = {
+        'name': f'ddl sync of {db_source}'[:110],
+        'conn_string': source.conn_string,
+        'object_name': None,
+        'object_db_path': None,
+        'objects': objects,
+        'source_filter': source.source_filter.dict() if source.source_filter else None,
+        'migration_pattern': source.migration_pattern,
+        'source_guid': source.source_guid,
+        'source_name': source.source_name,
+        'object_guid': None,
+        'model': source.model,
+        'sync_type': source.sync_type,
+        'identity_id': None
+    }
+    await channel.basic_publish(
+        exchange=settings.migration_exchange,
+        routing_key=MigrationLane.OBJECT.value,
+        body=json.dumps(migration_request).encode(),
+        properties=BasicProperties(delivery_mode=DeliveryMode.Persistent)
+    )
@@ -1,13 +1,36 @@
+import asyncio
+import logging
 import psycopg
-import base64
 
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime
+from uuid import UUID
+
+from bson import Binary, Decimal128, Int64, ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import uri_parser
+from pymongo.errors import ExecutionTimeout
+
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+from migration_service.metrics import SOURCE_CONNECTIONS
+from migration_service.schemas.catalog import Catalog, StringPool
+from migration_service.pg_queries.ddl_capture_queries import (
+    create_ddl_capture_schema_query, create_ddl_change_log_query, create_ddl_capture_function_query,
+    create_ddl_capture_triggers_query, select_ddl_high_water_mark_query, select_changed_tables_query
+)
+from migration_service.settings import settings, SourceFilter
+
+logger = logging.getLogger(__name__)
 
 
 class MetadataExtractor(ABC):
     @abstractmethod
-    def __init__(self, conn_string: str):
+    def __init__(self, conn_string: str, source_filter: SourceFilter | None = None):
         self._conn_string = conn_string
+        self._source_filter = source_filter or settings.source_filter
 
     @property
     def conn_string(self):
@@ -22,17 +45,32 @@ class MetadataExtractor(ABC):
         ...
 
     @abstractmethod
-    async def extract_table_col_type(self, table_names: set[str], ns: str) -> tuple[str, str]:
+    async def extract_table_col_type(self, table_names: set[str], ns: str, pool: StringPool | None = None) -> Catalog:
         ...
 
     @abstractmethod
     async def extract_table_count(self) -> int:
         ...
 
+    # tables the source filter keeps out are neither extracted nor diffed against the graph
+    def is_filtered_in(self, schema: str, table: str) -> bool:
+        return self._source_filter.matches(schema, table)
+
+    # returns the DDL change-log high-water mark and the tables changed after since,
+    # None instead of the tables means that every table has to be diffed
+    async def extract_ddl_changes(self, since: int | None) -> tuple[int | None, dict[str, set[str]] | None]:
+        return None, None
+
 
 class PostgresExtractor(MetadataExtractor):
-    def __init__(self, conn_string: str):
-        super().__init__(conn_string)
+    _ddl_capture_installed: set[str] = set()
+    # one pool per source, its size caps the reads a sync runs concurrently against the source
+    _conn_string_to_pool: dict[str, AsyncConnectionPool] = {}
+    # pg_type oid -> system type, domains resolved to their base type, scanned once per source
+    _conn_string_to_oid_to_system_type: dict[str, dict[int, str]] = {}
+
+    def __init__(self, conn_string: str, source_filter: SourceFilter | None = None):
+        super().__init__(conn_string, source_filter)
         self._postgres_to_system_types = {
             'boolean': 'bool',
 
@@ -57,128 +95,367 @@ class PostgresExtractor(MetadataExtractor):
 
             'jsonb': 'json',
             'xml': 'xml',
+
+            'bytea': 'b64binary',
             'ARRAY': 'list'
         }
 
     async def extract_table_names(self) -> dict[str, set[str]]:
-        async with await psycopg.AsyncConnection.connect(self._conn_string) as conn:
+        async with self._connect() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    """
-                    select table_schema, table_name
-                    from information_schema.tables
-                    where table_schema = 'dv_raw' 
-                    and table_type = 'BASE TABLE' 
-                    and table_schema not in ('pg_catalog', 'information_schema');
-                    """
+                    sql.SQL(
+                        """
+                        select table_schema, table_name
+                        from information_schema.tables
+                        where {source_filter} 
+                        and table_type = 'BASE TABLE' 
+                        and table_schema not in ('pg_catalog', 'information_schema');
+                        """
+                    ).format(source_filter=self._source_filter_sql())
                 )
                 result = await cursor.fetchall()
-                ns_to_tables: dict[str, set[str]] = {}
-                db_source = self._conn_string.rsplit('/', maxsplit=1)[1]
-
-                for res in result:
-                    table_schema, table_name = res
-                    ns = f'{db_source}.{table_schema}'
-                    try:
-                        ns_to_tables[ns].add(table_name)
-                    except KeyError:
-                        ns_to_tables[ns] = {table_name}
-                return ns_to_tables
+                return self._to_ns_to_tables(result)
 
     async def extract_table_name(self, table_name: str, db_path: str | None) -> dict[str, set[str]]:
         if db_path:
             source, schema, name = db_path.split('.', maxsplit=2)
         else:
             source, schema, name = None, None, table_name
-        async with await psycopg.AsyncConnection.connect(self._conn_string) as conn:
+        async with self._connect() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    """
-                    select table_schema, table_name
-                    from information_schema.tables
-                    where table_schema = 'dv_raw' and table_name = %s;
-                    """,
-                    (name, )
+                    sql.SQL(
+                        """
+                        select table_schema, table_name
+                        from information_schema.tables
+                        where {source_filter} and table_name = %s and (%s::text is null or table_schema = %s);
+                        """
+                    ).format(source_filter=self._source_filter_sql()),
+                    (name, schema, schema)
                 )
                 result = await cursor.fetchall()
-                ns_to_tables: dict[str, set[str]] = {}
-                db_source = self._conn_string.rsplit('/', maxsplit=1)[1]
-
-                for res in result:
-                    table_schema, table_name = res
-                    ns = f'{db_source}.{table_schema}'
-                    try:
-                        ns_to_tables[ns].add(table_name)
-                    except KeyError:
-                        ns_to_tables[ns] = {table_name}
+                ns_to_tables = self._to_ns_to_tables(result)
 
                 if not ns_to_tables and source and schema:
                     ns_to_tables[f'{source}.{schema}'] = set()
                 return ns_to_tables
 
-    async def extract_table_col_type(self, table_names: set[str], ns: str) -> list[tuple[str, str, str, str]]:
-        async with await psycopg.AsyncConnection.connect(self._conn_string) as conn:
+    async def extract_table_col_type(self, table_names: set[str], ns: str, pool: StringPool | None = None) -> Catalog:
+        async with self._connect() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    "SELECT CONCAT(tabs.table_schema, '.', tabs.table_name) as full_name, tabs.table_name, cols.column_name, cols.data_type "
-                    "FROM information_schema.tables as tabs "
-                    "LEFT OUTER JOIN information_schema.columns as cols "
-                    "ON tabs.table_name = cols.table_name "
-                    "WHERE tabs.table_name = ANY(%s) "
-                    "AND tabs.table_type = 'BASE TABLE' "
-                    "AND tabs.table_schema = %s "
-                    "ORDER BY full_name",
+                    "SELECT CONCAT(nsp.nspname, '.', tabs.relname) as full_name, tabs.relname, cols.attname, cols.atttypid "
+                    "FROM pg_catalog.pg_class as tabs "
+                    "JOIN pg_catalog.pg_namespace as nsp "
+                    "ON nsp.oid = tabs.relnamespace "
+                    "LEFT OUTER JOIN pg_catalog.pg_attribute as cols "
+                    "ON cols.attrelid = tabs.oid AND cols.attnum > 0 AND NOT cols.attisdropped "
+                    "WHERE tabs.relname = ANY(%s) "
+                    "AND tabs.relkind IN ('r', 'p') "
+                    "AND nsp.nspname = %s "
+                    "ORDER BY full_name, cols.attnum",
                     (list(table_names), ns)
                 )
-                records = await cursor.fetchall()
-                result = []
-                for row in records:
-                    system_type = self.from_db_type_to_system_type(row[-1])
-                    result.append((row[0], row[1], row[2], system_type))
-        return result
+                oid_to_system_type = await self._get_oid_to_system_type(conn)
+                catalog = Catalog(pool)
+                async for row in cursor:
+                    if row[3] is not None and row[3] not in oid_to_system_type:
+                        # a type created since the types were scanned
+                        oid_to_system_type = await self._get_oid_to_system_type(conn, refresh=True)
+                    catalog.add(row[0], row[1], row[2], oid_to_system_type.get(row[3]))
+        return catalog
 
     async def extract_table_count(self) -> int:
-        async with await psycopg.AsyncConnection.connect(self._conn_string) as conn:
+        async with self._connect() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
-                    """
-                    select count(*)
-                    from information_schema.tables
-                    where table_schema = 'dv_raw';
-                    """,
+                    sql.SQL(
+                        """
+                        select count(*)
+                        from information_schema.tables
+                        where {source_filter};
+                        """
+                    ).format(source_filter=self._source_filter_sql())
                 )
                 result = await cursor.fetchall()
                 return result[0][0]
 
-    def from_db_type_to_system_type(self, var: str) -> str:
-        system_type = self._postgres_to_system_types.get(var, '')
+    async def extract_ddl_changes(self, since: int | None) -> tuple[int | None, dict[str, set[str]] | None]:
+        schema = sql.Identifier(settings.ddl_capture_schema)
+        async with self._connect() as conn:
+            if self._conn_string not in self._ddl_capture_installed:
+                await self.install_ddl_capture(conn)
 
-        if (system_type == 'str' or system_type == 'text') and self.is_b64(var):
-            system_type = 'b64binary'
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql.SQL(select_ddl_high_water_mark_query).format(schema=schema))
+                high_water_mark = (await cursor.fetchone())[0]
+                if since is None:
+                    return high_water_mark, None
 
-        return system_type
+                await cursor.execute(
+                    sql.SQL(select_changed_tables_query).format(schema=schema, source_filter=self._source_filter_sql()),
+                    (since, high_water_mark)
+                )
+                result = await cursor.fetchall()
+                return high_water_mark, self._to_ns_to_tables(result)
+
+    async def install_ddl_capture(self, conn: psycopg.AsyncConnection):
+        schema = sql.Identifier(settings.ddl_capture_schema)
+        channel = sql.Literal(settings.ddl_notify_channel)
+        async with conn.cursor() as cursor:
+            for query in (
+                    create_ddl_capture_schema_query,
+                    create_ddl_change_log_query,
+                    create_ddl_capture_function_query,
+                    create_ddl_capture_triggers_query
+            ):
+                await cursor.execute(sql.SQL(query).format(schema=schema, channel=channel))
+        await conn.commit()
+        self._ddl_capture_installed.add(self._conn_string)
+
+    @classmethod
+    async def close_pools(cls):
+        pools = list(cls._conn_string_to_pool.values())
+        cls._conn_string_to_pool.clear()
+        for pool in pools:
+            await pool.close()
+
+    @asynccontextmanager
+    async def _connect(self) -> psycopg.AsyncConnection:
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            with SOURCE_CONNECTIONS.track_inprogress():
+                yield conn
+
+    async def _get_pool(self) -> AsyncConnectionPool:
+        pool = self._conn_string_to_pool.get(self._conn_string)
+        if pool is not None:
+            return pool
+
+        pool = AsyncConnectionPool(
+            self._conn_string, open=False, min_size=1, max_size=settings.source_pool_size,
+            max_idle=settings.source_pool_max_idle
+        )
+        await pool.open()
+        # another read of the same source may have opened a pool meanwhile
+        existing_pool = self._conn_string_to_pool.setdefault(self._conn_string, pool)
+        if existing_pool is not pool:
+            await pool.close()
+        return existing_pool
+
+    def _source_filter_sql(self) -> sql.Composable:
+        # compiled into the query, rows of the schemas and tables filtered out never leave the source
+        predicates = [
+            self._patterns_sql(column, patterns, include)
+            for column, patterns, include in (
+                ('table_schema', self._source_filter.include_schemas, True),
+                ('table_schema', self._source_filter.exclude_schemas, False),
+                ('table_name', self._source_filter.include_tables, True),
+                ('table_name', self._source_filter.exclude_tables, False)
+            )
+            if patterns
+        ]
+        return sql.SQL(' and ').join(predicates) if predicates else sql.SQL('true')
 
     @staticmethod
-    def is_b64(string: str) -> bool:
-        return base64.b64encode(base64.b64decode(string)) == string
+    def _patterns_sql(column: str, patterns: list[str], include: bool) -> sql.Composable:
+        like_patterns = [pattern for pattern in patterns if not pattern.startswith('~')]
+        regex_patterns = [pattern[1:] for pattern in patterns if pattern.startswith('~')]
+        matches = []
+        if like_patterns:
+            matches.append(sql.SQL('{} like any({})').format(sql.Identifier(column), sql.Literal(like_patterns)))
+        if regex_patterns:
+            matches.append(sql.SQL('{} ~ any({})').format(sql.Identifier(column), sql.Literal(regex_patterns)))
+        match = sql.SQL(' or ').join(matches)
+        return sql.SQL('({})' if include else 'not ({})').format(match)
+
+    def _to_ns_to_tables(self, result: list[tuple[str, str]]) -> dict[str, set[str]]:
+        ns_to_tables: dict[str, set[str]] = {}
+        db_source = self._conn_string.rsplit('/', maxsplit=1)[1]
+
+        for res in result:
+            table_schema, table_name = res
+            ns = f'{db_source}.{table_schema}'
+            try:
+                ns_to_tables[ns].add(table_name)
+            except KeyError:
+                ns_to_tables[ns] = {table_name}
+        return ns_to_tables
+
+    async def _get_oid_to_system_type(self, conn: psycopg.AsyncConnection, refresh: bool = False) -> dict[int, str]:
+        oid_to_system_type = self._conn_string_to_oid_to_system_type.get(self._conn_string)
+        if oid_to_system_type is not None and not refresh:
+            return oid_to_system_type
+
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT oid, typtype, typbasetype, typcategory, format_type(oid, NULL) "
+                "FROM pg_catalog.pg_type"
+            )
+            oid_to_type = {row[0]: row for row in await cursor.fetchall()}
+
+        oid_to_system_type = {}
+        for oid in oid_to_type:
+            base_oid = oid
+            # domains are typed as their base type, a domain may be over another domain
+            while base_oid in oid_to_type and oid_to_type[base_oid][1] == 'd':
+                base_oid = oid_to_type[base_oid][2]
+            _, type_type, _, type_category, type_name = oid_to_type.get(base_oid, (None, None, None, None, None))
+
+            if type_category == 'A':
+                oid_to_system_type[oid] = self._postgres_to_system_types['ARRAY']
+            elif type_type == 'e':
+                oid_to_system_type[oid] = 'str'
+            else:
+                oid_to_system_type[oid] = self.from_db_type_to_system_type(type_name)
+        self._conn_string_to_oid_to_system_type[self._conn_string] = oid_to_system_type
+        return oid_to_system_type
+
+    def from_db_type_to_system_type(self, var: str) -> str:
+        return self._postgres_to_system_types.get(var, '')
 
 
 class MongoExtractor(MetadataExtractor):
-    def __init__(self, conn_string: str):
-        super().__init__(conn_string)
+    _conn_string_to_client: dict[str, AsyncIOMotorClient] = {}
+    # widest type of the ones a field has across the sampled documents
+    _merged_types = {
+        frozenset({'int', 'float'}): 'float',
+        frozenset({'date', 'datetime'}): 'datetime'
+    }
+
+    def __init__(self, conn_string: str, source_filter: SourceFilter | None = None):
+        super().__init__(conn_string, source_filter)
+        self._database_name = uri_parser.parse_uri(conn_string)['database']
+        self._mongo_to_system_types = {
+            bool: 'bool',
+
+            str: 'str',
+            ObjectId: 'str',
+            UUID: 'str',
+
+            int: 'int',
+            Int64: 'int',
+
+            float: 'float',
+            Decimal128: 'float',
+
+            datetime: 'datetime',
+
+            dict: 'json',
+            list: 'list',
+
+            bytes: 'b64binary',
+            Binary: 'b64binary'
+        }
 
     @property
     def conn_string(self):
         return self._conn_string
 
     async def extract_table_names(self) -> dict[str, set[str]]:
-        ...
+        database = self._database()
+        return self._to_ns_to_tables(database.name, await self._list_collection_names(database))
 
     async def extract_table_name(self, table_name: str, db_path: str | None) -> dict[str, set[str]]:
-        ...
+        if db_path:
+            source, schema, name = db_path.split('.', maxsplit=2)
+        else:
+            source, schema, name = None, None, table_name
+        database = self._database()
+        collection_names = await database.list_collection_names(filter={'name': name})
+        ns_to_tables = self._to_ns_to_tables(database.name, collection_names)
 
-    async def extract_table_col_type(self, table_names: set[str], ns: str) -> tuple[str, str]:
-        ...
+        if not ns_to_tables and source and schema:
+            ns_to_tables[f'{source}.{schema}'] = set()
+        return ns_to_tables
+
+    async def extract_table_col_type(self, table_names: set[str], ns: str, pool: StringPool | None = None) -> Catalog:
+        semaphore = asyncio.Semaphore(settings.mongo_sample_concurrency)
+
+        async def sample(collection_name: str) -> dict[str, str]:
+            async with semaphore:
+                return await self._sample_field_types(collection_name)
+
+        collection_names = sorted(table_names)
+        collections_field_types = await asyncio.gather(*map(sample, collection_names))
+
+        catalog = Catalog(pool)
+        for collection_name, field_types in zip(collection_names, collections_field_types):
+            full_name = f'{ns}.{collection_name}'
+            if not field_types:
+                catalog.add(full_name, collection_name, None, None)
+            for field_name, field_type in field_types.items():
+                catalog.add(full_name, collection_name, field_name, field_type)
+        return catalog
+
+    async def extract_table_count(self) -> int:
+        return len(await self._list_collection_names(self._database()))
+
+    def is_filtered_in(self, schema: str, table: str) -> bool:
+        # collections aren't filtered yet
+        return True
+
+    @classmethod
+    def close_clients(cls):
+        for client in cls._conn_string_to_client.values():
+            client.close()
+        cls._conn_string_to_client.clear()
+
+    async def _sample_field_types(self, collection_name: str) -> dict[str, str]:
+        field_to_types: dict[str, set[str]] = {}
+        cursor = self._database()[collection_name].aggregate(
+            [{'$sample': {'size': settings.mongo_sample_size}}],
+            allowDiskUse=True, maxTimeMS=int(settings.mongo_sample_timeout * 1000)
+        )
+
+        async def read_sample():
+            async for document in cursor:
+                for field_name, value in document.items():
+                    types = field_to_types.setdefault(field_name, set())
+                    if value is not None:
+                        types.add(self.from_db_type_to_system_type(value))
+
+        with SOURCE_CONNECTIONS.track_inprogress():
+            try:
+                # a $sample falling back to a collection scan may not return a document within the budget
+                await asyncio.wait_for(read_sample(), settings.mongo_sample_timeout)
+            except (asyncio.TimeoutError, ExecutionTimeout):
+                # the documents read so far stand for the collection
+                logger.warning(f'Sampling {collection_name} ran out of time after {len(field_to_types)} fields')
+            finally:
+                await cursor.close()
+        return {field_name: self._merge_types(types) for field_name, types in field_to_types.items()}
+
+    def _merge_types(self, types: set[str]) -> str:
+        if not types:
+            return ''
+        if len(types) == 1:
+            return next(iter(types))
+        # json holds any mix of types the widening doesn't cover
+        return self._merged_types.get(frozenset(types), 'json')
+
+    def _database(self) -> AsyncIOMotorDatabase:
+        client = self._conn_string_to_client.get(self._conn_string)
+        if client is None:
+            client = self._conn_string_to_client[self._conn_string] = AsyncIOMotorClient(
+                self._conn_string, maxPoolSize=settings.source_pool_size
+            )
+        return client[self._database_name]
+
+    @staticmethod
+    async def _list_collection_names(database: AsyncIOMotorDatabase) -> list[str]:
+        # views are sampled like collections
+        return [name for name in await database.list_collection_names() if not name.startswith('system.')]
+
+    def _to_ns_to_tables(self, database_name: str, collection_names: list[str]) -> dict[str, set[str]]:
+        if not collection_names:
+            return {}
+        db_source = self._conn_string.rsplit('/', maxsplit=1)[1]
+        return {f'{db_source}.{database_name}': set(collection_names)}
+
+    def from_db_type_to_system_type(self, var) -> str:
+        return self._mongo_to_system_types.get(type(var), '')
 
 
 class MetaDataExtractorFactory:
@@ -188,7 +465,11 @@ class MetaDataExtractorFactory:
     }
 
     @classmethod
-    def build(cls, conn_string: str) -> MetadataExtractor:
+    def register(cls, driver: str, metadata_extractor_class: type[MetadataExtractor]):
+        cls._DRIVER_TO_METADATA_EXTRACTOR_TYPE[driver] = metadata_extractor_class
+
+    @classmethod
+    def build(cls, conn_string: str, source_filter: SourceFilter | None = None) -> MetadataExtractor:
         driver = conn_string.split('://', maxsplit=1)[0]
         metadata_extractor_class = cls._DRIVER_TO_METADATA_EXTRACTOR_TYPE[driver]
-        return metadata_extractor_class(conn_string)
+        return metadata_extractor_class(conn_string, source_filter)
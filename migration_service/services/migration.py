@@ -1,24 +1,42 @@
 import asyncio
 import logging
 import itertools
+import functools
+import collections
+import hashlib
 import re
+import time
 
-from typing import Sequence
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
 
 from age import Age
 from fastapi import status, HTTPException
+from psycopg2 import sql
+from sqlalchemy import select, delete, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession as SQLAlchemyAsyncSession
 
+from migration_service.database import db_session
+from migration_service.metrics import track_stage, BATCH_SIZE
+from migration_service.tracing import tracer
 from migration_service.errors import MoreThanTwoFieldsMatchFKPattern
+from migration_service.models import migrations
 from migration_service.schemas.migrations import (
-    MigrationPattern, HubToCreate, TableToAlter, ApplySchema
+    MigrationPattern, ApplySchema, ApplyMigration, MigrationPlan, SchemaPlan, PhasePlan
 )
+from migration_service.schemas.tables import HubToCreate, SatToCreate, LinkToCreate, TableToAlter, OneWayLink
 from migration_service.services.migration_formatter import ApplyMigrationFormatter
+from migration_service.settings import settings
 
 from migration_service.crud.migration import select_migration_tables_fields_by_guid
+from migration_service.utils.graph_db_utils import exec_cypher, render_sql
+from migration_service.utils.memory_utils import check_memory_soft_cap
 from migration_service.utils.migration_utils import (
-    get_highest_table_similarity_score, add_to_batches, delete_to_batches, alter_to_batches
+    get_highest_table_similarity_score, add_to_batches, delete_to_batches, alter_to_batches, to_batches
 )
+from migration_service.utils.process_pool_utils import get_process_pool, get_quoting_connection, run_in_process_pool
+from migration_service.utils.profiling_utils import profiled_to_thread
 
 from migration_service.age_queries.hub_queries import create_hubs_query, construct_create_hubs_query
 from migration_service.age_queries.sat_queries import (
@@ -37,181 +55,479 @@ from migration_service.age_queries.node_queries import (
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class ApplyStatement:
+    phase: str
+    batch_index: int
+    template_name: str
+    template: str
+    param: str
+    batch: list
+    construct: Callable[[list], sql.Composable]
+
+    def build(self, connection) -> str:
+        constructed_query = self.construct(self.batch)
+        str_query = render_sql(constructed_query, connection)
+        return self.template.format(**{self.param: str_query})
+
+
+@dataclass(slots=True)
+class ApplySchemaStatements:
+    apply_schema: ApplySchema
+    sats_with_hub: list[SatToCreate]
+    sats_without_hub: list[SatToCreate]
+    links_with_hubs: list[LinkToCreate]
+    links_without_hubs: list[LinkToCreate]
+
+    def __iter__(self) -> Iterator[ApplyStatement]:
+        yield from _delete_nodes_statements(self.apply_schema.tables_to_delete)
+        yield from _add_hubs_statements(self.apply_schema.hubs_to_create)
+        yield from _add_links_statements(create_links_with_hubs_query, self.links_with_hubs, True)
+        yield from _add_links_statements(create_links_query, self.links_without_hubs, False)
+        yield from _add_sats_statements(create_sats_with_hubs_query, self.sats_with_hub, True)
+        yield from _add_sats_statements(create_sats_query, self.sats_without_hub, False)
+        yield from _alter_nodes_statements(
+            list(
+                itertools.chain(
+                    self.apply_schema.hubs_to_alter, self.apply_schema.sats_to_alter, self.apply_schema.links_to_alter
+                )
+            )
+        )
+
+
 async def apply_migration(
         guid: str, migration_pattern: MigrationPattern, session: SQLAlchemyAsyncSession, age_session
 ) -> str:
     logger.info('Applying migration...')
-    last_migration = await select_migration_tables_fields_by_guid(guid, session)
-    if not last_migration:
+    with track_stage('format'):
+        migration, apply_migration_model = await _format_migration(guid, migration_pattern, session)
+
+    logger.info(f"last migration: {apply_migration_model}")
+    timings: dict[str, list[float]] = {}
+    with track_stage('compile', schemas=len(apply_migration_model.schemas)):
+        schema_statements = await _compile_schemas(apply_migration_model.schemas, migration_pattern)
+
+    if migration.apply_pattern is None:
+        await _record_apply_pattern(guid, migration_pattern)
+    schema_to_checkpoints = await _select_checkpoints(guid, session)
+    if schema_to_checkpoints:
+        logger.info(
+            f'Resuming migration {guid} past {sum(map(len, schema_to_checkpoints.values()))} applied batches'
+        )
+    loop = asyncio.get_running_loop()
+    for schema, statements in zip(apply_migration_model.schemas, schema_statements):
+        ns = f'{apply_migration_model.db_source}.{schema.name}'
+        ag = await asyncio.to_thread(age_session.setGraph, ns)
+        await profiled_to_thread(
+            _exec_statements_tx, statements, ag, timings, schema_to_checkpoints.get(schema.name, {}),
+            functools.partial(_record_checkpoint_threadsafe, loop, guid, schema.name)
+        )
+
+    await _record_statement_timings(timings, session)
+    await session.execute(delete(migrations.ApplyCheckpoint).where(migrations.ApplyCheckpoint.migration_guid == guid))
+    migration.is_applied = True
+    return migration.guid
+
+
+async def plan_migration(
+        guid: str, migration_pattern: MigrationPattern, session: SQLAlchemyAsyncSession
+) -> MigrationPlan:
+    logger.info('Planning migration...')
+    migration, apply_migration_model = await _format_migration(guid, migration_pattern, session)
+    template_to_duration = await _select_statement_durations(session)
+
+    migration_plan = MigrationPlan(guid=migration.guid, db_source=apply_migration_model.db_source)
+    schema_statements = await _compile_schemas(apply_migration_model.schemas, migration_pattern)
+    for schema, statements in zip(apply_migration_model.schemas, schema_statements):
+        schema_plan = _plan_schema(schema, statements, template_to_duration)
+        migration_plan.schemas.append(schema_plan)
+
+        for phase_plan in schema_plan.phases:
+            migration_plan.statements += phase_plan.statements
+            migration_plan.unestimated_statements += phase_plan.unestimated_statements
+            migration_plan.estimated_duration += phase_plan.estimated_duration
+
+    logger.info(f"migration plan: {migration_plan}")
+    return migration_plan
+
+
+async def _format_migration(
+        guid: str, migration_pattern: MigrationPattern, session: SQLAlchemyAsyncSession
+) -> tuple[migrations.Migration, ApplyMigration]:
+    migration = await select_migration_tables_fields_by_guid(guid, session)
+    if not migration:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    guid = last_migration.guid
     apply_migration_formatter = ApplyMigrationFormatter(
-        last_migration, migration_pattern.fk_pattern, migration_pattern.pk_pattern
+        migration, migration_pattern.fk_pattern, migration_pattern.pk_pattern
     )
     apply_migration_formatter.set_keys()
-    last_migration = apply_migration_formatter.format()
+    return migration, apply_migration_formatter.format()
 
-    logger.info(f"last migration: {last_migration}")
-    for schema in last_migration.schemas:
-        ns = f'{last_migration.db_source}.{schema.name}'
-        ag = await asyncio.get_running_loop().run_in_executor(None, age_session.setGraph, ns)
 
-        await _apply_delete_tables(schema, ag)
-        await _apply_create_tables(schema, migration_pattern, ag)
-        await _apply_alter_tables(schema, ag)
-    return guid
+def _compile_schema(
+        apply_schema: ApplySchema, migration_pattern: MigrationPattern,
+        sat_ref_tables: list[str | None] | None = None,
+        link_ref_links: list[tuple[OneWayLink | None, OneWayLink | None]] | None = None
+) -> ApplySchemaStatements:
+    links_with_hubs, links_without_hubs = _match_links_to_hubs(apply_schema, migration_pattern, link_ref_links)
+    sats_with_hub, sats_without_hub = _match_sats_to_hubs(apply_schema, migration_pattern, sat_ref_tables)
+    return ApplySchemaStatements(apply_schema, sats_with_hub, sats_without_hub, links_with_hubs, links_without_hubs)
 
 
-async def _apply_delete_tables(apply_schema: ApplySchema, age_session: Age):
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None,
-        _delete_nodes_tx,
-        apply_schema.tables_to_delete,
-        age_session
+async def _compile_schemas(
+        apply_schemas: list[ApplySchema], migration_pattern: MigrationPattern
+) -> list[ApplySchemaStatements]:
+    return await asyncio.gather(
+        *(_compile_schema_off_loop(apply_schema, migration_pattern) for apply_schema in apply_schemas)
     )
 
 
-async def _apply_create_tables(
-        apply_schema: ApplySchema, migration_pattern: MigrationPattern, age_session: Age
-):
-    hub_dicts_to_create = (hub.dict() for hub in apply_schema.hubs_to_create)
-    loop = asyncio.get_running_loop()
+async def _compile_schema_off_loop(
+        apply_schema: ApplySchema, migration_pattern: MigrationPattern
+) -> ApplySchemaStatements:
+    if get_process_pool() is None:
+        return await profiled_to_thread(_compile_schema, apply_schema, migration_pattern)
+
+    # hub matching is the CPU heavy part, chunks of sats and links are matched on the worker processes
+    table_names = list(apply_schema.tables_to_pks)
+    sat_ref_tables = await asyncio.gather(
+        *(
+            run_in_process_pool(_match_sat_ref_tables, sat_names, table_names, migration_pattern.fk_table)
+            for sat_names in to_batches((sat.name for sat in apply_schema.sats_to_create), settings.cpu_chunk_tables)
+        )
+    )
+    link_ref_links = await asyncio.gather(
+        *(
+            run_in_process_pool(_match_link_ref_links, links, table_names, migration_pattern.fk_pattern)
+            for links in to_batches(apply_schema.links_to_create, settings.cpu_chunk_tables)
+        )
+    )
+    return _compile_schema(
+        apply_schema, migration_pattern,
+        list(itertools.chain.from_iterable(sat_ref_tables)), list(itertools.chain.from_iterable(link_ref_links))
+    )
 
-    await loop.run_in_executor(None, _add_hubs_tx, hub_dicts_to_create, age_session)
-    await _add_links(apply_schema, migration_pattern, age_session)
-    await _add_sats(apply_schema, migration_pattern, age_session)
 
+def _build_statements(statements: list[ApplyStatement]) -> list[str]:
+    connection = get_quoting_connection()
+    return [statement.build(connection) for statement in statements]
 
-async def _apply_alter_tables(apply_schema: ApplySchema, age_session: Age):
-    nodes_to_alter = (
-        node.dict()
-        for node in itertools.chain(apply_schema.hubs_to_alter, apply_schema.sats_to_alter, apply_schema.links_to_alter)
+
+def _iter_built_statements(
+        statements: Iterable[ApplyStatement], connection
+) -> Iterator[tuple[ApplyStatement, str]]:
+    process_pool = get_process_pool()
+    if process_pool is None:
+        for statement in statements:
+            yield statement, statement.build(connection)
+        return
+
+    # chunks are built ahead by the workers while earlier ones execute, in submission order
+    pending = collections.deque()
+    try:
+        for chunk in to_batches(statements, settings.cpu_chunk_statements):
+            pending.append((chunk, process_pool.submit(_build_statements, chunk)))
+            if len(pending) > 2 * settings.cpu_workers:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def _exec_statements_tx(
+        statements: Iterable[ApplyStatement], age_session: Age, timings: dict[str, list[float]],
+        checkpoints: dict[tuple[str, int], str] | None = None,
+        record_checkpoint: Callable[[ApplyStatement, str], None] | None = None
+):
+    checkpoints = checkpoints or {}
+    built_statements = _iter_built_statements(statements, age_session.connection)
+    for phase, phase_statements in itertools.groupby(built_statements, key=lambda built: built[0].phase):
+        with track_stage(f'apply_{phase}', graph=age_session.graphName):
+            for statement, query in phase_statements:
+                digest = hashlib.sha256(query.encode()).hexdigest()
+                checkpoint_digest = checkpoints.get((statement.template_name, statement.batch_index))
+                if checkpoint_digest == digest:
+                    # committed by an earlier attempt of this migration
+                    continue
+                if checkpoint_digest is not None:
+                    logger.warning(
+                        f'Batch {statement.batch_index} of {statement.template_name} differs from the one applied '
+                        f'before, applying it again'
+                    )
+
+                check_memory_soft_cap()
+                with tracer.start_as_current_span(
+                        'apply_batch',
+                        attributes={
+                            'graph': age_session.graphName,
+                            'template': statement.template_name,
+                            'batch_index': statement.batch_index,
+                            'rows': len(statement.batch)
+                        }
+                ):
+                    started_at = time.perf_counter()
+                    exec_cypher(age_session, statement.template_name, query)
+                    age_session.commit()
+                    duration = time.perf_counter() - started_at
+
+                timings.setdefault(statement.template_name, []).append(duration)
+                BATCH_SIZE.labels(statement.template_name).observe(len(statement.batch))
+                if record_checkpoint is not None:
+                    record_checkpoint(statement, digest)
+
+
+def _record_checkpoint_threadsafe(
+        loop: asyncio.AbstractEventLoop, guid: str, schema_name: str, statement: ApplyStatement, digest: str
+):
+    # the batch is committed to the graph, the next one waits until its checkpoint is persisted
+    asyncio.run_coroutine_threadsafe(_record_checkpoint(guid, schema_name, statement, digest), loop).result()
+
+
+async def _record_apply_pattern(guid: str, migration_pattern: MigrationPattern):
+    # persisted on a session of its own, a resume after a failed apply needs it
+    async with db_session() as session:
+        await session.execute(
+            update(migrations.Migration)
+            .where(migrations.Migration.guid == guid)
+            .values(apply_pattern=migration_pattern.dict())
+        )
+
+
+async def record_resume_attempt(guid: str):
+    async with db_session() as session:
+        await session.execute(
+            update(migrations.Migration)
+            .where(migrations.Migration.guid == guid)
+            .values(resume_attempts=migrations.Migration.resume_attempts + 1)
+        )
+
+
+async def _record_checkpoint(guid: str, schema_name: str, statement: ApplyStatement, digest: str):
+    # a batch that differs from the one applied before replaces its checkpoint
+    insert_checkpoint = insert(migrations.ApplyCheckpoint).values(
+        migration_guid=guid, schema_name=schema_name, phase=statement.phase,
+        template_name=statement.template_name, batch_index=statement.batch_index, digest=digest
     )
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, _alter_nodes_tx, nodes_to_alter, age_session)
+    async with db_session() as session:
+        await session.execute(
+            insert_checkpoint.on_conflict_do_update(
+                constraint='uq_apply_checkpoints_batch',
+                set_={'phase': insert_checkpoint.excluded.phase, 'digest': insert_checkpoint.excluded.digest}
+            )
+        )
 
 
-def _delete_nodes_tx(nodes_to_delete: Sequence, age_session):
-    for node_batch in delete_to_batches(nodes_to_delete):
-        constructed_query = construct_delete_nodes_query(node_batch)
-        str_query = constructed_query.as_string(age_session.connection)
+async def _select_checkpoints(
+        guid: str, session: SQLAlchemyAsyncSession
+) -> dict[str, dict[tuple[str, int], str]]:
+    checkpoints = await session.execute(
+        select(migrations.ApplyCheckpoint).where(migrations.ApplyCheckpoint.migration_guid == guid)
+    )
+    schema_to_checkpoints: dict[str, dict[tuple[str, int], str]] = {}
+    for checkpoint in checkpoints.scalars():
+        schema_to_checkpoints.setdefault(checkpoint.schema_name, {})[
+            (checkpoint.template_name, checkpoint.batch_index)
+        ] = checkpoint.digest
+    return schema_to_checkpoints
 
-        age_session.execCypher(delete_nodes_query.format(nodes=str_query))
-        age_session.commit()
 
+def _delete_nodes_statements(nodes_to_delete: Iterable[str]) -> Iterator[ApplyStatement]:
+    for batch_index, node_batch in enumerate(delete_to_batches(nodes_to_delete)):
+        yield ApplyStatement(
+            'delete_nodes', batch_index, 'delete_nodes_query', delete_nodes_query, 'nodes',
+            node_batch, construct_delete_nodes_query
+        )
 
-def _add_hubs_tx(hubs_to_create: Sequence[HubToCreate], age_session: Age):
-    for hub_batch in add_to_batches(hubs_to_create):
-        constructed_query = construct_create_hubs_query(hub_batch)
-        str_query = constructed_query.as_string(age_session.connection)
 
-        age_session.execCypher(create_hubs_query.format(hubs=str_query))
-        age_session.commit()
+def _add_hubs_statements(hubs_to_create: Iterable[HubToCreate]) -> Iterator[ApplyStatement]:
+    for batch_index, hub_batch in enumerate(add_to_batches(hubs_to_create)):
+        yield ApplyStatement(
+            'add_hubs', batch_index, 'create_hubs_query', create_hubs_query, 'hubs',
+            hub_batch, construct_create_hubs_query
+        )
 
 
-async def _add_sats(apply_schema: ApplySchema, migration_pattern: MigrationPattern, age_session: Age):
+def _match_sats_to_hubs(
+        apply_schema: ApplySchema, migration_pattern: MigrationPattern, ref_tables: list[str | None] | None = None
+) -> tuple[list[SatToCreate], list[SatToCreate]]:
     sats_with_hub = []
     sats_without_hub = []
 
-    sat_pattern = re.compile(migration_pattern.fk_table)
     tables_to_pks = apply_schema.tables_to_pks
+    if ref_tables is None:
+        ref_tables = _match_sat_ref_tables(
+            [sat.name for sat in apply_schema.sats_to_create], list(tables_to_pks), migration_pattern.fk_table
+        )
 
-    for sat in apply_schema.sats_to_create:
-        table_prefix = sat_pattern.search(sat.name)
-        if table_prefix:
-            table_name = get_highest_table_similarity_score(table_prefix.group(1), tables_to_pks.keys(), sat.name)
-        else:
-            table_name = None
-
+    for sat, table_name in zip(apply_schema.sats_to_create, ref_tables):
         try:
             sat.link.ref_table = table_name
             sat.link.ref_table_pk = tables_to_pks[table_name]
-            sats_with_hub.append(sat.dict())
+            sats_with_hub.append(sat)
         except KeyError:
-            sats_without_hub.append(sat.dict(exclude={'link'}))
+            sats_without_hub.append(sat)
+    return sats_with_hub, sats_without_hub
 
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None, _add_sats_tx, create_sats_with_hubs_query, sats_with_hub, True, age_session
-    )
-    await loop.run_in_executor(
-        None, _add_sats_tx, create_sats_query, sats_without_hub, False, age_session
-    )
 
+def _match_sat_ref_tables(sat_names: list[str], table_names: list[str], fk_table: str) -> list[str | None]:
+    sat_pattern = re.compile(fk_table)
+    ref_tables = []
+    for sat_name in sat_names:
+        table_prefix = sat_pattern.search(sat_name)
+        if table_prefix:
+            ref_tables.append(get_highest_table_similarity_score(table_prefix.group(1), table_names, sat_name))
+        else:
+            ref_tables.append(None)
+    return ref_tables
 
-def _add_sats_tx(add_sats_query: str, sats: list[dict], is_linked: bool, age_session: Age):
-    if not sats:
-        return
-    for sat_batch in add_to_batches(sats):
-        constructed_query = construct_create_sats_query(sat_batch, is_linked)
-        str_query = constructed_query.as_string(age_session.connection)
 
-        age_session.execCypher(add_sats_query.format(sats=str_query))
-        age_session.commit()
+def _add_sats_statements(add_sats_query: str, sats: list[SatToCreate], is_linked: bool) -> Iterator[ApplyStatement]:
+    template_name = 'create_sats_with_hubs_query' if is_linked else 'create_sats_query'
+    for batch_index, sat_batch in enumerate(add_to_batches(sats)):
+        yield ApplyStatement(
+            'add_sats', batch_index, template_name, add_sats_query, 'sats',
+            sat_batch, functools.partial(construct_create_sats_query, is_linked=is_linked)
+        )
 
 
-async def _add_links(
-        apply_schema: ApplySchema,
-        migration_pattern: MigrationPattern,
-        age_session: Age
-):
+def _match_links_to_hubs(
+        apply_schema: ApplySchema, migration_pattern: MigrationPattern,
+        ref_links: list[tuple[OneWayLink | None, OneWayLink | None]] | None = None
+) -> tuple[list[LinkToCreate], list[LinkToCreate]]:
     links_with_hubs = []
     links_without_hubs = []
 
-    fk_pattern_compiled = re.compile(migration_pattern.fk_pattern)
     tables_to_pks = apply_schema.tables_to_pks
+    if ref_links is None:
+        ref_links = _match_link_ref_links(apply_schema.links_to_create, list(tables_to_pks), migration_pattern.fk_pattern)
 
-    for link in apply_schema.links_to_create:
-        link.match_fks_to_fk_tables(fk_pattern_compiled, tables_to_pks.keys())
+    for link, (main_link, paired_link) in zip(apply_schema.links_to_create, ref_links):
+        link.main_link, link.paired_link = main_link, paired_link
         try:
             link.main_link.ref_table_pk = tables_to_pks[link.main_link.ref_table]
             link.paired_link.ref_table_pk = tables_to_pks[link.paired_link.ref_table]
-            links_with_hubs.append(link.dict())
+            links_with_hubs.append(link)
         except (KeyError, AttributeError, MoreThanTwoFieldsMatchFKPattern):
-            links_without_hubs.append(
-                link.dict(exclude={'main_link', 'paired_link'})
+            links_without_hubs.append(link)
+    return links_with_hubs, links_without_hubs
+
+
+def _match_link_ref_links(
+        links: list[LinkToCreate], table_names: list[str], fk_pattern: str
+) -> list[tuple[OneWayLink | None, OneWayLink | None]]:
+    fk_pattern_compiled = re.compile(fk_pattern)
+    ref_links = []
+    for link in links:
+        link.match_fks_to_fk_tables(fk_pattern_compiled, table_names)
+        ref_links.append((link.main_link, link.paired_link))
+    return ref_links
+
+
+def _add_links_statements(add_links_query: str, links: list[LinkToCreate], is_linked: bool) -> Iterator[ApplyStatement]:
+    template_name = 'create_links_with_hubs_query' if is_linked else 'create_links_query'
+    for batch_index, link_batch in enumerate(add_to_batches(links)):
+        yield ApplyStatement(
+            'add_links', batch_index, template_name, add_links_query, 'links',
+            link_batch, functools.partial(construct_create_links_query, is_linked=is_linked)
+        )
+
+
+def _alter_nodes_statements(nodes_to_alter: list[TableToAlter]) -> Iterator[ApplyStatement]:
+    # a batch only carries the fields of its own statement, a node is not altered once per batched field list
+    for fields_key, template_name, template, construct in (
+            ('fields_to_create', 'alter_nodes_query_create_fields', alter_nodes_query_create_fields,
+             construct_create_fields_query),
+            ('fields_to_delete', 'alter_nodes_query_delete_fields', alter_nodes_query_delete_fields,
+             construct_delete_fields_query),
+            ('fields_to_alter', 'alter_nodes_query_alter_fields', alter_nodes_query_alter_fields,
+             construct_alter_fields_query)
+    ):
+        for batch_index, node_batch in enumerate(alter_to_batches(nodes_to_alter, fields_key)):
+            yield ApplyStatement(
+                'alter_nodes', batch_index, template_name, template, 'nodes', node_batch, construct
             )
 
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(
-        None, _add_links_tx, create_links_with_hubs_query, links_with_hubs, True, age_session
-    )
-    await loop.run_in_executor(
-        None, _add_links_tx, create_links_query, links_without_hubs, False, age_session
-    )
-
-
-def _add_links_tx(add_links_query: str, links: list[dict], is_linked: bool, age_session: Age):
-    if not links:
-        return
-    for link_batch in add_to_batches(links):
-        constructed_query = construct_create_links_query(link_batch, is_linked)
-        str_query = constructed_query.as_string(age_session.connection)
-
-        age_session.execCypher(add_links_query.format(links=str_query))
-        age_session.commit()
 
+def _plan_schema(
+        apply_schema: ApplySchema, statements: ApplySchemaStatements, template_to_duration: dict[str, float]
+) -> SchemaPlan:
+    phase_to_plan = {
+        phase: PhasePlan(name=phase)
+        for phase in ('delete_nodes', 'add_hubs', 'add_links', 'add_sats', 'alter_nodes')
+    }
+
+    phase_plan = phase_to_plan['delete_nodes']
+    phase_plan.tables = len(apply_schema.tables_to_delete)
+    # fields of the deleted tables are not known before the apply
+    phase_plan.nodes_to_delete = phase_plan.tables
+
+    for phase, tables, linked_tables, edges_per_linked_table in (
+            ('add_hubs', apply_schema.hubs_to_create, (), 0),
+            ('add_links', apply_schema.links_to_create, statements.links_with_hubs, 4),
+            ('add_sats', apply_schema.sats_to_create, statements.sats_with_hub, 2)
+    ):
+        fields_count = sum(len(table.fields) for table in tables)
+        phase_plan = phase_to_plan[phase]
+        phase_plan.tables = len(tables)
+        phase_plan.nodes_to_create = len(tables) + fields_count
+        phase_plan.edges_to_create = fields_count + edges_per_linked_table * len(linked_tables)
+
+    phase_plan = phase_to_plan['alter_nodes']
+    for table in itertools.chain(apply_schema.hubs_to_alter, apply_schema.sats_to_alter, apply_schema.links_to_alter):
+        phase_plan.tables += 1
+        phase_plan.nodes_to_create += len(table.fields_to_create)
+        phase_plan.edges_to_create += len(table.fields_to_create)
+        phase_plan.nodes_to_delete += len(table.fields_to_delete)
+        phase_plan.properties_to_set += len(table.fields_to_alter)
+
+    previous_batch = None
+    for statement in statements:
+        phase_plan = phase_to_plan[statement.phase]
+        phase_plan.statements += 1
+        if statement.batch is not previous_batch:
+            phase_plan.batches += 1
+        previous_batch = statement.batch
+
+        duration = template_to_duration.get(statement.template_name)
+        if duration is None:
+            phase_plan.unestimated_statements += 1
+        else:
+            phase_plan.estimated_duration += duration
 
-def _alter_nodes_tx(nodes_to_alter: Sequence[TableToAlter], age_session: Age):
-    if not nodes_to_alter:
-        return
-    for node_batch in alter_to_batches(nodes_to_alter):
-        constructed_query = construct_create_fields_query(node_batch)
-        str_query = constructed_query.as_string(age_session.connection)
+    return SchemaPlan(name=apply_schema.name, phases=list(phase_to_plan.values()))
 
-        age_session.execCypher(alter_nodes_query_create_fields.format(nodes=str_query))
-        age_session.commit()
 
-        constructed_query = construct_delete_fields_query(node_batch)
-        str_query = constructed_query.as_string(age_session.connection)
+async def _select_statement_durations(session: SQLAlchemyAsyncSession) -> dict[str, float]:
+    statement_timings = await session.execute(select(migrations.StatementTiming))
+    return {
+        statement_timing.template_name: statement_timing.total_duration / statement_timing.statements
+        for statement_timing in statement_timings.scalars()
+        if statement_timing.statements
+    }
 
-        age_session.execCypher(alter_nodes_query_delete_fields.format(nodes=str_query))
-        age_session.commit()
 
-        constructed_query = construct_alter_fields_query(node_batch)
-        str_query = constructed_query.as_string(age_session.connection)
+async def _record_statement_timings(timings: dict[str, list[float]], session: SQLAlchemyAsyncSession):
+    if not timings:
+        return
 
-        age_session.execCypher(alter_nodes_query_alter_fields.format(nodes=str_query))
-        age_session.commit()
+    # concurrent syncs add to the same rows, the upsert adds atomically instead of racing on the primary key
+    insert_timings = insert(migrations.StatementTiming).values(
+        [
+            {'template_name': template_name, 'statements': len(durations), 'total_duration': sum(durations)}
+            for template_name, durations in sorted(timings.items())
+        ]
+    )
+    await session.execute(
+        insert_timings.on_conflict_do_update(
+            index_elements=[migrations.StatementTiming.template_name],
+            set_={
+                'statements': migrations.StatementTiming.statements + insert_timings.excluded.statements,
+                'total_duration': migrations.StatementTiming.total_duration + insert_timings.excluded.total_duration
+            }
+        )
+    )
@@ -0,0 +1,69 @@
+import json
+import logging
+
+from migration_service.schemas.migrations import MigrationIn, MigrationObject
+
+logger = logging.getLogger(__name__)
+
+
+def group_migration_requests(deliveries: list[tuple[int, bytes]]) -> list[list[tuple[int, bytes]]]:
+    key_to_deliveries: dict[tuple[str, str, bool, str] | int, list[tuple[int, bytes]]] = {}
+    for delivery_tag, body in deliveries:
+        try:
+            migration_request = json.loads(body)
+            key = (
+                migration_request['conn_string'],
+                json.dumps(migration_request['migration_pattern'], sort_keys=True),
+                bool(migration_request.get('dry_run')),
+                json.dumps(migration_request.get('source_filter'), sort_keys=True)
+            )
+        except (ValueError, KeyError, TypeError):
+            # malformed requests are never coalesced, they fail on their own
+            key = delivery_tag
+
+        try:
+            key_to_deliveries[key].append((delivery_tag, body))
+        except KeyError:
+            key_to_deliveries[key] = [(delivery_tag, body)]
+    return list(key_to_deliveries.values())
+
+
+def coalesce_migration_requests(migration_requests: list[dict]) -> MigrationIn:
+    migration_ins = [_to_migration_in(migration_request) for migration_request in migration_requests]
+    if len(migration_ins) == 1:
+        return migration_ins[0]
+
+    key_to_object: dict[tuple[str | None, str | None], MigrationObject] = {}
+    for migration_in in migration_ins:
+        migration_objects = migration_in.migration_objects
+        if not migration_objects:
+            # a full sync covers every object requested alongside it
+            key_to_object.clear()
+            break
+
+        for migration_object in migration_objects:
+            key_to_object[(migration_object.name, migration_object.db_path)] = migration_object
+
+    logger.info(
+        f'Coalesced {len(migration_ins)} migration requests for {migration_ins[-1].conn_string} into '
+        f'{"a sync of " + str(len(key_to_object)) + " objects" if key_to_object else "a full sync"}'
+    )
+    return MigrationIn(
+        name=migration_ins[-1].name,
+        conn_string=migration_ins[-1].conn_string,
+        objects=list(key_to_object.values()),
+        source_filter=migration_ins[-1].source_filter
+    )
+
+
+def _to_migration_in(migration_request: dict) -> MigrationIn:
+    return MigrationIn(
+        **{
+            'name': migration_request['name'],
+            'conn_string': migration_request['conn_string'],
+            'object_name': migration_request['object_name'],
+            'object_db_path': migration_request['object_db_path'],
+            'objects': migration_request.get('objects', []),
+            'source_filter': migration_request.get('source_filter')
+        }
+    )
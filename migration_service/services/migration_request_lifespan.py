@@ -1,9 +1,17 @@
 import json
+import asyncio
 import logging
+import weakref
 
 from enum import Enum
 
-from migration_service.crud.migration import add_migration, select_migration
+from age import Age
+from pika import BasicProperties, DeliveryMode
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from migration_service.crud.migration import (
+    add_migration, select_migration, select_resumable_migration, abandon_migration
+)
 
 from migration_service.schemas.migrations import MigrationIn, MigrationPattern
 
@@ -11,8 +19,11 @@ from migration_service.database import db_session
 from migration_service.database import ag_session
 
 from migration_service.mq import PikaChannel
-from migration_service.services.migration import apply_migration
+from migration_service.services.migration import apply_migration, plan_migration, record_resume_attempt
+from migration_service.services.migration_request_coalescer import coalesce_migration_requests
 from migration_service.settings import settings
+from migration_service.utils.message_utils import encode_message
+from migration_service.utils.profiling_utils import profile_sync
 
 
 logger = logging.getLogger(__name__)
@@ -23,48 +34,98 @@ class MigrationRequestStatus(Enum):
     FAILURE = 'failure'
 
 
-async def synchronize(migration_request: str, channel: PikaChannel):
-    migration_request = json.loads(migration_request)
+class MigrationLane(Enum):
+    OBJECT = 'task.object'
+    FULL = 'task.full'
+
+
+# syncs of the same source never overlap, even when they run in different lanes
+_source_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+async def route_migration_requests(migration_requests: list[str], channel: PikaChannel):
+    for migration_request in migration_requests:
+        lane = _select_lane(json.loads(migration_request))
+        logger.info(f'Routing migration request to the {lane.name.lower()} lane')
+        await channel.basic_publish(
+            exchange=settings.migration_exchange,
+            routing_key=lane.value,
+            body=migration_request,
+            properties=BasicProperties(delivery_mode=DeliveryMode.Persistent)
+        )
+
+
+async def synchronize(migration_requests: list[str], channel: PikaChannel):
+    migration_requests = [json.loads(migration_request) for migration_request in migration_requests]
 
-    migration_in = MigrationIn(
-        **{
-            'name': migration_request['name'],
-            'conn_string': migration_request['conn_string'],
-            'object_name': migration_request['object_name'],
-            'object_db_path': migration_request['object_db_path']
-        }
+    migration_in = coalesce_migration_requests(migration_requests)
+    migration_pattern = MigrationPattern(**migration_requests[0]['migration_pattern'])
+    dry_run = bool(migration_requests[0].get('dry_run'))
+
+    profile = settings.profile_syncs or any(
+        migration_request.get('profile') for migration_request in migration_requests
     )
-    migration_pattern = MigrationPattern(**migration_request['migration_pattern'])
-    source_guid = migration_request['source_guid']
-    model = migration_request['model']
-
-    async with db_session() as session:
-        with ag_session() as age_session:
-            guid, count = await add_migration(migration_in, session, age_session)
-            await apply_migration(guid, migration_pattern, session, age_session)
-            graph_migration = await select_migration(guid, session)
-
-            logger.info('Migration request was processed')
-            logger.info('Sending result...')
-            await channel.basic_publish(
-                exchange=settings.migration_exchange,
-                routing_key='result',
-                body=json.dumps(
-                    {
+
+    async with profile_sync(migration_requests[0]['source_guid'], profile):
+        source_lock = _source_locks.setdefault(migration_in.conn_string, asyncio.Lock())
+        async with source_lock, db_session() as session:
+            with ag_session() as age_session:
+                if not dry_run and not migration_in.migration_objects:
+                    # object syncs are interactive, they don't wait for an interrupted full apply
+                    await _resume_migration(migration_in, session, age_session)
+                guid, count = await add_migration(migration_in, session, age_session, dry_run)
+                if dry_run:
+                    migration_plan = await plan_migration(guid, migration_pattern, session)
+                else:
+                    await apply_migration(guid, migration_pattern, session, age_session)
+                graph_migration = await select_migration(guid, session)
+                if dry_run:
+                    await session.rollback()
+
+                logger.info('Migration request was processed')
+                logger.info('Sending result...')
+                for migration_request in migration_requests:
+                    result = {
                         'status': MigrationRequestStatus.SUCCESS.value,
                         'count': count,
                         'conn_string': migration_in.conn_string,
+                        'graph_migration_guid': guid,
                         'graph_migration': graph_migration.dict(),
-                        'source_guid': source_guid,
+                        'source_guid': migration_request['source_guid'],
                         'source_name': migration_request['source_name'],
                         'object_guid': migration_request['object_guid'],
                         'object_name': migration_request['object_name'],
-                        'model': model,
+                        'model': migration_request['model'],
                         'sync_type': migration_request['sync_type'],
                         'identity_id': migration_request['identity_id']
                     }
-                )
-            )
+                    if dry_run:
+                        result['dry_run'] = True
+                        result['plan'] = migration_plan.dict()
+                    await _publish_result(result, channel)
+
+
+async def _resume_migration(migration_in: MigrationIn, session: AsyncSession, age_session: Age):
+    # finishing the interrupted apply first keeps the batches it committed,
+    # the migration diffed afterwards only covers what changed since
+    db_source = migration_in.conn_string.rsplit('/', maxsplit=1)[1]
+    migration = await select_resumable_migration(db_source, session)
+    if migration is None:
+        return
+
+    if migration.resume_attempts >= settings.apply_resume_attempts:
+        logger.warning(
+            f'Migration {migration.guid} failed {migration.resume_attempts} resumes, it is abandoned'
+        )
+        await abandon_migration(migration, session)
+        await session.commit()
+        return
+
+    logger.info(f'Resuming the apply of migration {migration.guid}')
+    guid = migration.guid
+    await record_resume_attempt(guid)
+    await apply_migration(guid, MigrationPattern(**migration.apply_pattern), session, age_session)
+    await session.commit()
 
 
 async def set_synchronizing_off(migration_request: str, channel: PikaChannel):
@@ -80,8 +141,34 @@ async def set_synchronizing_off(migration_request: str, channel: PikaChannel):
         'identity_id': migration_request['identity_id']
     }
     logger.info(f"Sending: {failure_synch_dict} to data catalog")
+    await _publish_result(failure_synch_dict, channel)
+
+
+def _select_lane(migration_request: dict) -> MigrationLane:
+    if migration_request['object_name'] or migration_request['object_db_path'] or migration_request.get('objects'):
+        return MigrationLane.OBJECT
+    return MigrationLane.FULL
+
+
+async def _publish_result(result: dict, channel: PikaChannel):
+    body, properties = encode_message(
+        result, settings.migration_result_serializer, settings.migration_result_compression
+    )
+    max_body_size = settings.migration_result_max_body_size
+    if max_body_size is not None and len(body) > max_body_size and result.get('graph_migration') is not None:
+        logger.info(
+            f"Result of {len(body)} bytes exceeds {max_body_size} bytes, "
+            f"sending graph migration guid {result['graph_migration_guid']} only"
+        )
+        body, properties = encode_message(
+            {**result, 'graph_migration': None},
+            settings.migration_result_serializer,
+            settings.migration_result_compression
+        )
+
     await channel.basic_publish(
         exchange=settings.migration_exchange,
         routing_key='result',
-        body=json.dumps(failure_synch_dict)
+        body=body,
+        properties=properties
     )
@@ -0,0 +1,48 @@
+import os
+
+from typing import TextIO
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+from migration_service.settings import settings
+
+tracer = trace.get_tracer('migration_service')
+
+_tracer_provider: TracerProvider | None = None
+_trace_file: TextIO | None = None
+
+
+def config_tracing():
+    global _tracer_provider, _trace_file
+    match settings.tracing_exporter:
+        case None:
+            return
+        case 'console':
+            exporter = ConsoleSpanExporter()
+        case 'file':
+            os.makedirs(settings.log_dir, exist_ok=True)
+            _trace_file = open(os.path.join(settings.log_dir, settings.tracing_file_name), 'a')
+            exporter = ConsoleSpanExporter(
+                out=_trace_file,
+                formatter=lambda span: span.to_json(indent=None) + os.linesep
+            )
+        case _:
+            raise ValueError(f'Unknown tracing exporter: {settings.tracing_exporter}')
+
+    _tracer_provider = TracerProvider(resource=Resource.create({'service.name': 'graph_db_migrater'}))
+    _tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_tracer_provider)
+
+
+def shutdown_tracing():
+    global _tracer_provider, _trace_file
+    if _tracer_provider is not None:
+        # the batched spans are exported before the file they are written to is closed
+        _tracer_provider.shutdown()
+        _tracer_provider = None
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
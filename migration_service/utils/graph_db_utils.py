@@ -1,52 +1,222 @@
-from typing import Set
-from psycopg2 import sql
+import json
+import logging
+import re
+import time
+
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+from psycopg2 import sql, Error as PsycopgError
+from psycopg2.errors import InvalidSchemaName as UndefinedGraph
+from psycopg2.extensions import cursor as Cursor
 from age import Age
+from age.age import buildCypher
 
+from migration_service.memory_graph import MemoryConnection
+from migration_service.schemas.catalog import Catalog, StringPool
+from migration_service.metrics import track_stage, CYPHER_SECONDS, CYPHER_PAYLOAD_BYTES
+from migration_service.settings import settings
+from migration_service.tracing import tracer
 from migration_service.utils.migration_utils import to_batches
 
+slow_query_logger = logging.getLogger('migration_service.slow_queries')
 
-def get_graph_db_tables(db_namespaces: set[str], age_session: Age) -> dict[str, set[str]]:
-    graph_to_tables: dict[str, set[str]] = {}
-    for db_ns in db_namespaces:
-        ag = age_session.setGraph(db_ns)
-        cursor = ag.execCypher(
-            """
-            MATCH (obj:Table) 
-            RETURN obj.name as name
-            """,
-            cols=['name']
-        )
-        graph_to_tables[db_ns] = {row[0] for row in cursor}
+T = TypeVar('T')
+
+_CYPHER_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+_CYPHER_LIST_ITEM = r'(?:\?|\x00|\{[^{}\[\]]*\})'
+_CYPHER_INNERMOST_LIST = re.compile(rf'\[\s*(?:{_CYPHER_LIST_ITEM}(?:\s*,\s*{_CYPHER_LIST_ITEM})*)?\s*\]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def exec_cypher(age_session: Age, template_name: str, cypher_stmt: str, cols: list = None, params: tuple = None) -> Cursor:
+    def execute() -> tuple[Cursor, int]:
+        cursor = age_session.execCypher(cypher_stmt, cols=cols, params=params)
+        return cursor, cursor.rowcount
+
+    return _exec_timed(
+        age_session, template_name, cypher_stmt, {'graph': age_session.graphName}, execute,
+        lambda: buildCypher(age_session.graphName, cypher_stmt, cols), params
+    )
+
+
+def _exec_timed(
+        age_session: Age, template_name: str, stmt: str, attributes: dict[str, Any],
+        execute: Callable[[], tuple[T, int]], build_sql: Callable[[], str], params: tuple | None = None
+) -> T:
+    # spans, metrics and the slow statement log are shared by single graph and union statements
+    payload_size = len(stmt.encode())
+    with tracer.start_as_current_span(
+            'cypher', attributes={**attributes, 'template': template_name, 'bytes': payload_size}
+    ) as span:
+        started_at = time.perf_counter()
+        result, rows = execute()
+        duration = time.perf_counter() - started_at
+        span.set_attribute('rows', rows)
+
+    CYPHER_SECONDS.labels(template_name).observe(duration)
+    CYPHER_PAYLOAD_BYTES.labels(template_name).observe(payload_size)
+    if settings.slow_cypher_threshold is not None and duration >= settings.slow_cypher_threshold:
+        _log_slow_cypher(age_session, template_name, stmt, attributes, build_sql, params, duration, payload_size, rows)
+    return result
+
+
+def render_sql(composable: sql.Composable, connection) -> str:
+    if isinstance(connection, MemoryConnection):
+        return connection.render(composable)
+    return composable.as_string(connection)
+
+
+def normalize_cypher(cypher_stmt: str) -> str:
+    normalized = _CYPHER_LITERAL.sub('?', cypher_stmt)
+    # batches differ only in the records of their lists
+    while True:
+        normalized, replaced = _CYPHER_INNERMOST_LIST.subn('\0', normalized)
+        if not replaced:
+            break
+    return _WHITESPACE.sub(' ', normalized).strip().replace('\0', '[...]')
+
+
+def _log_slow_cypher(
+        age_session: Age, template_name: str, stmt: str, attributes: dict[str, Any], build_sql: Callable[[], str],
+        params: tuple | None, duration: float, payload_size: int, rows: int
+):
+    record = {
+        **attributes,
+        'template': template_name,
+        'duration': round(duration, 6),
+        'bytes': payload_size,
+        'rows': rows,
+        'query': normalize_cypher(stmt)
+    }
+    if settings.slow_cypher_explain and not isinstance(age_session.connection, MemoryConnection):
+        record['plan'] = _explain_sql(age_session, build_sql(), params)
+    slow_query_logger.warning(json.dumps(record))
+
+
+def _explain_sql(age_session: Age, stmt: str, params: tuple | None) -> list[str] | str:
+    # the statement runs again, the savepoint keeps its writes out of the transaction
+    with age_session.connection.cursor() as cursor:
+        cursor.execute('SAVEPOINT explain_slow_cypher')
+        try:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {stmt}', params)
+            return [row[0] for row in cursor]
+        except PsycopgError as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_cypher')
+            cursor.execute('RELEASE SAVEPOINT explain_slow_cypher')
+
+
+@track_stage('get_graph_db_tables')
+def get_graph_db_tables(db_namespaces: Iterable[str], age_session: Age) -> dict[str, set[str]]:
+    graph_to_tables: dict[str, set[str]] = {db_ns: set() for db_ns in db_namespaces}
+    cypher_stmt = """
+                  MATCH (obj:Table) 
+                  RETURN obj.name as name
+                  """
+    rows = exec_graphs_cypher(
+        age_session, 'match_tables', ((db_ns, cypher_stmt) for db_ns in graph_to_tables), cols=['name']
+    )
+    for db_ns, name in rows:
+        graph_to_tables[db_ns].add(name)
     return graph_to_tables
 
 
-def get_graph_db_table(db_namespaces: set[str], table_name: str, age_session: Age) -> dict[str, set[str]]:
-    graph_to_tables: dict[str, set[str]] = {}
-    for db_ns in db_namespaces:
-        ag = age_session.setGraph(db_ns)
-        cursor = ag.execCypher(
-            """
-            MATCH (obj:Table {name: %s}) 
-            RETURN obj.name as name
-            """,
-            cols=['name'],
-            params=(table_name,)
-        )
-        graph_to_tables[db_ns] = {row[0] for row in cursor}
+@track_stage('get_graph_db_tables_by_names')
+def get_graph_db_tables_by_names(ns_to_table_names: dict[str, set[str]], age_session: Age) -> dict[str, set[str]]:
+    # every graph is asked only for the tables requested in its namespace
+    graph_to_tables: dict[str, set[str]] = {db_ns: set() for db_ns in ns_to_table_names}
+    graph_stmts = []
+    for db_ns, table_names in ns_to_table_names.items():
+        for tables_batch in to_batches(table_names):
+            params = sql.SQL(',').join(map(sql.Literal, tables_batch))
+            params = sql.SQL('[{}]').format(params)
+            params = render_sql(params, age_session.connection)
+            graph_stmts.append(
+                (
+                    db_ns,
+                    """
+                    MATCH (obj:Table) 
+                    WHERE obj.name IN {} 
+                    RETURN obj.name as name
+                    """.format(params)
+                )
+            )
+
+    for db_ns, name in exec_graphs_cypher(age_session, 'match_tables_by_names', graph_stmts, cols=['name']):
+        graph_to_tables[db_ns].add(name)
     return graph_to_tables
 
 
+def exec_graphs_cypher(
+        age_session: Age, template_name: str, graph_stmts: Iterable[tuple[str, str]], cols: list[str]
+) -> Iterator[tuple]:
+    graph_stmts = list(graph_stmts)
+    if isinstance(age_session.connection, MemoryConnection):
+        # in process graphs have no round trips to save
+        for graph_name, cypher_stmt in graph_stmts:
+            ag = age_session.setGraph(graph_name)
+            for row in exec_cypher(ag, template_name, cypher_stmt, cols=cols):
+                yield graph_name, *row
+        return
+
+    # graphs that don't exist yet have no tables, they are created once a migration is applied to them
+    graph_cache = age_session.graph_cache
+    existing_graphs = set(graph_cache.existing({graph_name for graph_name, _ in graph_stmts}, age_session.connection))
+    for stmts_batch in to_batches(
+            (graph_name, cypher_stmt) for graph_name, cypher_stmt in graph_stmts if graph_name in existing_graphs
+    ):
+        try:
+            yield from _exec_union_cypher(age_session, template_name, stmts_batch, cols)
+        except UndefinedGraph:
+            # a cached graph was dropped since, the batch runs again against the graphs that still exist
+            age_session.rollback()
+            batch_graphs = {graph_name for graph_name, _ in stmts_batch}
+            graph_cache.discard(batch_graphs)
+            existing_batch_graphs = set(graph_cache.existing(batch_graphs, age_session.connection))
+            stmts_batch = [
+                (graph_name, cypher_stmt) for graph_name, cypher_stmt in stmts_batch
+                if graph_name in existing_batch_graphs
+            ]
+            if stmts_batch:
+                yield from _exec_union_cypher(age_session, template_name, stmts_batch, cols)
+
+
+def _exec_union_cypher(
+        age_session: Age, template_name: str, stmts_batch: list[tuple[str, str]], cols: list[str]
+) -> list[tuple]:
+    # one round trip for the whole batch of graphs instead of a setGraph and a query per graph
+    columns = sql.SQL(', ').join(sql.SQL('{} agtype').format(sql.Identifier(col)) for col in cols)
+    stmt = sql.SQL(' UNION ALL ').join(
+        sql.SQL('SELECT {}::text, * FROM cypher({}, $$ {} $$) AS ({})').format(
+            sql.Literal(graph_name), sql.Literal(graph_name), sql.SQL(cypher_stmt), columns
+        )
+        for graph_name, cypher_stmt in stmts_batch
+    )
+    stmt = render_sql(stmt, age_session.connection)
+
+    def execute() -> tuple[list[tuple], int]:
+        with age_session.connection.cursor() as cursor:
+            cursor.execute(stmt)
+            rows = cursor.fetchall()
+        return rows, len(rows)
+
+    return _exec_timed(age_session, template_name, stmt, {'graphs': len(stmts_batch)}, execute, lambda: stmt)
+
+
+@track_stage('get_graph_db_table_col_type')
 def get_graph_db_table_col_type(
-        db_source: str, ns: str, table_names: set[str], age_session: Age
-) -> list[tuple[str, str, str, str]]:
+        db_source: str, ns: str, table_names: set[str], age_session: Age, pool: StringPool | None = None
+) -> Catalog:
     ag = age_session.setGraph(f'{db_source}.{ns}')
-    res = []
+    catalog = Catalog(pool)
     for tables_batch in to_batches(table_names):
         params = sql.SQL(',').join(map(sql.Literal, tables_batch))
         params = sql.SQL('[{}]').format(params)
-        params = params.as_string(ag.connection)
+        params = render_sql(params, ag.connection)
 
-        cursor = ag.execCypher(
+        cursor = exec_cypher(
+            ag,
+            'match_table_fields',
             """
             MATCH (obj:Table)-[:ATTR]->(f:Field) 
             WHERE obj.name IN {} 
@@ -54,11 +224,12 @@ def get_graph_db_table_col_type(
             """.format(params),
             cols=['object_db', 'object_name', 'field_name', 'field_db_type']
         )
-        res.extend(
-            [(row[0], row[1], row[2], row[3]) for row in cursor]
-        )
+        for row in cursor:
+            catalog.add(row[0], row[1], row[2], row[3])
 
-        cursor = ag.execCypher(
+        cursor = exec_cypher(
+            ag,
+            'match_tables_without_fields',
             """
             MATCH (obj:Table)
             WHERE not exists((obj)-[:ATTR]->(:Field)) AND obj.name IN {} 
@@ -66,7 +237,6 @@ def get_graph_db_table_col_type(
             """.format(params),
             cols=['object_db', 'object_name']
         )
-        res.extend(
-            [(row[0], row[1], None, None) for row in cursor]
-        )
-    return list(sorted(res, key=lambda row: row[0]))
+        for row in cursor:
+            catalog.add(row[0], row[1], None, None)
+    return catalog
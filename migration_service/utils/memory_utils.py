@@ -0,0 +1,46 @@
+import threading
+import tracemalloc
+
+from migration_service.errors import MemorySoftCapExceeded
+from migration_service.settings import settings
+
+# the traced peak is process wide, so it is folded into every running stage before it is reset
+_lock = threading.Lock()
+_running_stages: list[list[int]] = []
+
+
+def start_stage() -> list[int]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    with _lock:
+        current = _fold_peak()
+        # [traced memory at the start of the stage, peak traced memory during the stage]
+        stage = [current, current]
+        _running_stages.append(stage)
+    return stage
+
+
+def stop_stage(stage: list[int]) -> tuple[int, int]:
+    with _lock:
+        current = _fold_peak()
+        _running_stages.remove(stage)
+    started_with, peak = stage
+    return peak - started_with, current - started_with
+
+
+def check_memory_soft_cap(peak: int | None = None):
+    if settings.memory_soft_cap is None or not tracemalloc.is_tracing():
+        return
+
+    traced = max(tracemalloc.get_traced_memory()[0], peak or 0)
+    if traced > settings.memory_soft_cap:
+        raise MemorySoftCapExceeded(traced, settings.memory_soft_cap)
+
+
+def _fold_peak() -> int:
+    current, peak = tracemalloc.get_traced_memory()
+    for stage in _running_stages:
+        stage[1] = max(stage[1], peak)
+    tracemalloc.reset_peak()
+    return current
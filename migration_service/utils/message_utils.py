@@ -0,0 +1,46 @@
+import gzip
+import json
+
+import msgpack
+import orjson
+import zstandard
+
+from pika import BasicProperties
+
+
+_SERIALIZER_TO_CONTENT_TYPE = {
+    'json': 'application/json',
+    'orjson': 'application/json',
+    'msgpack': 'application/msgpack'
+}
+
+
+def serialize(payload: dict, serializer: str) -> bytes:
+    match serializer:
+        case 'json':
+            return json.dumps(payload).encode()
+        case 'orjson':
+            return orjson.dumps(payload)
+        case 'msgpack':
+            return msgpack.packb(payload)
+    raise ValueError(f'Unknown serializer: {serializer}')
+
+
+def compress(body: bytes, compression: str | None) -> bytes:
+    match compression:
+        case None:
+            return body
+        case 'gzip':
+            return gzip.compress(body, compresslevel=6)
+        case 'zstd':
+            return zstandard.ZstdCompressor(level=3).compress(body)
+    raise ValueError(f'Unknown compression: {compression}')
+
+
+def encode_message(payload: dict, serializer: str, compression: str | None) -> tuple[bytes, BasicProperties]:
+    body = compress(serialize(payload, serializer), compression)
+    properties = BasicProperties(
+        content_type=_SERIALIZER_TO_CONTENT_TYPE[serializer],
+        content_encoding=compression
+    )
+    return body, properties
@@ -1,6 +1,25 @@
 import difflib
 
-from typing import Iterable, Optional
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+
+# a chunk of a record's field list, the fields are sliced only when the batch is encoded
+@dataclass(slots=True)
+class RecordSlice:
+    record: Any
+    fields_key: str
+    start: int
+    stop: int
+
+    @property
+    def fields(self) -> list:
+        return getattr(self.record, self.fields_key)[self.start:self.stop]
+
+    def __reduce__(self):
+        # only the slice is sent to a worker process, not the whole field list
+        fields = self.fields
+        return RecordSlice, (self.record.copy(update={self.fields_key: fields}), self.fields_key, 0, len(fields))
 
 
 def to_batches(iterable: Iterable, size: int = 50):
@@ -9,28 +28,22 @@ def to_batches(iterable: Iterable, size: int = 50):
         batch_records.append(record)
         if len(batch_records) >= size:
             yield batch_records
-            batch_records.clear()
+            batch_records = []
 
     if batch_records:
         yield batch_records
 
 
-def alter_to_batches(records: Iterable, size: int = 50):
+def alter_to_batches(records: Iterable, fields_key: str, size: int = 50):
     batches = []
     for rec in records:
-        for fields_key in ('fields_to_create', 'fields_to_alter', 'fields_to_delete'):
-            fields = rec[fields_key]
-            fields_len = len(fields)
+        fields_len = len(getattr(rec, fields_key))
+        for ndx in range(0, fields_len, size):
+            batches.append(RecordSlice(rec, fields_key, ndx, min(ndx + size, fields_len)))
 
-            for ndx in range(0, fields_len, size):
-                field_batch = rec[fields_key][ndx:min(ndx + size, fields_len)]
-                item = {**rec, fields_key: field_batch}
-
-                batches.append(item)
-
-            if len(batches) >= size:
-                yield batches
-                batches.clear()
+        if len(batches) >= size:
+            yield batches
+            batches = []
     if batches:
         yield batches
 
@@ -42,7 +55,7 @@ def delete_to_batches(records: Iterable, size: int = 50):
 
         if len(batches) >= size:
             yield batches
-            batches.clear()
+            batches = []
     if batches:
         yield batches
 
@@ -50,20 +63,16 @@ def delete_to_batches(records: Iterable, size: int = 50):
 def add_to_batches(records: Iterable, size: int = 50):
     batches = []
     for rec in records:
-        fields = rec['fields']
-        fields_len = len(fields)
+        fields_len = len(rec.fields)
         if fields_len:
             for ndx in range(0, fields_len, size):
-                field_batch = rec['fields'][ndx:min(ndx + size, fields_len)]
-                item = {**rec, 'fields': field_batch}
-                batches.append(item)
+                batches.append(RecordSlice(rec, 'fields', ndx, min(ndx + size, fields_len)))
         else:
-            item = {**rec, 'fields': []}
-            batches.append(item)
+            batches.append(RecordSlice(rec, 'fields', 0, 0))
 
         if len(batches) >= size:
             yield batches
-            batches.clear()
+            batches = []
     if batches:
         yield batches
 
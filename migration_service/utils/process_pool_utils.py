@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import psycopg2
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from migration_service.memory_graph import MemoryConnection
+from migration_service.settings import settings
+from migration_service.utils.profiling_utils import profiled_to_thread
+
+logger = logging.getLogger(__name__)
+
+_process_pool: ProcessPoolExecutor | None = None
+# the pool is started lazily from the event loop and from to_thread workers
+_process_pool_lock = threading.Lock()
+# opened once per worker process, graph literals are quoted the way the graph connection quotes them
+_quoting_connection = None
+
+
+def get_process_pool() -> ProcessPoolExecutor | None:
+    global _process_pool
+    if settings.cpu_workers <= 0:
+        return None
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                logger.info(f'Starting {settings.cpu_workers} worker processes')
+                # spawned workers don't inherit the loop, the pools and the open sockets of the service
+                _process_pool = ProcessPoolExecutor(
+                    settings.cpu_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+    return _process_pool
+
+
+async def run_in_process_pool(func: Callable, *args):
+    process_pool = get_process_pool()
+    if process_pool is None:
+        return await profiled_to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(process_pool, func, *args)
+
+
+def shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+
+def get_quoting_connection():
+    global _quoting_connection
+    if settings.graph_backend == 'memory':
+        return MemoryConnection()
+    if _quoting_connection is None or _quoting_connection.closed:
+        _quoting_connection = psycopg2.connect(settings.age_connection_string)
+    return _quoting_connection
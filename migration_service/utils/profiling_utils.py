@@ -0,0 +1,88 @@
+import os
+import asyncio
+import cProfile
+import pstats
+import logging
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable
+
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+
+from migration_service.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# profilers hook into the interpreter globally, so only one sync is profiled at a time
+_profile_lock = asyncio.Lock()
+# profiles of the worker threads of the sync being profiled, to_thread copies the context into the worker
+_thread_profiles: ContextVar[list[cProfile.Profile] | None] = ContextVar('_thread_profiles', default=None)
+
+
+@asynccontextmanager
+async def profile_sync(tag: str, enabled: bool):
+    if not enabled:
+        yield
+        return
+
+    if _profile_lock.locked():
+        logger.info(f'Another sync is being profiled, {tag} runs without profiling')
+        yield
+        return
+
+    async with _profile_lock:
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        file_name = f'{tag}-{datetime.now():%Y%m%dT%H%M%S}'.replace(os.sep, '_')
+        path = os.path.join(settings.profile_dir, file_name)
+
+        match settings.profiler:
+            case 'cprofile':
+                # cProfile only sees its own thread, the apply, graph reads and compilation run in to_thread workers
+                # that profiled_to_thread profiles into the same stats
+                thread_profiles = []
+                thread_profiles_token = _thread_profiles.set(thread_profiles)
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    _thread_profiles.reset(thread_profiles_token)
+                    pstats.Stats(profiler, *thread_profiles).dump_stats(f'{path}.pstats')
+                    logger.info(
+                        f'Profile of {tag} and {len(thread_profiles)} worker thread calls was written to {path}.pstats'
+                    )
+            case 'pyinstrument':
+                # samples the sync task only, time spent in to_thread workers shows up as awaiting them
+                profiler = Profiler(async_mode='enabled')
+                profiler.start()
+                try:
+                    yield
+                finally:
+                    profiler.stop()
+                    with open(f'{path}.speedscope.json', 'w') as f:
+                        f.write(profiler.output(SpeedscopeRenderer()))
+                    logger.info(f'Profile of {tag} was written to {path}.speedscope.json')
+            case _:
+                raise ValueError(f'Unknown profiler: {settings.profiler}')
+
+
+async def profiled_to_thread(func: Callable, *args) -> Any:
+    return await asyncio.to_thread(_run_profiled, func, *args)
+
+
+def _run_profiled(func: Callable, *args) -> Any:
+    thread_profiles = _thread_profiles.get()
+    if thread_profiles is None:
+        return func(*args)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        profiler.disable()
+        thread_profiles.append(profiler)
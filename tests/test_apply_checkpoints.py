@@ -0,0 +1,87 @@
+import pytest
+
+from migration_service.memory_graph import MemoryAge, MemoryGraphStore
+from migration_service.schemas.fields import FieldToCreate
+from migration_service.schemas.migrations import ApplySchema, MigrationPattern
+from migration_service.schemas.tables import HubToCreate, SatToCreate, OneWayLink
+from migration_service.services.migration import ApplyStatement, _compile_schema, _exec_statements_tx
+
+GRAPH_NAME = 'shop.dv_raw'
+
+
+class _FailingAge(MemoryAge):
+    def __init__(self, store: MemoryGraphStore, fail_at: int | None = None):
+        super().__init__(store)
+        self.executed: list[str] = []
+        self._fail_at = fail_at
+        self._calls = 0
+
+    def execCypher(self, cypherStmt: str, cols: list = None, params: tuple = None):
+        self._calls += 1
+        if self._calls == self._fail_at:
+            raise ConnectionError('graph connection was lost')
+        cursor = super().execCypher(cypherStmt, cols=cols, params=params)
+        self.executed.append(cypherStmt)
+        return cursor
+
+
+def _apply_schema() -> ApplySchema:
+    return ApplySchema(
+        name='dv_raw',
+        hubs_to_create=[
+            HubToCreate(
+                name=f'hub_{ndx}', db='shop', pk='hash_key',
+                fields=[FieldToCreate(name='hash_key', db_type='text')]
+            )
+            for ndx in range(120)
+        ],
+        sats_to_create=[
+            SatToCreate(
+                name=f'hub_{ndx}_sat', db='shop', link=OneWayLink(fk=f'hub_{ndx}_hash_fkey'),
+                fields=[FieldToCreate(name=f'hub_{ndx}_hash_fkey', db_type='text')]
+            )
+            for ndx in range(60)
+        ]
+    )
+
+
+def _apply(age_session: MemoryAge, checkpoints: dict[tuple[str, int], str]):
+    def record_checkpoint(statement: ApplyStatement, digest: str):
+        checkpoints[(statement.template_name, statement.batch_index)] = digest
+
+    _exec_statements_tx(
+        _compile_schema(_apply_schema(), MigrationPattern()), age_session.setGraph(GRAPH_NAME), {},
+        dict(checkpoints), record_checkpoint
+    )
+
+
+def test_resumed_apply_skips_committed_batches():
+    store = MemoryGraphStore()
+    checkpoints: dict[tuple[str, int], str] = {}
+
+    interrupted = _FailingAge(store, fail_at=4)
+    with pytest.raises(ConnectionError):
+        _apply(interrupted, checkpoints)
+    assert len(interrupted.executed) == len(checkpoints) == 3
+
+    resumed = _FailingAge(store)
+    _apply(resumed, checkpoints)
+
+    uninterrupted = _FailingAge(MemoryGraphStore())
+    _apply(uninterrupted, {})
+    assert sorted(interrupted.executed + resumed.executed) == sorted(uninterrupted.executed)
+
+    graph = store.graph(GRAPH_NAME)
+    table_names = [node.properties['name'] for node in graph.nodes.values() if node.label == 'Table']
+    assert len(table_names) == len(set(table_names)) == 180
+
+
+def test_changed_batch_is_applied_again():
+    store = MemoryGraphStore()
+    checkpoints: dict[tuple[str, int], str] = {}
+    _apply(_FailingAge(store), checkpoints)
+
+    checkpoints[('create_hubs_query', 1)] = 'digest of a batch that was applied before'
+    resumed = _FailingAge(store)
+    _apply(resumed, checkpoints)
+    assert len(resumed.executed) == 1
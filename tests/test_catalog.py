@@ -0,0 +1,51 @@
+from migration_service.schemas.catalog import Catalog, StringPool
+
+
+def test_interleaved_columns_are_laid_out_by_table():
+    catalog = Catalog.from_records(
+        [
+            ('shop.dv_raw.customer', 'customer', 'id', 'int'),
+            ('shop.dv_raw.order', 'order', 'id', 'int'),
+            ('shop.dv_raw.customer', 'customer', 'email', 'str'),
+            ('shop.dv_raw.empty', 'empty', None, None),
+            ('shop.dv_raw.order', 'order', 'total', 'float'),
+            ('shop.dv_raw.customer', 'customer', 'meta', None),
+            ('shop.dv_raw.order', 'order', 'customer_id', 'int')
+        ]
+    )
+
+    assert len(catalog) == 3
+    assert catalog.columns == 6
+    assert list(catalog.get('customer').fields()) == [('id', 'int'), ('email', 'str'), ('meta', None)]
+    assert list(catalog.get('order').fields()) == [('id', 'int'), ('total', 'float'), ('customer_id', 'int')]
+    assert list(catalog.get('empty').fields()) == []
+    assert [len(table) for table in catalog] == [3, 3, 0]
+    assert [table.db for table in catalog] == ['shop.dv_raw.customer', 'shop.dv_raw.order', 'shop.dv_raw.empty']
+
+
+def test_columns_added_after_the_layout():
+    catalog = Catalog(StringPool())
+    catalog.add('shop.dv_raw.customer', 'customer', 'id', 'int')
+    catalog.add('shop.dv_raw.order', 'order', 'id', 'int')
+    assert len(catalog.get('customer')) == 1
+
+    catalog.add('shop.dv_raw.customer', 'customer', 'email', 'str')
+    catalog.add('shop.dv_raw.payment', 'payment', 'id', 'int')
+    catalog.add('shop.dv_raw.order', 'order', 'total', 'float')
+
+    assert list(catalog.get('customer').fields()) == [('id', 'int'), ('email', 'str')]
+    assert list(catalog.get('order').fields()) == [('id', 'int'), ('total', 'float')]
+    assert list(catalog.get('payment').fields()) == [('id', 'int')]
+    assert catalog.get('missing') is None
+
+
+def test_grouped_columns_keep_their_order():
+    catalog = Catalog.from_records(
+        [
+            ('shop.dv_raw.customer', 'customer', 'id', 'int'),
+            ('shop.dv_raw.customer', 'customer', 'email', 'str'),
+            ('shop.dv_raw.order', 'order', 'id', 'int')
+        ]
+    )
+
+    assert [list(table.fields()) for table in catalog] == [[('id', 'int'), ('email', 'str')], [('id', 'int')]]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from migration_service.crud import migration as crud_migration
+from migration_service.schemas.migrations import MigrationIn
+from migration_service.settings import settings, SourceFilter
+
+CONN_STRING = 'postgresql://localhost:5432/shop'
+
+# (high water mark, schema, table) of every captured DDL change
+DDL_LOG = [(1, 'dv_raw', 'customer_hub'), (2, 'dv_raw', 'order_hub'), (3, 'dv_raw', 'customer_sat')]
+
+
+class _DDLLogExtractor:
+    def __init__(self, source_filter: SourceFilter | None):
+        self._source_filter = source_filter
+
+    async def extract_ddl_changes(self, since: int | None) -> tuple[int | None, dict[str, set[str]] | None]:
+        high_water_mark = DDL_LOG[-1][0]
+        if since is None:
+            return high_water_mark, None
+
+        changed_ns_to_table: dict[str, set[str]] = {}
+        for mark, schema, table in DDL_LOG:
+            if mark > since and (self._source_filter is None or self._source_filter.matches(schema, table)):
+                changed_ns_to_table.setdefault(f'shop.{schema}', set()).add(table)
+        return high_water_mark, changed_ns_to_table
+
+
+@pytest.fixture
+def applied_marks(monkeypatch) -> list[int | None]:
+    # the marks of the applied migrations, the last one that isn't null is where the next sync starts
+    marks = [0]
+
+    async def select_last_ddl_high_water_mark(db_source, session):
+        return next((mark for mark in reversed(marks) if mark is not None), None)
+
+    monkeypatch.setattr(settings, 'ddl_capture', True)
+    monkeypatch.setattr(crud_migration, '_select_last_ddl_high_water_mark', select_last_ddl_high_water_mark)
+    return marks
+
+
+def _sync(migration_in: MigrationIn, applied_marks: list[int | None]) -> dict[str, set[str]] | None:
+    high_water_mark, changed_ns_to_table = asyncio.run(
+        crud_migration._extract_ddl_changes(
+            'shop', _DDLLogExtractor(migration_in.source_filter), None,
+            skip=crud_migration._skips_ddl_changes(migration_in)
+        )
+    )
+    applied_marks.append(high_water_mark)
+    return changed_ns_to_table
+
+
+def test_filtered_sync_keeps_the_high_water_mark(applied_marks):
+    filtered_in = MigrationIn(
+        name='hubs', conn_string=CONN_STRING, source_filter=SourceFilter(include_tables=['%\\_hub'])
+    )
+    assert _sync(filtered_in, applied_marks) is None
+    assert applied_marks[-1] is None
+
+    default_in = MigrationIn(name='all', conn_string=CONN_STRING)
+    assert _sync(default_in, applied_marks) == {'shop.dv_raw': {'customer_hub', 'order_hub', 'customer_sat'}}
+    assert applied_marks[-1] == 3
+
+
+def test_object_sync_keeps_the_high_water_mark(applied_marks):
+    object_in = MigrationIn(name='hub', conn_string=CONN_STRING, object_name='customer_hub', object_db_path='dv_raw')
+    assert _sync(object_in, applied_marks) is None
+
+    default_in = MigrationIn(name='all', conn_string=CONN_STRING)
+    assert _sync(default_in, applied_marks) == {'shop.dv_raw': {'customer_hub', 'order_hub', 'customer_sat'}}
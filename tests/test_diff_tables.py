@@ -0,0 +1,75 @@
+import pytest
+
+from migration_service.crud.migration import _diff_tables
+from migration_service.models import migrations
+from migration_service.schemas.catalog import Catalog, StringPool
+
+
+def _diff(db_records: list[tuple], graph_db_records: list[tuple]) -> dict[tuple, set[tuple]]:
+    pool = StringPool()
+    schema = migrations.Schema(name='shop.dv_raw')
+    _diff_tables(Catalog.from_records(db_records, pool), Catalog.from_records(graph_db_records, pool), schema)
+    return {
+        (table.old_name, table.new_name, table.db): {
+            (field.old_name, field.new_name, field.old_type, field.new_type) for field in table.fields
+        }
+        for table in schema.tables
+    }
+
+
+def test_table_only_in_source_is_created():
+    assert _diff(
+        [('shop.dv_raw.customer', 'customer', 'id', 'int'), ('shop.dv_raw.customer', 'customer', 'email', 'str')],
+        []
+    ) == {
+        (None, 'customer', 'shop.dv_raw.customer'): {(None, 'id', None, 'int'), (None, 'email', None, 'str')}
+    }
+
+
+def test_table_only_in_graph_is_deleted():
+    assert _diff([], [('shop.dv_raw.customer', 'customer', 'id', 'int')]) == {
+        ('customer', None, 'shop.dv_raw.customer'): set()
+    }
+
+
+def test_fields_are_added_dropped_and_retyped():
+    assert _diff(
+        [
+            ('shop.dv_raw.customer', 'customer', 'id', 'int'),
+            ('shop.dv_raw.customer', 'customer', 'email', 'str'),
+            ('shop.dv_raw.customer', 'customer', 'score', 'float')
+        ],
+        [
+            ('shop.dv_raw.customer', 'customer', 'id', 'int'),
+            ('shop.dv_raw.customer', 'customer', 'score', 'int'),
+            ('shop.dv_raw.customer', 'customer', 'phone', 'str')
+        ]
+    ) == {
+        ('customer', 'customer', 'shop.dv_raw.customer'): {
+            (None, 'email', None, 'str'),
+            ('score', 'score', 'int', 'float'),
+            ('phone', None, 'str', None)
+        }
+    }
+
+
+def test_unchanged_tables_are_skipped():
+    records = [('shop.dv_raw.customer', 'customer', 'id', 'int'), ('shop.dv_raw.order', 'order', 'id', 'int')]
+    assert _diff(records, list(reversed(records))) == {}
+
+
+def test_columnless_tables():
+    assert _diff(
+        [('shop.dv_raw.empty', 'empty', None, None), ('shop.dv_raw.emptied', 'emptied', None, None)],
+        [('shop.dv_raw.empty', 'empty', None, None), ('shop.dv_raw.emptied', 'emptied', 'id', 'int')]
+    ) == {
+        ('emptied', 'emptied', 'shop.dv_raw.emptied'): {('id', None, 'int', None)}
+    }
+    assert _diff([('shop.dv_raw.empty', 'empty', None, None)], []) == {
+        (None, 'empty', 'shop.dv_raw.empty'): set()
+    }
+
+
+def test_catalogs_have_to_share_their_pool():
+    with pytest.raises(ValueError):
+        _diff_tables(Catalog(), Catalog(), migrations.Schema(name='shop.dv_raw'))
@@ -0,0 +1,133 @@
+import pytest
+
+from migration_service.memory_graph import MemoryAge, MemoryGraph, MemoryGraphStore
+from migration_service.schemas.fields import FieldToCreate, FieldToAlter
+from migration_service.schemas.migrations import ApplySchema, MigrationPattern
+from migration_service.schemas.tables import HubToCreate, SatToCreate, LinkToCreate, OneWayLink, TableToAlter
+from migration_service.services.migration import _compile_schema, _exec_statements_tx
+
+GRAPH_NAME = 'shop.dv_raw'
+
+
+@pytest.fixture
+def store():
+    return MemoryGraphStore()
+
+
+@pytest.fixture
+def created(store):
+    _apply(
+        store,
+        ApplySchema(
+            name='dv_raw',
+            hubs_to_create=[
+                HubToCreate(name='customer', db='shop', pk='hash_key', fields=[_field('hash_key'), _field('id', 'int4')]),
+                HubToCreate(name='order', db='shop', pk='hash_key', fields=[_field('hash_key'), _field('id', 'int4')])
+            ],
+            sats_to_create=[
+                SatToCreate(
+                    name='customer_sat', db='shop', link=OneWayLink(fk='customer_hash_fkey'),
+                    fields=[_field('customer_hash_fkey'), _field('email')]
+                )
+            ],
+            links_to_create=[
+                LinkToCreate(
+                    name='customer_order', db='shop', fields=[_field('customer_hash_fkey'), _field('order_hash_fkey')]
+                )
+            ]
+        )
+    )
+    return store
+
+
+def _field(name: str, db_type: str = 'text') -> FieldToCreate:
+    return FieldToCreate(name=name, db_type=db_type)
+
+
+def _apply(store: MemoryGraphStore, apply_schema: ApplySchema):
+    age_session = MemoryAge(store).setGraph(GRAPH_NAME)
+    _exec_statements_tx(_compile_schema(apply_schema, MigrationPattern()), age_session, {})
+
+
+def _tables(graph: MemoryGraph) -> dict[str, dict[str, str]]:
+    tables = {}
+    for node in graph.nodes.values():
+        if node.label == 'Table':
+            tables[node.properties['name']] = {
+                graph.nodes[graph.edges[edge_id].end_id].properties['name']:
+                    graph.nodes[graph.edges[edge_id].end_id].properties['dbtype']
+                for edge_id in graph.out_edges.get(node.id, ())
+                if graph.edges[edge_id].label == 'ATTR'
+            }
+    return tables
+
+
+def _links(graph: MemoryGraph) -> set[tuple[str, str, str]]:
+    return {
+        (edge.label, graph.nodes[edge.start_id].properties['name'], graph.nodes[edge.end_id].properties['name'])
+        for edge in graph.edges.values()
+        if edge.label != 'ATTR'
+    }
+
+
+def test_create_migration(created):
+    graph = created.graph(GRAPH_NAME)
+
+    assert _tables(graph) == {
+        'customer': {'hash_key': 'text', 'id': 'int4'},
+        'order': {'hash_key': 'text', 'id': 'int4'},
+        'customer_sat': {'customer_hash_fkey': 'text', 'email': 'text'},
+        'customer_order': {'customer_hash_fkey': 'text', 'order_hash_fkey': 'text'}
+    }
+    assert _links(graph) == {
+        ('ONE_TO_MANY', 'customer', 'customer_sat'),
+        ('MANY_TO_ONE', 'customer_sat', 'customer'),
+        ('ONE_TO_MANY', 'customer', 'customer_order'),
+        ('MANY_TO_ONE', 'customer_order', 'customer'),
+        ('ONE_TO_MANY', 'order', 'customer_order'),
+        ('MANY_TO_ONE', 'customer_order', 'order')
+    }
+
+
+def test_alter_migration(created):
+    _apply(
+        created,
+        ApplySchema(
+            name='dv_raw',
+            hubs_to_alter=[
+                TableToAlter(
+                    name='customer',
+                    fields_to_create=[_field('name'), _field('nick')],
+                    fields_to_alter=[FieldToAlter(name='name', old_type='text', new_type='varchar')],
+                    fields_to_delete=['nick']
+                )
+            ]
+        )
+    )
+
+    tables = _tables(created.graph(GRAPH_NAME))
+    assert tables['customer'] == {'hash_key': 'text', 'id': 'int4', 'name': 'varchar'}
+    assert tables['order'] == {'hash_key': 'text', 'id': 'int4'}
+
+
+def test_delete_migration(created):
+    _apply(created, ApplySchema(name='dv_raw', tables_to_delete=['customer_sat', 'customer_order']))
+
+    graph = created.graph(GRAPH_NAME)
+    assert _tables(graph) == {
+        'customer': {'hash_key': 'text', 'id': 'int4'},
+        'order': {'hash_key': 'text', 'id': 'int4'}
+    }
+    assert _links(graph) == set()
+    assert len(graph.nodes) == 6
+
+
+def test_property_index_keeps_bools_apart_from_ints(store):
+    age_session = MemoryAge(store).setGraph(GRAPH_NAME)
+    age_session.execCypher("CREATE (:Field {name: 'flag', value: true})")
+    age_session.execCypher("CREATE (:Field {name: 'count', value: 1})")
+
+    rows = age_session.execCypher("MATCH (f:Field {value: 1}) RETURN f.name").fetchall()
+    assert [row[0] for row in rows] == ['count']
+    nodes = store.graph(GRAPH_NAME).find_nodes_by_values('Field', 'value', [True])
+    assert [node.properties['name'] for node in nodes] == ['flag']
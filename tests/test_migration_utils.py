@@ -0,0 +1,71 @@
+import pickle
+
+from migration_service.schemas.fields import FieldToCreate, FieldToAlter
+from migration_service.schemas.tables import HubToCreate, TableToAlter
+from migration_service.services.migration import _alter_nodes_statements
+from migration_service.utils.migration_utils import RecordSlice, alter_to_batches, add_to_batches
+
+
+def _fields(count: int) -> list[FieldToCreate]:
+    return [FieldToCreate(name=f'field_{ndx}', db_type='text') for ndx in range(count)]
+
+
+def _table_to_alter() -> TableToAlter:
+    return TableToAlter(
+        name='customer',
+        fields_to_create=_fields(120),
+        fields_to_alter=[FieldToAlter(name='id', old_type='int4', new_type='int8')]
+    )
+
+
+def test_alter_batches_are_split_per_field_list():
+    table = _table_to_alter()
+
+    create_batches = list(alter_to_batches([table], 'fields_to_create'))
+    assert [[(item.start, item.stop) for item in batch] for batch in create_batches] == [
+        [(0, 50), (50, 100), (100, 120)]
+    ]
+    assert [len(item.fields) for item in create_batches[0]] == [50, 50, 20]
+
+    assert list(alter_to_batches([table], 'fields_to_delete')) == []
+    assert [[item.fields for item in batch] for batch in alter_to_batches([table], 'fields_to_alter')] == [
+        [table.fields_to_alter]
+    ]
+
+
+def test_alter_statements_carry_only_their_field_list():
+    statements = list(_alter_nodes_statements([_table_to_alter(), TableToAlter(name='order', fields_to_delete=['id'])]))
+
+    assert [(statement.template_name, len(statement.batch)) for statement in statements] == [
+        ('alter_nodes_query_create_fields', 3),
+        ('alter_nodes_query_delete_fields', 1),
+        ('alter_nodes_query_alter_fields', 1)
+    ]
+    for statement, fields_key in zip(statements, ('fields_to_create', 'fields_to_delete', 'fields_to_alter')):
+        assert {item.fields_key for item in statement.batch} == {fields_key}
+
+
+def test_batches_hold_slices_of_several_records():
+    tables = [TableToAlter(name=f'table_{ndx}', fields_to_delete=[f'field_{ndx}']) for ndx in range(70)]
+
+    batches = list(alter_to_batches(tables, 'fields_to_delete'))
+    assert [len(batch) for batch in batches] == [50, 20]
+    assert [item.record.name for item in batches[1]] == [f'table_{ndx}' for ndx in range(50, 70)]
+
+
+def test_columnless_records_are_batched():
+    batches = list(add_to_batches([HubToCreate(name='empty', db='shop')]))
+
+    assert [[(item.record.name, item.fields) for item in batch] for batch in batches] == [[('empty', [])]]
+
+
+def test_pickled_slice_carries_only_its_fields():
+    table = _table_to_alter()
+    record_slice = RecordSlice(table, 'fields_to_create', 50, 100)
+
+    unpickled = pickle.loads(pickle.dumps(record_slice))
+    assert unpickled.fields == record_slice.fields
+    assert unpickled.record.name == 'customer'
+    assert len(unpickled.record.fields_to_create) == 50
+    assert unpickled.record.fields_to_alter == table.fields_to_alter
+    assert len(table.fields_to_create) == 120
@@ -0,0 +1,92 @@
+import asyncio
+import datetime
+
+import pytest
+
+from bson import Binary
+from mongomock_motor import AsyncMongoMockClient
+
+from migration_service.services.metadata_extractor import MongoExtractor
+
+CONN_STRING = 'mongodb://localhost:27017/shop'
+
+
+@pytest.fixture
+def extractor():
+    client = AsyncMongoMockClient(CONN_STRING)
+    MongoExtractor._conn_string_to_client[CONN_STRING] = client
+    yield MongoExtractor(CONN_STRING)
+    MongoExtractor._conn_string_to_client.pop(CONN_STRING)
+
+
+def _insert(extractor: MongoExtractor, collection_name: str, documents: list[dict]):
+    asyncio.run(extractor._database()[collection_name].insert_many(documents))
+
+
+def _extract(extractor: MongoExtractor, table_names: set[str]) -> dict[str, list[tuple[str, str]]]:
+    catalog = asyncio.run(extractor.extract_table_col_type(table_names, 'shop'))
+    return {table.name: sorted(table.fields()) for table in catalog}
+
+
+def test_merges_field_types_across_documents(extractor):
+    _insert(
+        extractor,
+        'orders',
+        [
+            {'qty': 1, 'price': 2, 'at': datetime.datetime(2024, 1, 1), 'meta': {'a': 1}, 'blob': Binary(b'ab')},
+            {'qty': 2, 'price': 2.5, 'tags': ['x']},
+            {'qty': 'three'}
+        ]
+    )
+
+    assert dict(_extract(extractor, {'orders'})['orders']) == {
+        '_id': 'str',
+        'qty': 'json',
+        'price': 'float',
+        'at': 'datetime',
+        'meta': 'json',
+        'blob': 'b64binary',
+        'tags': 'list'
+    }
+
+
+def test_null_only_field_has_no_type(extractor):
+    _insert(extractor, 'events', [{'note': None}, {'note': None, 'kind': 'a'}])
+
+    fields = dict(_extract(extractor, {'events'})['events'])
+    assert fields['note'] == ''
+    assert fields['kind'] == 'str'
+
+
+def test_empty_collection_is_a_table_without_fields(extractor):
+    asyncio.run(extractor._database().create_collection('empty'))
+
+    assert _extract(extractor, {'empty'}) == {'empty': []}
+    assert asyncio.run(extractor.extract_table_names()) == {'shop.shop': {'empty'}}
+
+
+class _SlowCursor:
+    def __init__(self, documents: list[dict]):
+        self._documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            return next(self._documents)
+        except StopIteration:
+            # a $sample scanning a collection that returns nothing more within the budget
+            await asyncio.sleep(60)
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+def test_sample_keeps_documents_read_before_timeout(extractor, monkeypatch):
+    monkeypatch.setattr('migration_service.services.metadata_extractor.settings.mongo_sample_timeout', 0.05)
+    collection = extractor._database()['slow']
+    monkeypatch.setattr(type(collection), 'aggregate', lambda *args, **kwargs: _SlowCursor([{'qty': 1}]))
+
+    assert asyncio.run(extractor._sample_field_types('slow')) == {'qty': 'int'}
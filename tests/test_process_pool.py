@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+import pytest
+
+from migration_service.memory_graph import MemoryConnection
+from migration_service.schemas.fields import FieldToCreate
+from migration_service.schemas.migrations import ApplySchema, MigrationPattern
+from migration_service.schemas.tables import HubToCreate, SatToCreate, LinkToCreate, OneWayLink, TableToAlter
+from migration_service.services.migration import _compile_schema_off_loop, _iter_built_statements
+from migration_service.settings import settings
+from migration_service.utils.process_pool_utils import get_process_pool, shutdown_process_pool
+
+
+@pytest.fixture
+def cpu_settings(monkeypatch):
+    # spawned workers read their settings from the environment
+    monkeypatch.setenv('DWH_GRAPH_DB_MIGRATER_GRAPH_BACKEND', 'memory')
+    monkeypatch.setattr(settings, 'graph_backend', 'memory')
+    monkeypatch.setattr(settings, 'cpu_chunk_statements', 2)
+    monkeypatch.setattr(settings, 'cpu_chunk_tables', 3)
+    yield monkeypatch
+    shutdown_process_pool()
+
+
+def _apply_schema() -> ApplySchema:
+    return ApplySchema(
+        name='dv_raw',
+        hubs_to_create=[
+            HubToCreate(
+                name=f'hub_{ndx}', db='shop', pk='hash_key',
+                fields=[FieldToCreate(name='hash_key', db_type='text'), FieldToCreate(name='id', db_type='int4')]
+            )
+            for ndx in range(60)
+        ],
+        sats_to_create=[
+            SatToCreate(
+                name=f'hub_{ndx}_sat', db='shop', link=OneWayLink(fk=f'hub_{ndx}_hash_fkey'),
+                fields=[FieldToCreate(name=f'hub_{ndx}_hash_fkey', db_type='text')]
+            )
+            for ndx in range(0, 60, 3)
+        ],
+        links_to_create=[
+            LinkToCreate(
+                name=f'hub_{ndx}_hub_{ndx + 1}', db='shop',
+                fields=[
+                    FieldToCreate(name=f'hub_{ndx}_hash_fkey', db_type='text'),
+                    FieldToCreate(name=f'hub_{ndx + 1}_hash_fkey', db_type='text')
+                ]
+            )
+            for ndx in range(0, 58, 4)
+        ],
+        hubs_to_alter=[
+            TableToAlter(name=f'hub_{ndx}', fields_to_create=[FieldToCreate(name='name', db_type='text')])
+            for ndx in range(10)
+        ],
+        tables_to_delete=[f'old_{ndx}' for ndx in range(70)]
+    )
+
+
+def _built_statements() -> list[tuple[str, int, str]]:
+    statements = asyncio.run(_compile_schema_off_loop(_apply_schema(), MigrationPattern()))
+    return [
+        (statement.template_name, statement.batch_index, query)
+        for statement, query in _iter_built_statements(statements, MemoryConnection())
+    ]
+
+
+def test_pooled_and_unpooled_statements_are_identical(cpu_settings):
+    cpu_settings.setattr(settings, 'cpu_workers', 0)
+    unpooled = _built_statements()
+
+    cpu_settings.setattr(settings, 'cpu_workers', 1)
+    pooled = _built_statements()
+
+    assert get_process_pool() is not None
+    assert len(unpooled) > 2 * settings.cpu_chunk_statements
+    assert pooled == unpooled
+
+
+def test_pool_is_started_once(cpu_settings):
+    cpu_settings.setattr(settings, 'cpu_workers', 1)
+    process_pools = []
+    barrier = threading.Barrier(8)
+
+    def start_pool():
+        barrier.wait()
+        process_pools.append(get_process_pool())
+
+    threads = [threading.Thread(target=start_pool) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(process_pools) == 8
+    assert len(set(map(id, process_pools))) == 1
@@ -0,0 +1,82 @@
+import psycopg
+import pytest
+
+from psycopg import pq
+
+from migration_service.services.metadata_extractor import PostgresExtractor
+from migration_service.settings import SourceFilter
+
+
+@pytest.fixture
+def connection():
+    # identifiers are quoted by libpq, quoting needs no server
+    connection = psycopg.Connection(pq.PGconn.connect_start(b''))
+    yield connection
+    connection.pgconn.finish()
+
+
+@pytest.mark.parametrize(
+    'pattern, table, matches',
+    [
+        ('customer_hub', 'customer_hub', True),
+        ('customer', 'customer_hub', False),
+        ('%hub', 'customer_hub', True),
+        ('%hub', 'hub_customer', False),
+        ('%_hub', 'xhub', True),
+        ('%_hub', 'hub', False),
+        ('customer_hu_', 'customer_hub', True),
+        ('customer_hu_', 'customer_hubs', False),
+        ('%\\_hub', 'customer_hub', True),
+        ('%\\_hub', 'customerxhub', False),
+        ('100\\%', '100%', True),
+        ('100\\%', '1000', False),
+        ('a\\\\b', 'a\\b', True),
+        ('a.b', 'axb', False),
+        ('a.b', 'a.b', True),
+        ('Customer', 'customer', False),
+        ('~hub', 'customer_hub_v2', True),
+        ('~^hub', 'customer_hub', False),
+        ('~_v[0-9]+$', 'customer_hub_v2', True)
+    ]
+)
+def test_table_patterns(pattern, table, matches):
+    assert SourceFilter(include_tables=[pattern]).matches('dv_raw', table) is matches
+
+
+def test_excludes_take_precedence_over_includes():
+    source_filter = SourceFilter(
+        include_schemas=['dv_%'], exclude_schemas=['dv_tmp'], include_tables=['%hub'], exclude_tables=['~^tmp_']
+    )
+
+    assert source_filter.matches('dv_raw', 'customer_hub')
+    assert not source_filter.matches('dv_raw', 'tmp_customer_hub')
+    assert not source_filter.matches('dv_tmp', 'customer_hub')
+    assert not source_filter.matches('raw', 'customer_hub')
+
+
+def test_empty_patterns():
+    assert SourceFilter().matches('dv_raw', 'anything')
+    assert not SourceFilter().matches('public', 'anything')
+    assert SourceFilter(include_schemas=[]).matches('public', 'anything')
+
+
+def test_source_filter_sql(connection):
+    extractor = PostgresExtractor(
+        'postgresql://localhost:5432/shop',
+        SourceFilter(
+            include_schemas=['dv_%'], exclude_schemas=['dv_tmp'],
+            include_tables=['%\\_hub', '~_v[0-9]+$'], exclude_tables=['~^tmp_']
+        )
+    )
+
+    assert extractor._source_filter_sql().as_string(connection) == (
+        '("table_schema" like any(\'{dv_%}\')) and not ("table_schema" like any(\'{dv_tmp}\')) '
+        'and ("table_name" like any( E\'{"%\\\\\\\\_hub"}\') or "table_name" ~ any(\'{_v[0-9]+$}\')) '
+        'and not ("table_name" ~ any(\'{^tmp_}\'))'
+    )
+
+
+def test_source_filter_sql_without_patterns(connection):
+    extractor = PostgresExtractor('postgresql://localhost:5432/shop', SourceFilter(include_schemas=[]))
+
+    assert extractor._source_filter_sql().as_string(connection) == 'true'